@@ -0,0 +1,175 @@
+"""
+Бенчмарк индексов: планы EXPLAIN QUERY PLAN и время горячих запросов до и после
+миграции 0011_association_keys на сгенерированной SQLite-базе (по умолчанию 1M фрагментов)
+
+    python benchmark_indexes.py --fragments 1000000 --db /tmp/archive_bench.db
+"""
+import argparse
+import importlib
+import random
+import sqlite3
+import statistics
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import create_engine
+
+from models import Base
+
+association_keys = importlib.import_module("migrations.0011_association_keys")
+ASSOCIATIONS, INDEXES = association_keys.ASSOCIATIONS, association_keys.INDEXES
+
+# Запросы в том виде, в каком их строят роутеры (параметры подставляются при запуске)
+QUERIES = {
+    "videos by category (GET /videos/)": (
+        "SELECT id FROM videos WHERE category = :category "
+        "ORDER BY created_at DESC, id DESC LIMIT 101"
+    ),
+    "videos by category and subcategory": (
+        "SELECT id FROM videos WHERE category = :category AND subcategory = :subcategory "
+        "ORDER BY created_at DESC, id DESC LIMIT 101"
+    ),
+    "video search by tag (POST /videos/search)": (
+        "SELECT id FROM videos WHERE EXISTS (SELECT 1 FROM video_tags JOIN tags ON tags.id = video_tags.tag_id "
+        "WHERE video_tags.video_id = videos.id AND tags.name IN (:tag)) "
+        "ORDER BY created_at DESC, id DESC LIMIT 101"
+    ),
+    "tags of a page of fragments (selectinload)": (
+        "SELECT fragment_tags.fragment_id, tags.id FROM fragment_tags JOIN tags ON tags.id = fragment_tags.tag_id "
+        "WHERE fragment_tags.fragment_id IN (:f1, :f2, :f3, :f4, :f5)"
+    ),
+    "facet counts for matched videos (POST /videos/facets)": (
+        "SELECT tags.id, count(video_tags.video_id) AS n FROM tags "
+        "JOIN video_tags ON video_tags.tag_id = tags.id "
+        "WHERE video_tags.video_id IN (SELECT id FROM videos WHERE category = :category) "
+        "GROUP BY tags.id ORDER BY n DESC LIMIT 50"
+    ),
+    "fragments with a tag (counter recount, tag delete)": (
+        "SELECT count(*) FROM fragment_tags WHERE tag_id = :tag_id"
+    ),
+    "fragments of a video (GET /videos/{id}/fragments/)": (
+        "SELECT id FROM fragments WHERE video_id = :video_id ORDER BY created_at, id LIMIT 101"
+    ),
+    "expired captchas (cleanup in auth)": (
+        "SELECT count(*) FROM captcha_sessions WHERE created_at < :cutoff"
+    ),
+}
+
+
+def seed(path: Path, videos: int, fragments: int, tags: int, captchas: int):
+    """Схема как до миграции: без ключей таблиц связей и без новых индексов"""
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    engine.dispose()
+
+    conn = sqlite3.connect(str(path))
+    for index_name, _, _ in INDEXES:
+        conn.execute(f"DROP INDEX IF EXISTS {index_name}")
+    for table, (owner_column, _) in ASSOCIATIONS.items():
+        conn.execute(f"DROP TABLE {table}")
+        conn.execute(f"CREATE TABLE {table} ({owner_column} INTEGER, tag_id INTEGER)")
+
+    rng = random.Random(42)
+    start = datetime(2020, 1, 1)
+    categories = [f"category {i}" for i in range(20)]
+    subcategories = [f"subcategory {i}" for i in range(10)]
+
+    def timestamp(i: int, total: int) -> str:
+        return (start + timedelta(seconds=i * 86400 * 1000 // total)).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+    conn.executemany(
+        "INSERT INTO tags (id, name, video_count, fragment_count) VALUES (?, ?, 0, 0)",
+        ((i, f"tag{i}") for i in range(1, tags + 1))
+    )
+    conn.executemany(
+        "INSERT INTO videos (id, filename, title, category, subcategory, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+        (
+            (i, f"{i}.mp4", f"Video {i}", rng.choice(categories), rng.choice(subcategories), timestamp(i, videos))
+            for i in range(1, videos + 1)
+        )
+    )
+    conn.executemany(
+        "INSERT INTO fragments (id, video_id, name, start_time, end_time, is_virtual, created_at) "
+        "VALUES (?, ?, ?, 0, 1, 1, ?)",
+        ((i, rng.randint(1, videos), f"Fragment {i}", timestamp(i, fragments)) for i in range(1, fragments + 1))
+    )
+    # Популярность тегов неравномерная: первые теги встречаются чаще
+    conn.executemany(
+        "INSERT INTO video_tags VALUES (?, ?)",
+        ((i, int(rng.paretovariate(1.2)) % tags + 1) for i in range(1, videos + 1) for _ in range(3))
+    )
+    conn.executemany(
+        "INSERT INTO fragment_tags VALUES (?, ?)",
+        ((i, int(rng.paretovariate(1.2)) % tags + 1) for i in range(1, fragments + 1) for _ in range(2))
+    )
+    conn.executemany(
+        "INSERT INTO captcha_sessions (session_id, question, answer, created_at, used) VALUES (?, '1+1', '2', ?, 0)",
+        ((f"s{i}", timestamp(i, captchas)) for i in range(captchas))
+    )
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+
+
+def run_queries(path: Path, params: dict, repeat: int) -> dict:
+    conn = sqlite3.connect(str(path))
+    report = {}
+    for name, sql in QUERIES.items():
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            conn.execute(sql, params).fetchall()
+            timings.append((time.perf_counter() - started) * 1000)
+        report[name] = (plan, statistics.median(timings))
+    conn.close()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="archive_bench.db")
+    parser.add_argument("--fragments", type=int, default=1_000_000)
+    parser.add_argument("--videos", type=int, default=50_000)
+    parser.add_argument("--tags", type=int, default=5_000)
+    parser.add_argument("--captchas", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    path = Path(args.db)
+    path.unlink(missing_ok=True)
+    started = time.perf_counter()
+    seed(path, args.videos, args.fragments, args.tags, args.captchas)
+    print(f"Seeded {args.fragments} fragments and {args.videos} videos in {time.perf_counter() - started:.1f}s")
+
+    params = {
+        "category": "category 3",
+        "subcategory": "subcategory 7",
+        "tag": "tag2",
+        "tag_id": 2,
+        "video_id": args.videos // 2,
+        "cutoff": "2020-03-01 00:00:00.000000",
+        **{f"f{i}": args.fragments // 2 + i for i in range(1, 6)},
+    }
+
+    before = run_queries(path, params, args.repeat)
+
+    engine = create_engine(f"sqlite:///{path}")
+    started = time.perf_counter()
+    with engine.begin() as connection:
+        association_keys.upgrade(connection)
+    engine.dispose()
+    print(f"Migration took {time.perf_counter() - started:.1f}s\n")
+
+    after = run_queries(path, params, args.repeat)
+
+    for name in QUERIES:
+        (plan_before, ms_before), (plan_after, ms_after) = before[name], after[name]
+        print(f"== {name}: {ms_before:.2f} ms -> {ms_after:.2f} ms")
+        print("   before: " + " | ".join(plan_before))
+        print("   after:  " + " | ".join(plan_after))
+
+
+if __name__ == "__main__":
+    main()
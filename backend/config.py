@@ -3,15 +3,85 @@ from typing import Optional
 
 class Settings(BaseSettings):
     DATABASE_URL: str = "sqlite+aiosqlite:///./archive_new.db"
+    # Пул соединений PostgreSQL (для SQLite не используется)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 30 * 60
+    DB_POOL_PRE_PING: bool = True
+    # Кэш подготовленных выражений asyncpg на соединение; 0 - для pgbouncer в режиме transaction
+    DB_STATEMENT_CACHE_SIZE: int = 100
+    # Настройки соединений SQLite (применяются при подключении, для других СУБД игнорируются)
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    SQLITE_CACHE_SIZE_KB: int = 64 * 1024
+    SQLITE_TEMP_STORE: str = "MEMORY"
+    # Пишущие транзакции процесса выполняются по одной, без конкуренции за блокировку файла
+    SQLITE_SERIALIZE_WRITES: bool = True
+    # Миграции схемы (python migrate.py); при старте версия только проверяется
+    MIGRATE_ON_STARTUP: bool = False
+    # Миграции данных идут пачками с паузой, чтобы не держать блокировку записи
+    MIGRATION_BATCH_SIZE: int = 5000
+    MIGRATION_BATCH_PAUSE: float = 0.05
     SECRET_KEY: str = "your-secret-key-change-in-production"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    # Кэш пользователей по id из токена (на процесс): запросы с токеном не ходят в базу.
+    # Изменения из других процессов видны не позже чем через TTL
+    USER_CACHE_TTL_SECONDS: float = 60.0
+    USER_CACHE_SIZE: int = 10000
     
     UPLOAD_DIR: str = "./static/uploads"
     FRAGMENTS_DIR: str = "./static/uploads/fragments"
+    HLS_DIR: str = "./static/uploads/hls"
+    KEYFRAMES_DIR: str = "./static/uploads/keyframes"
+    # Исходные видео по содержимому: blobs/<2 символа sha256>/<sha256>.<расширение>
+    BLOBS_DIR: str = "./static/uploads/blobs"
+    # Новые фрагменты хранятся только как границы во времени, файл вырезается по запросу
+    FRAGMENTS_VIRTUAL: bool = True
+    FRAGMENT_CACHE_DIR: str = "./static/uploads/fragment_cache"
+    FRAGMENT_CACHE_MAX_SIZE: int = 5 * 1024 * 1024 * 1024
+    # Файлы, к которым обращались позже этого, не вытесняются: их могут как раз отдавать
+    FRAGMENT_CACHE_EVICT_GRACE_SECONDS: float = 60.0
+    # Склейки фрагментов, имя файла - хэш списка фрагментов
+    REELS_DIR: str = "./static/uploads/reels"
+    REEL_MAX_FRAGMENTS: int = 200
+    # Фрагментов в одном POST /videos/{id}/fragments/batch
+    FRAGMENT_BATCH_MAX: int = 100
     MAX_UPLOAD_SIZE: int = 500 * 1024 * 1024
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024
+    UPLOAD_SESSION_TTL_HOURS: int = 24
+    
+    # Индекс автодополнения тегов перечитывает имена и популярность из БД не чаще этого интервала
+    TAG_INDEX_REFRESH_SECONDS: float = 60.0
+    
+    MEDIA_CHUNK_SIZE: int = 256 * 1024
+    # Внутренний location nginx (например "/protected-media"), через который
+    # отдаются файлы из UPLOAD_DIR; None - файлы отдает сам бэкенд
+    MEDIA_ACCEL_REDIRECT_PREFIX: Optional[str] = None
     
     FFmpeg_PATH: Optional[str] = None
+    # Лимиты параллельных процессов FFmpeg (по умолчанию считаются от os.cpu_count())
+    FFMPEG_LIGHT_CONCURRENCY: Optional[int] = None
+    FFMPEG_HEAVY_CONCURRENCY: Optional[int] = None
+    FFMPEG_TRANSCODE_TIMEOUT: float = 6 * 60 * 60
+    
+    # Упаковка в HLS после загрузки: варианты "высота:битрейт" через запятую
+    HLS_ENABLED: bool = False
+    HLS_RENDITIONS: str = "1080:5000k,720:2800k,480:1200k"
+    HLS_SEGMENT_SECONDS: int = 6
+    
+    JOB_WORKERS: int = 2
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_RETRY_DELAY: float = 5.0
+    JOB_POLL_INTERVAL: float = 1.0
+    # Процесс продлевает аренду своих задач каждые JOB_HEARTBEAT_INTERVAL секунд;
+    # задачу без продления дольше JOB_LEASE_SECONDS считаем брошенной и возвращаем в очередь
+    JOB_HEARTBEAT_INTERVAL: float = 15.0
+    JOB_LEASE_SECONDS: float = 60.0
+    JOB_PROGRESS_STREAM_INTERVAL: float = 1.0
     
     class Config:
         env_file = ".env"
@@ -1,15 +1,174 @@
+import asyncio
+import logging
+
+from sqlalchemy import event
+from sqlalchemy.sql.elements import TextClause
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from config import settings
 
+logger = logging.getLogger(__name__)
+
+def _engine_options() -> dict:
+    """Пул для серверных СУБД; SQLite работает со своим пулом по умолчанию"""
+    url = make_url(settings.DATABASE_URL)
+    if url.get_backend_name() == "sqlite":
+        return {}
+    options = {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+    if url.get_driver_name() == "asyncpg":
+        # Первый - кэш SQLAlchemy поверх asyncpg, второй - собственный кэш asyncpg
+        options["connect_args"] = {
+            "prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+            "statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+        }
+    return options
+
 engine = create_async_engine(
     settings.DATABASE_URL,
-    echo=False
+    echo=False,
+    **_engine_options()
 )
 
+IS_SQLITE = engine.dialect.name == "sqlite"
+
+@event.listens_for(engine.sync_engine, "connect")
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL: читатели не ждут писателя, а commit с synchronous=NORMAL не делает fsync"""
+    if not IS_SQLITE:
+        return
+    cursor = dbapi_connection.cursor()
+    for pragma in (
+        f"PRAGMA journal_mode = {settings.SQLITE_JOURNAL_MODE}",
+        f"PRAGMA synchronous = {settings.SQLITE_SYNCHRONOUS}",
+        f"PRAGMA busy_timeout = {settings.SQLITE_BUSY_TIMEOUT_MS}",
+        f"PRAGMA mmap_size = {settings.SQLITE_MMAP_SIZE}",
+        # Отрицательное значение - размер кэша в КиБ, а не в страницах
+        f"PRAGMA cache_size = -{settings.SQLITE_CACHE_SIZE_KB}",
+        f"PRAGMA temp_store = {settings.SQLITE_TEMP_STORE}",
+    ):
+        cursor.execute(pragma)
+    cursor.close()
+
+# Очередь писателей процесса: asyncio.Lock отдает блокировку в порядке ожидания
+_write_lock = asyncio.Lock()
+# Задача, чья сессия сейчас пишет: вторая пишущая сессия в той же задаче ждала бы саму себя
+_write_lock_owner = None
+
+class WriteQueueTimeout(TimeoutError):
+    """Очередь писателей не подошла за SQLITE_BUSY_TIMEOUT_MS"""
+
+class SerializedWriteSession(AsyncSession):
+    """
+    Сессия встает в очередь писателей перед первой записью транзакции (flush, DML,
+    autoflush) и выходит из нее на commit/rollback/close. Чтения в очередь не встают:
+    драйвер открывает транзакцию только перед первой записью, а в WAL чтения
+    не блокируются писателем
+    """
+    _holds_write_lock = False
+
+    def _has_pending_writes(self) -> bool:
+        sync_session = self.sync_session
+        return bool(sync_session.new or sync_session.dirty or sync_session.deleted)
+
+    async def _acquire_write_lock(self):
+        global _write_lock_owner
+        if self._holds_write_lock:
+            return
+        task = asyncio.current_task()
+        if _write_lock.locked() and _write_lock_owner is task:
+            raise RuntimeError(
+                "Nested writing session: this task already writes through another session, commit it first"
+            )
+        try:
+            await asyncio.wait_for(_write_lock.acquire(), settings.SQLITE_BUSY_TIMEOUT_MS / 1000)
+        except asyncio.TimeoutError:
+            # Писать без очереди нельзя: сериализация транзакций пропала бы как раз под нагрузкой
+            raise WriteQueueTimeout(
+                f"Timed out after {settings.SQLITE_BUSY_TIMEOUT_MS} ms waiting for the write queue"
+            )
+        self._holds_write_lock = True
+        _write_lock_owner = task
+
+    def _release_write_lock(self):
+        global _write_lock_owner
+        if self._holds_write_lock:
+            self._holds_write_lock = False
+            _write_lock_owner = None
+            _write_lock.release()
+
+    @staticmethod
+    def _is_write(statement) -> bool:
+        if isinstance(statement, TextClause):
+            # У text() нет is_dml: смотрим на первое слово
+            words = statement.text.split(None, 1)
+            return bool(words) and words[0].upper() in ("INSERT", "UPDATE", "DELETE", "REPLACE")
+        return getattr(statement, "is_dml", False)
+
+    async def _before_statement(self, statement=None):
+        if self._is_write(statement) or (
+            self.sync_session.autoflush and self._has_pending_writes()
+        ):
+            await self._acquire_write_lock()
+
+    async def execute(self, statement, *args, **kwargs):
+        await self._before_statement(statement)
+        return await super().execute(statement, *args, **kwargs)
+
+    async def scalar(self, statement, *args, **kwargs):
+        await self._before_statement(statement)
+        return await super().scalar(statement, *args, **kwargs)
+
+    async def stream(self, statement, *args, **kwargs):
+        await self._before_statement(statement)
+        return await super().stream(statement, *args, **kwargs)
+
+    async def get(self, *args, **kwargs):
+        await self._before_statement()
+        return await super().get(*args, **kwargs)
+
+    async def refresh(self, *args, **kwargs):
+        await self._before_statement()
+        return await super().refresh(*args, **kwargs)
+
+    async def merge(self, *args, **kwargs):
+        await self._before_statement()
+        return await super().merge(*args, **kwargs)
+
+    async def flush(self, *args, **kwargs):
+        if self._has_pending_writes():
+            await self._acquire_write_lock()
+        return await super().flush(*args, **kwargs)
+
+    async def commit(self):
+        if self._has_pending_writes():
+            await self._acquire_write_lock()
+        try:
+            return await super().commit()
+        finally:
+            self._release_write_lock()
+
+    async def rollback(self):
+        try:
+            return await super().rollback()
+        finally:
+            self._release_write_lock()
+
+    async def close(self):
+        try:
+            return await super().close()
+        finally:
+            self._release_write_lock()
+
 AsyncSessionLocal = sessionmaker(
     engine,
-    class_=AsyncSession,
+    class_=SerializedWriteSession if IS_SQLITE and settings.SQLITE_SERIALIZE_WRITES else AsyncSession,
     expire_on_commit=False
 )
 
@@ -21,6 +180,23 @@ async def get_db():
             await session.close()
 
 async def init_db():
-    from models import Base
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    """Схему создают миграции (python migrate.py); при старте сверяется только версия"""
+    from migrations import current_version, latest_version, upgrade
+    from services.search_index import detect_search_index
+
+    async with engine.connect() as conn:
+        version = await conn.run_sync(current_version)
+    latest = latest_version()
+
+    if version < latest:
+        if not settings.MIGRATE_ON_STARTUP:
+            raise RuntimeError(
+                f"Database schema is at version {version}, the application needs {latest}: "
+                "run `python migrate.py` (or set MIGRATE_ON_STARTUP=true)"
+            )
+        await upgrade(engine)
+    elif version > latest:
+        logger.warning(f"Database schema version {version} is newer than this application ({latest})")
+
+    async with engine.connect() as conn:
+        await conn.run_sync(detect_search_index)
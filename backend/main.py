@@ -1,11 +1,16 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
 
 from config import settings
-from database import init_db
-from routers import videos, fragments, tags, auth, yandex
+from database import init_db, WriteQueueTimeout
+from routers import videos, fragments, tags, auth, yandex, uploads, jobs, media, reels
+from services.job_queue import job_queue
+from services.pagination import NEXT_CURSOR_HEADER
+from services.upload_storage import UploadSizeLimitMiddleware
+import services.media_jobs  # Регистрирует обработчики задач
 
 app = FastAPI(
     title="АРХИВ - Video Archive Service",
@@ -13,28 +18,54 @@ app = FastAPI(
     version="2.1.0"
 )
 
+# Добавлен раньше CORS, чтобы ответ 413 тоже получил CORS-заголовки.
+# Возобновляемые загрузки (/api/uploads) проверяют размер каждой части сами
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    paths=["/api/videos/upload"],
+    max_size=settings.MAX_UPLOAD_SIZE,
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
+@app.exception_handler(WriteQueueTimeout)
+async def write_queue_timeout_handler(request: Request, exc: WriteQueueTimeout):
+    # Запись не выполнена, клиент может повторить запрос
+    return JSONResponse(status_code=503, content={"detail": "Database is busy, try again"}, headers={"Retry-After": "1"})
+
 @app.on_event("startup")
 async def startup_event():
     await init_db()
     
     Path(settings.UPLOAD_DIR).mkdir(parents=True, exist_ok=True)
     Path(settings.FRAGMENTS_DIR).mkdir(parents=True, exist_ok=True)
+    Path(settings.HLS_DIR).mkdir(parents=True, exist_ok=True)
     Path(f"{settings.UPLOAD_DIR}/thumbnails").mkdir(parents=True, exist_ok=True)
+    Path(f"{settings.UPLOAD_DIR}/partial").mkdir(parents=True, exist_ok=True)
+    
+    await job_queue.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await job_queue.stop()
 
 app.include_router(auth.router, prefix="/api")
 app.include_router(yandex.router, prefix="/api")
 app.include_router(videos.router, prefix="/api")
+app.include_router(uploads.router, prefix="/api")
 app.include_router(fragments.router, prefix="/api")
 app.include_router(fragments.global_router, prefix="/api")
 app.include_router(tags.router, prefix="/api")
+app.include_router(jobs.router, prefix="/api")
+app.include_router(media.router, prefix="/api")
+app.include_router(reels.router, prefix="/api")
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 app.mount("/fragments", StaticFiles(directory="static/uploads/fragments"), name="fragments")
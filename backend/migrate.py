@@ -1,43 +1,55 @@
 """
-Миграция базы данных: добавление полей video_filepath и video_file_size в таблицу fragments
+Миграции схемы базы данных (DATABASE_URL, SQLite или PostgreSQL)
+
+    python migrate.py                   # применить все новые миграции
+    python migrate.py upgrade 5         # применить миграции до версии 5 включительно
+    python migrate.py status            # текущая версия и список миграций
 """
-import sqlite3
-from pathlib import Path
-
-DB_PATH = Path(__file__).parent / "archive_new.db"
-
-def migrate():
-    """Добавляет новые колонки в таблицу fragments"""
-    conn = sqlite3.connect(str(DB_PATH))
-    cursor = conn.cursor()
-    
-    # Проверяем существование колонок
-    cursor.execute("PRAGMA table_info(fragments)")
-    columns = cursor.fetchall()
-    column_names = [col[1] for col in columns]
-    
-    print(f"Current columns: {column_names}")
-    
-    # Добавляем video_filepath если не существует
-    if 'video_filepath' not in column_names:
-        print("Adding video_filepath column...")
-        cursor.execute("ALTER TABLE fragments ADD COLUMN video_filepath TEXT")
-        conn.commit()
-        print("OK: video_filepath column added")
-    else:
-        print("video_filepath column already exists")
-    
-    # Добавляем video_file_size если не существует
-    if 'video_file_size' not in column_names:
-        print("Adding video_file_size column...")
-        cursor.execute("ALTER TABLE fragments ADD COLUMN video_file_size INTEGER")
-        conn.commit()
-        print("OK: video_file_size column added")
-    else:
-        print("video_file_size column already exists")
-    
-    conn.close()
-    print("\nMigration completed!")
+import argparse
+import asyncio
+import logging
+
+from database import engine
+from migrations import discover, migration_state, upgrade
+
+
+async def show_status():
+    async with engine.connect() as conn:
+        state = await conn.run_sync(migration_state)
+    for migration in discover():
+        applied_at, cursor = state.get(migration.version, (None, None))
+        if applied_at is not None:
+            status = f"applied {applied_at}"
+        elif cursor is not None:
+            status = f"in progress, at id {cursor}"
+        else:
+            status = "pending"
+        print(f"{migration.version:04d} {migration.name}: {status}")
+
+
+async def run(args):
+    try:
+        if args.command == "status":
+            await show_status()
+            return
+        applied = await upgrade(engine, args.version)
+        if applied:
+            print(f"Applied {len(applied)} migration(s): {', '.join(f'{m.version:04d}' for m in applied)}")
+        else:
+            print("Database is up to date")
+    finally:
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", nargs="?", choices=["upgrade", "status"], default="upgrade")
+    parser.add_argument("version", nargs="?", type=int, help="последняя применяемая версия")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    asyncio.run(run(args))
+
 
 if __name__ == "__main__":
-    migrate()
+    main()
@@ -0,0 +1,8 @@
+"""
+Таблицы, которых еще нет в базе, в текущем виде моделей (на новой базе - вся схема)
+"""
+from models import Base
+
+
+def upgrade(connection):
+    Base.metadata.create_all(connection)
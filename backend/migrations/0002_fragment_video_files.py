@@ -0,0 +1,11 @@
+"""
+Путь и размер видеофайла фрагмента (бывший migrate.py)
+"""
+from migrations import add_columns
+
+
+def upgrade(connection):
+    add_columns(connection, "fragments", [
+        ("video_filepath", "TEXT"),
+        ("video_file_size", "INTEGER")
+    ])
@@ -0,0 +1,44 @@
+"""
+Пользователи, капчи и владелец видео (бывший migrate_auth.py)
+"""
+import logging
+from datetime import datetime
+
+from sqlalchemy import text
+
+from migrations import add_columns, create_indexes
+from models import CaptchaSession, User
+
+logger = logging.getLogger(__name__)
+
+
+def upgrade(connection):
+    User.__table__.create(connection, checkfirst=True)
+    CaptchaSession.__table__.create(connection, checkfirst=True)
+    create_indexes(connection, [
+        ("idx_users_username", "users", "username"),
+        ("idx_users_email", "users", "email"),
+        ("idx_captcha_session_id", "captcha_sessions", "session_id"),
+    ])
+    
+    # Nullable, чтобы не сломать существующие записи
+    add_columns(connection, "videos", [("owner_id", "INTEGER REFERENCES users(id)")])
+    
+    # Пользователь admin по умолчанию
+    # ВНИМАНИЕ: Перед продакшеном измените пароль!
+    # Хеш пароля - ЗАМЕНИТЕ НА СВОЙ!
+    admin = connection.execute(text("SELECT id FROM users WHERE username = 'admin'")).first()
+    if not admin:
+        connection.execute(
+            text(
+                "INSERT INTO users (username, hashed_password, is_active, is_superuser, created_at) "
+                "VALUES ('admin', :password, :active, :superuser, :created_at)"
+            ),
+            {
+                "password": "$2b$12$YourHashedPasswordHere",
+                "active": True,
+                "superuser": True,
+                "created_at": datetime.utcnow()
+            }
+        )
+        logger.warning("Created default user admin: change its password before production!")
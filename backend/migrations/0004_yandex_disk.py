@@ -0,0 +1,13 @@
+"""
+Поля Яндекс.Диска у пользователей (бывший migrate_yandex.py)
+"""
+from migrations import add_columns
+
+
+def upgrade(connection):
+    add_columns(connection, "users", [
+        ("yandex_disk_token", "TEXT"),
+        ("yandex_disk_refresh_token", "TEXT"),
+        ("yandex_disk_token_expires", "TIMESTAMP"),
+        ("yandex_disk_folder", "TEXT DEFAULT '/archive_videos'")
+    ])
@@ -0,0 +1,40 @@
+"""
+Нормализация путей видеофайлов фрагментов (бывшие fix_paths.py, migrate_files.py
+и fix_paths2.py): абсолютные и Windows-пути -> fragments/<имя>, без префикса uploads/.
+Миграция данных, идет пачками по id
+"""
+from pathlib import PureWindowsPath
+from typing import Optional
+
+from sqlalchemy import text
+
+
+def normalize_path(path: str) -> str:
+    if ".." in path or "\\" in path:
+        # PureWindowsPath понимает оба разделителя
+        return f"fragments/{PureWindowsPath(path).name}"
+    if path.startswith("uploads/"):
+        return path[len("uploads/"):]
+    return path
+
+
+def upgrade_batch(connection, after_id: int, batch_size: int) -> Optional[int]:
+    rows = connection.execute(
+        text(
+            "SELECT id, video_filepath FROM fragments "
+            "WHERE id > :after_id AND video_filepath IS NOT NULL "
+            "ORDER BY id LIMIT :limit"
+        ),
+        {"after_id": after_id, "limit": batch_size}
+    ).all()
+    if not rows:
+        return None
+
+    changed = [
+        {"id": fragment_id, "path": normalize_path(path)}
+        for fragment_id, path in rows
+        if normalize_path(path) != path
+    ]
+    if changed:
+        connection.execute(text("UPDATE fragments SET video_filepath = :path WHERE id = :id"), changed)
+    return rows[-1][0]
@@ -0,0 +1,11 @@
+"""
+Поля HLS-упаковки видео (бывший migrate_hls.py)
+"""
+from migrations import add_columns
+
+
+def upgrade(connection):
+    add_columns(connection, "videos", [
+        ("hls_path", "TEXT"),
+        ("hls_status", "TEXT")
+    ])
@@ -0,0 +1,9 @@
+"""
+Признак виртуального фрагмента (бывший migrate_virtual_fragments.py);
+существующие фрагменты остаются с файлами
+"""
+from migrations import add_columns
+
+
+def upgrade(connection):
+    add_columns(connection, "fragments", [("is_virtual", "BOOLEAN DEFAULT FALSE")])
@@ -0,0 +1,12 @@
+"""
+Хранилище исходных видео по содержимому (бывший migrate_blobs.py).
+Уже загруженные видео остаются со своими файлами (content_hash = NULL)
+"""
+from migrations import add_columns, create_indexes
+from models import MediaBlob
+
+
+def upgrade(connection):
+    add_columns(connection, "videos", [("content_hash", "TEXT")])
+    create_indexes(connection, [("ix_videos_content_hash", "videos", "content_hash")])
+    MediaBlob.__table__.create(connection, checkfirst=True)
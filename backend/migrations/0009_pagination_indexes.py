@@ -0,0 +1,12 @@
+"""
+Составные индексы (created_at, id) для keyset-пагинации (бывший migrate_pagination_indexes.py)
+"""
+from migrations import create_indexes
+
+
+def upgrade(connection):
+    create_indexes(connection, [
+        ("ix_videos_created_at_id", "videos", "created_at, id"),
+        ("ix_fragments_video_id_created_at_id", "fragments", "video_id, created_at, id"),
+        ("ix_fragments_created_at_id", "fragments", "created_at, id"),
+    ])
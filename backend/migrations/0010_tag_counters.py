@@ -0,0 +1,12 @@
+"""
+Счетчики видео и фрагментов у тегов (бывший migrate_tag_counters.py).
+Триггеры и пересчет - в 0012
+"""
+from migrations import add_columns
+
+
+def upgrade(connection):
+    add_columns(connection, "tags", [
+        ("video_count", "INTEGER NOT NULL DEFAULT 0"),
+        ("fragment_count", "INTEGER NOT NULL DEFAULT 0")
+    ])
@@ -0,0 +1,59 @@
+"""
+Первичные ключи таблиц связей и индексы под фильтры списков и поиска (бывший migrate_indexes.py)
+"""
+import logging
+
+from sqlalchemy import inspect, text
+
+from migrations import create_indexes
+
+logger = logging.getLogger(__name__)
+
+# Таблица связей -> (колонка владельца, таблица владельца)
+ASSOCIATIONS = {
+    "video_tags": ("video_id", "videos"),
+    "fragment_tags": ("fragment_id", "fragments"),
+}
+
+INDEXES = [
+    ("ix_video_tags_tag_id_video_id", "video_tags", "tag_id, video_id"),
+    ("ix_fragment_tags_tag_id_fragment_id", "fragment_tags", "tag_id, fragment_id"),
+    ("ix_videos_category_created_at_id", "videos", "category, created_at, id"),
+    ("ix_videos_category_subcategory_created_at_id", "videos", "category, subcategory, created_at, id"),
+    ("ix_captcha_sessions_created_at", "captcha_sessions", "created_at"),
+]
+
+
+def add_association_key(connection, table: str, owner_column: str, owner_table: str):
+    """
+    Пересоздает таблицу связей с первичным ключом (владелец, тег): SQLite не умеет
+    добавлять ключ к существующей таблице. Повторы и связи с NULL отбрасываются
+    """
+    if inspect(connection).get_pk_constraint(table)["constrained_columns"]:
+        return
+
+    before = connection.execute(text(f"SELECT count(*) FROM {table}")).scalar()
+    connection.execute(text(f"""
+        CREATE TABLE {table}_new (
+            {owner_column} INTEGER NOT NULL REFERENCES {owner_table}(id),
+            tag_id INTEGER NOT NULL REFERENCES tags(id),
+            PRIMARY KEY ({owner_column}, tag_id)
+        )
+    """))
+    connection.execute(text(
+        f"INSERT INTO {table}_new ({owner_column}, tag_id) "
+        f"SELECT DISTINCT {owner_column}, tag_id FROM {table} "
+        f"WHERE {owner_column} IS NOT NULL AND tag_id IS NOT NULL"
+    ))
+    after = connection.execute(text(f"SELECT count(*) FROM {table}_new")).scalar()
+    connection.execute(text(f"DROP TABLE {table}"))
+    connection.execute(text(f"ALTER TABLE {table}_new RENAME TO {table}"))
+    logger.info(f"Added primary key to {table}, dropped {before - after} duplicate rows")
+
+
+def upgrade(connection):
+    # Триггеры счетчиков удаляются вместе со старыми таблицами, их ставит 0012
+    for table, (owner_column, owner_table) in ASSOCIATIONS.items():
+        add_association_key(connection, table, owner_column, owner_table)
+    create_indexes(connection, INDEXES)
+    connection.execute(text("ANALYZE"))
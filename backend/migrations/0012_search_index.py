@@ -0,0 +1,11 @@
+"""
+Полнотекстовые индексы (FTS5 или pg_trgm) и триггеры счетчиков тегов с пересчетом.
+Раньше выполнялось при каждом старте приложения
+"""
+from services.search_index import ensure_search_index
+from services.tag_stats import ensure_counters
+
+
+def upgrade(connection):
+    ensure_search_index(connection)
+    ensure_counters(connection)
@@ -0,0 +1,8 @@
+"""
+Версия авторизации пользователя (claim "av" в токене)
+"""
+from migrations import add_columns
+
+
+def upgrade(connection):
+    add_columns(connection, "users", [("auth_version", "INTEGER NOT NULL DEFAULT 0")])
@@ -0,0 +1,11 @@
+"""
+Аренда выполняющихся задач: воркер-владелец и время последнего продления
+"""
+from migrations import add_columns
+
+
+def upgrade(connection):
+    add_columns(connection, "jobs", [
+        ("worker_id", "VARCHAR"),
+        ("heartbeat_at", "TIMESTAMP")
+    ])
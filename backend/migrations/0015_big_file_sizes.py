@@ -0,0 +1,18 @@
+"""
+Размеры файлов видео и фрагментов в BIGINT: integer в PostgreSQL 32-битный,
+файлы от 2 ГиБ в него не помещаются. В SQLite INTEGER уже 64-битный
+"""
+from sqlalchemy import text
+
+COLUMNS = [
+    ("videos", "file_size"),
+    ("fragments", "file_size"),
+    ("fragments", "video_file_size"),
+]
+
+
+def upgrade(connection):
+    if connection.dialect.name != "postgresql":
+        return
+    for table, column in COLUMNS:
+        connection.execute(text(f"ALTER TABLE {table} ALTER COLUMN {column} TYPE BIGINT"))
@@ -0,0 +1,171 @@
+"""
+Версионные миграции схемы. Модули NNNN_имя.py применяются по порядку номеров,
+примененные версии записываются в таблицу schema_migrations.
+
+Модуль миграции определяет одно из двух:
+- upgrade(connection) - изменение схемы, выполняется одной транзакцией;
+- upgrade_batch(connection, after_id, batch_size) -> Optional[int] - миграция данных
+  пачками: каждая пачка - отдельная транзакция, возвращает id последней обработанной
+  строки или None, когда строк не осталось. Позиция сохраняется, прерванная миграция
+  продолжается с места остановки.
+
+Миграции пишутся идемпотентными: старые базы дошли до разных версий схемы
+разными ручными скриптами, а 0001 на новой базе сразу создает все таблицы
+"""
+import asyncio
+import importlib
+import logging
+import pkgutil
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from types import ModuleType
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+_MODULE_NAME = re.compile(r"^(\d{4})_(\w+)$")
+
+_CREATE_VERSIONS_TABLE = (
+    "CREATE TABLE IF NOT EXISTS schema_migrations ("
+    "version INTEGER PRIMARY KEY, "
+    "name VARCHAR NOT NULL, "
+    "applied_at TIMESTAMP, "  # NULL - миграция данных еще идет
+    "batch_cursor INTEGER)"
+)
+
+
+@dataclass
+class Migration:
+    version: int
+    name: str
+    module: ModuleType
+
+    @property
+    def batched(self) -> bool:
+        return hasattr(self.module, "upgrade_batch")
+
+
+def discover() -> List[Migration]:
+    migrations = []
+    for info in pkgutil.iter_modules(__path__):
+        match = _MODULE_NAME.match(info.name)
+        if match:
+            module = importlib.import_module(f"{__name__}.{info.name}")
+            migrations.append(Migration(int(match[1]), match[2], module))
+    migrations.sort(key=lambda migration: migration.version)
+
+    versions = [migration.version for migration in migrations]
+    if len(set(versions)) != len(versions):
+        raise RuntimeError(f"Duplicate migration versions: {versions}")
+    return migrations
+
+
+def latest_version() -> int:
+    migrations = discover()
+    return migrations[-1].version if migrations else 0
+
+
+def current_version(connection) -> int:
+    """Последняя полностью примененная версия; 0 - база без таблицы версий"""
+    if not inspect(connection).has_table("schema_migrations"):
+        return 0
+    return connection.execute(
+        text("SELECT coalesce(max(version), 0) FROM schema_migrations WHERE applied_at IS NOT NULL")
+    ).scalar()
+
+
+def migration_state(connection) -> Dict[int, Tuple[Optional[datetime], Optional[int]]]:
+    """version -> (applied_at, batch_cursor) для записанных версий"""
+    if not inspect(connection).has_table("schema_migrations"):
+        return {}
+    rows = connection.execute(text("SELECT version, applied_at, batch_cursor FROM schema_migrations"))
+    return {version: (applied_at, cursor) for version, applied_at, cursor in rows}
+
+
+async def _record(conn, migration: Migration, applied: bool, batch_cursor: Optional[int] = None):
+    values = {
+        "version": migration.version,
+        "name": migration.name,
+        "applied_at": datetime.utcnow() if applied else None,
+        "batch_cursor": batch_cursor,
+    }
+    updated = await conn.execute(
+        text(
+            "UPDATE schema_migrations SET applied_at = :applied_at, batch_cursor = :batch_cursor "
+            "WHERE version = :version"
+        ),
+        values
+    )
+    if updated.rowcount == 0:
+        await conn.execute(
+            text(
+                "INSERT INTO schema_migrations (version, name, applied_at, batch_cursor) "
+                "VALUES (:version, :name, :applied_at, :batch_cursor)"
+            ),
+            values
+        )
+
+
+async def _run_batched(engine: AsyncEngine, migration: Migration, cursor: Optional[int]):
+    cursor = cursor or 0
+    processed = 0
+    while True:
+        async with engine.begin() as conn:
+            next_cursor = await conn.run_sync(
+                migration.module.upgrade_batch, cursor, settings.MIGRATION_BATCH_SIZE
+            )
+            await _record(conn, migration, applied=next_cursor is None, batch_cursor=next_cursor)
+        if next_cursor is None:
+            return
+        processed += 1
+        cursor = next_cursor
+        if processed % 100 == 0:
+            logger.info(f"Migration {migration.version} {migration.name}: at id {cursor}")
+        # Пауза между пачками: блокировка записи отпускается, запросы приложения проходят
+        await asyncio.sleep(settings.MIGRATION_BATCH_PAUSE)
+
+
+async def upgrade(engine: AsyncEngine, target: Optional[int] = None) -> List[Migration]:
+    """Применяет все непримененные миграции до target включительно; возвращает примененные"""
+    async with engine.begin() as conn:
+        await conn.execute(text(_CREATE_VERSIONS_TABLE))
+        state = await conn.run_sync(migration_state)
+
+    applied = []
+    for migration in discover():
+        if target is not None and migration.version > target:
+            break
+        applied_at, cursor = state.get(migration.version, (None, None))
+        if applied_at is not None:
+            continue
+
+        logger.info(f"Applying migration {migration.version} {migration.name}")
+        if migration.batched:
+            await _run_batched(engine, migration, cursor)
+        else:
+            async with engine.begin() as conn:
+                await conn.run_sync(migration.module.upgrade)
+                await _record(conn, migration, applied=True)
+        applied.append(migration)
+    return applied
+
+
+def add_columns(connection, table: str, columns: Iterable[Tuple[str, str]]):
+    """Добавляет колонки (имя, тип с ограничениями), которых еще нет в таблице"""
+    existing = {column["name"] for column in inspect(connection).get_columns(table)}
+    for name, column_type in columns:
+        if name not in existing:
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}"))
+            logger.info(f"Added column {table}.{name}")
+
+
+def create_indexes(connection, indexes: Iterable[Tuple[str, str, str]]):
+    """Индексы (имя, таблица, колонки через запятую)"""
+    for index_name, table, columns in indexes:
+        connection.execute(text(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table} ({columns})"))
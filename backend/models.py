@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, ForeignKey, Table, Float, Boolean
+from sqlalchemy import create_engine, Column, Integer, BigInteger, String, DateTime, Text, ForeignKey, Table, Float, Boolean, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, sessionmaker
 from datetime import datetime
@@ -17,6 +17,8 @@ class User(Base):
     is_superuser = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     last_login = Column(DateTime, nullable=True)
+    # Входит в токен: увеличение отзывает все выданные токены пользователя
+    auth_version = Column(Integer, nullable=False, default=0, server_default="0")
     
     # Yandex Disk integration
     yandex_disk_token = Column(String, nullable=True)
@@ -33,21 +35,25 @@ class CaptchaSession(Base):
     session_id = Column(String, unique=True, index=True, nullable=False)
     question = Column(String, nullable=False)
     answer = Column(String, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)  # Очистка старых капч
     used = Column(Boolean, default=False)
 
+# Первичный ключ (владелец, тег) обслуживает загрузку тегов объекта и EXISTS-фильтры
+# по тегам; обратный индекс (тег, владелец) - фасеты, счетчики и удаление тега
 video_tags = Table(
     'video_tags',
     Base.metadata,
-    Column('video_id', Integer, ForeignKey('videos.id')),
-    Column('tag_id', Integer, ForeignKey('tags.id'))
+    Column('video_id', Integer, ForeignKey('videos.id'), primary_key=True),
+    Column('tag_id', Integer, ForeignKey('tags.id'), primary_key=True),
+    Index('ix_video_tags_tag_id_video_id', 'tag_id', 'video_id')
 )
 
 fragment_tags = Table(
     'fragment_tags',
     Base.metadata,
-    Column('fragment_id', Integer, ForeignKey('fragments.id')),
-    Column('tag_id', Integer, ForeignKey('tags.id'))
+    Column('fragment_id', Integer, ForeignKey('fragments.id'), primary_key=True),
+    Column('tag_id', Integer, ForeignKey('tags.id'), primary_key=True),
+    Index('ix_fragment_tags_tag_id_fragment_id', 'tag_id', 'fragment_id')
 )
 
 class Video(Base):
@@ -60,18 +66,42 @@ class Video(Base):
     title = Column(String)
     duration = Column(Float)
     filepath = Column(String)
-    file_size = Column(Integer)
+    file_size = Column(BigInteger)
     mime_type = Column(String)
+    # sha256 содержимого: файл общий (media_blobs), ссылка держится, пока задан filepath
+    content_hash = Column(String, nullable=True, index=True)
     
     category = Column(String)
     subcategory = Column(String)
     
+    # HLS-упаковка: путь к master.m3u8 относительно HLS_DIR
+    hls_path = Column(String, nullable=True)
+    hls_status = Column(String, nullable=True)  # None | processing | ready | failed
+    
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     owner = relationship("User", back_populates="videos")
     fragments = relationship("Fragment", back_populates="video", cascade="all, delete-orphan")
     tags = relationship("Tag", secondary=video_tags, back_populates="videos")
+    
+    __table_args__ = (
+        # Ключ keyset-пагинации списков (ORDER BY created_at, id)
+        Index('ix_videos_created_at_id', 'created_at', 'id'),
+        # Те же списки с фильтром по категории и по категории с подкатегорией
+        Index('ix_videos_category_created_at_id', 'category', 'created_at', 'id'),
+        Index('ix_videos_category_subcategory_created_at_id', 'category', 'subcategory', 'created_at', 'id'),
+    )
+
+class MediaBlob(Base):
+    __tablename__ = 'media_blobs'
+    
+    content_hash = Column(String, primary_key=True)  # sha256 hex
+    filepath = Column(String, nullable=False)
+    file_size = Column(BigInteger)
+    ref_count = Column(Integer, default=0, nullable=False)  # Видео, ссылающиеся на файл
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
 
 class Fragment(Base):
     __tablename__ = 'fragments'
@@ -85,14 +115,21 @@ class Fragment(Base):
     end_time = Column(Float)
     
     filepath = Column(String)  # Путь к превью/скриншоту
-    file_size = Column(Integer)
+    file_size = Column(BigInteger)
     video_filepath = Column(String)  # Путь к видеофайлу фрагмента
-    video_file_size = Column(Integer)  # Размер видеофайла
+    video_file_size = Column(BigInteger)  # Размер видеофайла
+    is_virtual = Column(Boolean, default=False)  # Файла нет, фрагмент вырезается из видео по запросу
     
     created_at = Column(DateTime, default=datetime.utcnow)
     
     video = relationship("Video", back_populates="fragments")
     tags = relationship("Tag", secondary=fragment_tags, back_populates="fragments")
+    
+    __table_args__ = (
+        # Ключи keyset-пагинации: фрагменты видео и общий список
+        Index('ix_fragments_video_id_created_at_id', 'video_id', 'created_at', 'id'),
+        Index('ix_fragments_created_at_id', 'created_at', 'id'),
+    )
 
 class Tag(Base):
     __tablename__ = 'tags'
@@ -101,5 +138,76 @@ class Tag(Base):
     name = Column(String, unique=True, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     
+    # Счетчики связей, их ведут триггеры на video_tags/fragment_tags (services/tag_stats.py)
+    video_count = Column(Integer, default=0, nullable=False, server_default='0')
+    fragment_count = Column(Integer, default=0, nullable=False, server_default='0')
+    
     videos = relationship("Video", secondary=video_tags, back_populates="tags")
     fragments = relationship("Fragment", secondary=fragment_tags, back_populates="tags")
+
+class CategoryCount(Base):
+    """Число видео по (категория, подкатегория); пустая строка вместо NULL. Ведется триггерами"""
+    __tablename__ = 'category_counts'
+    
+    category = Column(String, primary_key=True)
+    subcategory = Column(String, primary_key=True)
+    video_count = Column(Integer, default=0, nullable=False)
+
+class UploadSession(Base):
+    __tablename__ = 'upload_sessions'
+    
+    id = Column(String, primary_key=True)
+    original_filename = Column(String, nullable=False)
+    content_type = Column(String)
+    total_size = Column(BigInteger, nullable=False)
+    sha256 = Column(String, nullable=True)  # Ожидаемая контрольная сумма от клиента
+    
+    title = Column(String)
+    category = Column(String)
+    subcategory = Column(String)
+    tags = Column(String)  # Теги через запятую, как в /videos/upload
+    
+    status = Column(String, default="active")  # active | assembling | completed
+    video_id = Column(Integer, ForeignKey('videos.id'), nullable=True)
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    parts = relationship("UploadPart", back_populates="session", cascade="all, delete-orphan")
+
+class UploadPart(Base):
+    __tablename__ = 'upload_parts'
+    
+    id = Column(Integer, primary_key=True)
+    session_id = Column(String, ForeignKey('upload_sessions.id'), index=True, nullable=False)
+    
+    # Полуинтервал [range_start, range_end) в байтах
+    range_start = Column(BigInteger, nullable=False)
+    range_end = Column(BigInteger, nullable=False)
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    session = relationship("UploadSession", back_populates="parts")
+
+class Job(Base):
+    __tablename__ = 'jobs'
+    
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False, index=True)
+    payload = Column(Text)  # JSON
+    
+    status = Column(String, default="pending", index=True)  # pending | running | completed | failed
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=3)
+    run_after = Column(DateTime, default=datetime.utcnow)  # Отложенный повтор после ошибки
+    
+    result = Column(Text)  # JSON
+    error = Column(Text)
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    
+    # Аренда выполняющейся задачи: воркер продлевает heartbeat_at, просроченную забирают другие
+    worker_id = Column(String, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, update
 from datetime import datetime, timedelta
 from typing import List, Optional
 import random
@@ -12,6 +12,7 @@ from database import get_db
 from models import User as UserModel, CaptchaSession
 from schemas import UserCreate, User, CaptchaResponse, LoginRequest, Token
 from config import settings
+from services.user_cache import user_cache
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
@@ -35,6 +36,20 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+async def revoke_user_sessions(db: AsyncSession, user: UserModel):
+    """
+    Отзывает все выданные пользователю токены: вызывать при смене пароля или
+    блокировке (is_active). Коммитит сессию. Другие процессы увидят отзыв
+    не позже чем через USER_CACHE_TTL_SECONDS
+    """
+    await db.execute(
+        update(UserModel)
+        .where(UserModel.id == user.id)
+        .values(auth_version=UserModel.auth_version + 1)
+    )
+    await db.commit()
+    user_cache.invalidate(user.id)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -144,9 +159,10 @@ async def login(login_data: LoginRequest, db: AsyncSession = Depends(get_db)):
     # Обновляем время входа
     user.last_login = datetime.utcnow()
     await db.commit()
+    user_cache.invalidate(user.id)
     
     # Создаем токен
-    access_token = create_access_token(data={"sub": user.username})
+    access_token = create_access_token(data={"sub": user.username, "uid": user.id, "av": user.auth_version})
     
     return {"access_token": access_token, "token_type": "bearer"}
 
@@ -155,7 +171,10 @@ from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login", auto_error=False)
 
 async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> Optional[UserModel]:
-    """Получить текущего пользователя из токена (опционально)"""
+    """
+    Получить текущего пользователя из токена (опционально).
+    Пользователь берется из кэша по uid, без запроса к базе; объект отвязан от сессии
+    """
     if not token:
         return None
     
@@ -167,8 +186,25 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession
     except JWTError:
         return None
     
-    result = await db.execute(select(UserModel).where(UserModel.username == username))
-    user = result.scalar_one_or_none()
+    user_id = payload.get("uid")
+    if user_id is None:
+        # Токен, выданный до появления uid: ищем по имени, пока не истечет
+        result = await db.execute(select(UserModel).where(UserModel.username == username))
+        return result.scalar_one_or_none()
+    
+    auth_version = payload.get("av", 0)
+    user = user_cache.get(user_id)
+    if user is None or user.auth_version != auth_version:
+        # Промах или кэш старше токена: перечитываем, устаревший токен отклоняется ниже
+        user = await db.get(UserModel, user_id)
+        if user is None:
+            user_cache.invalidate(user_id)
+            return None
+        db.expunge(user)
+        user_cache.put(user)
+    
+    if user.auth_version != auth_version:
+        return None
     return user
 
 async def get_current_active_user(current_user: UserModel = Depends(get_current_user)) -> UserModel:
@@ -182,3 +218,12 @@ async def get_current_active_user(current_user: UserModel = Depends(get_current_
     if not current_user.is_active:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Inactive user")
     return current_user
+
+@router.post("/logout-all")
+async def logout_all(
+    current_user: UserModel = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Отозвать все токены текущего пользователя, включая этот"""
+    await revoke_user_sessions(db, current_user)
+    return {"message": "All sessions revoked"}
@@ -1,15 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, or_
+from sqlalchemy import select, and_, or_
 from sqlalchemy.orm import selectinload
 from typing import List, Optional
 import os
 from pathlib import Path
+from datetime import datetime
 
 from config import settings
 from models import Video, Fragment, Tag, fragment_tags
-from schemas import FragmentCreate, FragmentUpdate, Fragment as FragmentSchema, FragmentWithTags
-from services.ffmpeg_service import ffmpeg_service
+from schemas import (
+    FragmentCreate, FragmentUpdate, Fragment as FragmentSchema, FragmentWithTags,
+    FragmentCreateResult, FragmentBatchCreate, FragmentBatchResult, FragmentSearchResult
+)
+from services.job_queue import job_queue
+from services.media_jobs import EXTRACT_FRAGMENT, EXTRACT_FRAGMENTS
+from services.fragment_cache import fragment_cache
+from services.search_index import match_expression, search_subquery
+from services.pagination import after_cursor, decode_cursor, split_page, set_next_cursor
+from services.tag_resolver import tags_by_ids
 from database import get_db
 
 # Router for video-specific fragment operations
@@ -18,30 +27,66 @@ router = APIRouter(prefix="/videos/{video_id}/fragments", tags=["fragments"])
 # Separate router for global fragment operations
 global_router = APIRouter(prefix="/fragments", tags=["fragments"])
 
-@global_router.get("/search", response_model=List[FragmentWithTags])
+@global_router.get("/search", response_model=List[FragmentSearchResult])
 async def search_fragments_global(
     query: str,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
     db: AsyncSession = Depends(get_db)
 ):
-    """Search fragments across all videos by name or description"""
-    stmt = (
-        select(Fragment)
-        .options(selectinload(Fragment.tags), selectinload(Fragment.video))
-        .where(
+    """Search fragments across all videos by name or description, best matches first"""
+    # От видео нужна только карточка (VideoSummary), не все его колонки
+    stmt = select(Fragment).options(
+        selectinload(Fragment.tags),
+        selectinload(Fragment.video).load_only(
+            Video.id, Video.title, Video.original_filename, Video.duration,
+            Video.category, Video.subcategory, Video.hls_status, Video.created_at
+        )
+    )
+    
+    match = match_expression(query)
+    if match is None:
+        # Short queries (and databases without FTS5) fall back to a LIKE scan
+        stmt = stmt.where(
             or_(
                 Fragment.name.ilike(f"%{query}%"),
                 Fragment.description.ilike(f"%{query}%")
             )
         )
-        .order_by(Fragment.created_at.desc())
-    )
+        if cursor:
+            stmt = stmt.where(after_cursor(
+                (Fragment.created_at, Fragment.id), decode_cursor(cursor, (datetime, int)), descending=True
+            ))
+        stmt = stmt.order_by(Fragment.created_at.desc(), Fragment.id.desc()).limit(limit + 1)
+        result = await db.execute(stmt)
+        fragments, next_cursor = split_page(result.scalars().all(), limit, lambda f: (f.created_at, f.id))
+        set_next_cursor(response, next_cursor)
+        return fragments
+    
+    if cursor:
+        hits = search_subquery("fragments_fts", match)
+        stmt = stmt.where(after_cursor((hits.c.rank, hits.c.id), decode_cursor(cursor, (float, int))))
+    else:
+        # Первая страница: лучшие совпадения отбираются внутри FTS5
+        hits = search_subquery("fragments_fts", match, limit=limit + 1)
     
+    stmt = (
+        stmt.add_columns(hits.c.snippet, hits.c.rank)
+        .join(hits, hits.c.id == Fragment.id)
+        .order_by(hits.c.rank, hits.c.id)
+        .limit(limit + 1)
+    )
     result = await db.execute(stmt)
-    fragments = result.scalars().all()
+    rows, next_cursor = split_page(result.all(), limit, lambda row: (row.rank, row[0].id))
+    set_next_cursor(response, next_cursor)
     
-    return fragments
+    return [
+        FragmentSearchResult.model_validate(fragment).model_copy(update={"snippet": snippet})
+        for fragment, snippet, _ in rows
+    ]
 
-@router.post("/", response_model=FragmentSchema)
+@router.post("/", response_model=FragmentCreateResult)
 async def create_fragment(
     video_id: int,
     fragment: FragmentCreate,
@@ -53,6 +98,9 @@ async def create_fragment(
     if not video:
         raise HTTPException(status_code=404, detail="Video not found")
     
+    if video.duration is None:
+        raise HTTPException(status_code=409, detail="Video is still being processed")
+    
     if fragment.start_time < 0 or fragment.end_time > video.duration:
         raise HTTPException(
             status_code=400,
@@ -65,62 +113,114 @@ async def create_fragment(
             detail="Start time must be less than end time"
         )
     
+    # Проверяем что исходное видео существует
+    if not video.filepath or not os.path.exists(video.filepath):
+        raise HTTPException(status_code=400, detail="Source video file not found. Cannot create fragment without source video.")
+    
+    is_virtual = settings.FRAGMENTS_VIRTUAL if fragment.virtual is None else fragment.virtual
+    
     fragment_obj = Fragment(
         video_id=video_id,
         name=fragment.name,
         description=fragment.description,
         start_time=fragment.start_time,
-        end_time=fragment.end_time
+        end_time=fragment.end_time,
+        is_virtual=is_virtual
     )
     
     if fragment.tag_ids:
-        for tag_id in fragment.tag_ids:
-            result = await db.execute(select(Tag).where(Tag.id == tag_id))
-            tag = result.scalar_one_or_none()
-            if tag:
-                fragment_obj.tags.append(tag)
+        fragment_obj.tags = await tags_by_ids(db, fragment.tag_ids)
     
     db.add(fragment_obj)
     await db.commit()
     await db.refresh(fragment_obj)
     
-    # Проверяем что исходное видео существует
+    if is_virtual:
+        # Копия не создается: воспроизведение идет из исходного видео,
+        # файл вырезается в кэш только при скачивании
+        return FragmentCreateResult.model_validate(fragment_obj)
+    
+    # Видеофайл фрагмента извлекается в фоне, video_filepath появится по завершении задачи
+    job = await job_queue.enqueue(db, EXTRACT_FRAGMENT, {"fragment_id": fragment_obj.id})
+    
+    return FragmentCreateResult.model_validate(fragment_obj).model_copy(update={"job_id": job.id})
+
+@router.post("/batch", response_model=FragmentBatchResult)
+async def create_fragments_batch(
+    video_id: int,
+    batch: FragmentBatchCreate,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Создает несколько фрагментов одного видео одной транзакцией.
+
+    Диапазоны проверяются все сразу до записи; файлы невиртуальных фрагментов
+    извлекаются одной задачей за один проход по исходному видео.
+    """
+    result = await db.execute(select(Video).where(Video.id == video_id))
+    video = result.scalar_one_or_none()
+    
+    if not video:
+        raise HTTPException(status_code=404, detail="Video not found")
+    
+    if video.duration is None:
+        raise HTTPException(status_code=409, detail="Video is still being processed")
+    
+    errors = []
+    for index, item in enumerate(batch.fragments):
+        if item.start_time < 0 or item.end_time > video.duration:
+            errors.append({"index": index, "error": "Fragment time range is outside video duration"})
+        elif item.start_time >= item.end_time:
+            errors.append({"index": index, "error": "Start time must be less than end time"})
+    if errors:
+        raise HTTPException(status_code=400, detail=errors)
+    
     if not video.filepath or not os.path.exists(video.filepath):
-        await db.delete(fragment_obj)
-        await db.commit()
         raise HTTPException(status_code=400, detail="Source video file not found. Cannot create fragment without source video.")
     
-    fragment_filename = f"fragment_{fragment_obj.id}_{video.filename}"
-    fragment_path = Path(settings.FRAGMENTS_DIR) / fragment_filename
+    # Все теги пачки одним запросом
+    tags = await tags_by_ids(db, (tag_id for item in batch.fragments for tag_id in item.tag_ids or []))
+    tags_by_id = {tag.id: tag for tag in tags}
     
-    try:
-        output_path = await ffmpeg_service.extract_fragment(
-            video.filepath,
-            str(fragment_path),
-            fragment.start_time,
-            fragment.end_time
+    fragment_objs = []
+    for item in batch.fragments:
+        fragment_obj = Fragment(
+            video_id=video_id,
+            name=item.name,
+            description=item.description,
+            start_time=item.start_time,
+            end_time=item.end_time,
+            is_virtual=settings.FRAGMENTS_VIRTUAL if item.virtual is None else item.virtual,
+            tags=[tags_by_id[tag_id] for tag_id in item.tag_ids or [] if tag_id in tags_by_id]
         )
-        
-        # Сохраняем путь относительно static директории (uploads)
-        # fragments/filename
-        fragment_obj.video_filepath = f"fragments/{fragment_filename}"
-        if os.path.exists(output_path):
-            fragment_obj.video_file_size = os.path.getsize(output_path)
-        
-        await db.commit()
-    except Exception as e:
-        await db.delete(fragment_obj)
-        await db.commit()
-        raise HTTPException(status_code=500, detail=f"Failed to extract fragment: {str(e)}")
-    
-    return fragment_obj
+        db.add(fragment_obj)
+        fragment_objs.append(fragment_obj)
+    
+    await db.commit()
+    
+    job_id = None
+    to_extract = [fragment_obj.id for fragment_obj in fragment_objs if not fragment_obj.is_virtual]
+    if to_extract:
+        job = await job_queue.enqueue(
+            db, EXTRACT_FRAGMENTS, {"video_id": video_id, "fragment_ids": to_extract}
+        )
+        job_id = job.id
+    
+    return FragmentBatchResult(
+        fragments=[FragmentSchema.model_validate(fragment_obj) for fragment_obj in fragment_objs],
+        job_id=job_id
+    )
 
 @router.get("/", response_model=List[FragmentWithTags])
 async def get_fragments(
     video_id: int,
+    response: Response,
     query: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
     db: AsyncSession = Depends(get_db)
 ):
+    """Fragments in creation order; the next page is requested with the X-Next-Cursor cursor"""
     stmt = (
         select(Fragment)
         .options(selectinload(Fragment.tags), selectinload(Fragment.video))
@@ -135,8 +235,14 @@ async def get_fragments(
             )
         )
     
+    if cursor:
+        stmt = stmt.where(after_cursor((Fragment.created_at, Fragment.id), decode_cursor(cursor, (datetime, int))))
+    
+    stmt = stmt.order_by(Fragment.created_at, Fragment.id).limit(limit + 1)
+    
     result = await db.execute(stmt)
-    fragments = result.scalars().all()
+    fragments, next_cursor = split_page(result.scalars().all(), limit, lambda f: (f.created_at, f.id))
+    set_next_cursor(response, next_cursor)
     
     return fragments
 
@@ -168,9 +274,9 @@ async def update_fragment(
     db: AsyncSession = Depends(get_db)
 ):
     result = await db.execute(
-        select(Fragment).where(
-            and_(Fragment.id == fragment_id, Fragment.video_id == video_id)
-        )
+        select(Fragment)
+        .options(selectinload(Fragment.tags))
+        .where(and_(Fragment.id == fragment_id, Fragment.video_id == video_id))
     )
     fragment = result.scalar_one_or_none()
     
@@ -180,12 +286,7 @@ async def update_fragment(
     update_data = fragment_update.model_dump(exclude_unset=True)
     
     if "tag_ids" in update_data:
-        fragment.tags.clear()
-        for tag_id in update_data["tag_ids"] or []:
-            result = await db.execute(select(Tag).where(Tag.id == tag_id))
-            tag = result.scalar_one_or_none()
-            if tag:
-                fragment.tags.append(tag)
+        fragment.tags = await tags_by_ids(db, update_data["tag_ids"] or [])
         del update_data["tag_ids"]
     
     for key, value in update_data.items():
@@ -194,6 +295,9 @@ async def update_fragment(
     await db.commit()
     await db.refresh(fragment)
     
+    if fragment.is_virtual and ("start_time" in update_data or "end_time" in update_data):
+        fragment_cache.invalidate(fragment.id)
+    
     return fragment
 
 @router.delete("/{fragment_id}")
@@ -220,9 +324,9 @@ async def delete_fragment(
     if fragment.filepath and os.path.exists(fragment.filepath):
         os.remove(fragment.filepath)
     
+    fragment_cache.invalidate(fragment.id)
+    
     await db.delete(fragment)
     await db.commit()
     
     return {"message": "Fragment deleted successfully"}
-
-from sqlalchemy import and_
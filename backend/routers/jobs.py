@@ -0,0 +1,72 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+import asyncio
+
+from config import settings
+from models import Job
+from schemas import Job as JobSchema
+from services.ffmpeg_service import ffmpeg_service
+from services.progress import progress_tracker
+from database import get_db, AsyncSessionLocal
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+FINAL_STATUSES = ("completed", "failed")
+
+def _job_with_progress(job: Job) -> JobSchema:
+    return JobSchema.model_validate(job).model_copy(
+        update={"progress": progress_tracker.get(job.id)}
+    )
+
+@router.get("/ffmpeg-stats")
+async def get_ffmpeg_stats():
+    """Загрузка планировщика FFmpeg: лимиты, очередь ожидания и счетчики по полосам"""
+    return ffmpeg_service.stats()
+
+@router.get("/{job_id}", response_model=JobSchema)
+async def get_job(job_id: int, db: AsyncSession = Depends(get_db)):
+    """Статус фоновой задачи обработки"""
+    result = await db.execute(select(Job).where(Job.id == job_id))
+    job = result.scalar_one_or_none()
+
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return _job_with_progress(job)
+
+@router.get("/{job_id}/events")
+async def stream_job_progress(job_id: int, request: Request):
+    """
+    Server-Sent Events с прогрессом задачи до ее завершения.
+
+    Прогресс хранится в памяти процесса, который выполняет задачу; в остальных
+    процессах поток содержит только статус из базы.
+    """
+    async with AsyncSessionLocal() as db:
+        if await db.get(Job, job_id) is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        last_payload = None
+        while not await request.is_disconnected():
+            async with AsyncSessionLocal() as db:
+                job = await db.get(Job, job_id)
+            if job is None:
+                break
+
+            payload = _job_with_progress(job).model_dump_json()
+            if payload != last_payload:
+                yield f"data: {payload}\n\n"
+                last_payload = payload
+
+            if job.status in FINAL_STATUSES:
+                break
+            await asyncio.sleep(settings.JOB_PROGRESS_STREAM_INTERVAL)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
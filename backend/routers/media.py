@@ -0,0 +1,160 @@
+from fastapi import APIRouter, HTTPException, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+from pathlib import Path
+import logging
+
+from models import Video, Fragment
+from services.media_server import RangeFileResponse
+from services.fragment_cache import fragment_cache
+from services.media_jobs import fragment_file_path, reel_path
+from services.hls import (
+    hls_dir,
+    slice_media_playlist,
+    MASTER_PLAYLIST,
+    PLAYLIST_CONTENT_TYPE,
+    SEGMENT_CONTENT_TYPE,
+)
+from database import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Сессия открывается только на чтение строки, а не через Depends(get_db): зависимость
+# закрывается лишь после отправки тела ответа, и долгая отдача файла держала бы соединение пула
+router = APIRouter(prefix="/media", tags=["media"])
+
+@router.api_route("/videos/{video_id}", methods=["GET", "HEAD"])
+async def stream_video(video_id: int, request: Request):
+    """Исходное видео с поддержкой Range для перемотки в плеере"""
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(Video.filepath, Video.mime_type).where(Video.id == video_id))
+        row = result.one_or_none()
+
+    if not row:
+        raise HTTPException(status_code=404, detail="Video not found")
+
+    filepath, mime_type = row
+    if not filepath or not Path(filepath).is_file():
+        raise HTTPException(status_code=404, detail="Source video file not found")
+
+    return RangeFileResponse(Path(filepath), request, media_type=mime_type or None)
+
+def _hls_file(video_id: int, path: str) -> Path:
+    root = hls_dir(video_id).resolve()
+    target = (root / path).resolve()
+    # Не выпускаем запрос за пределы каталога HLS этого видео
+    if root not in target.parents or not target.is_file():
+        raise HTTPException(status_code=404, detail="HLS file not found")
+    return target
+
+def _hls_content_type(path: Path) -> str:
+    return PLAYLIST_CONTENT_TYPE if path.suffix == ".m3u8" else SEGMENT_CONTENT_TYPE
+
+async def _ready_hls_video(db: AsyncSession, video_id: int) -> None:
+    result = await db.execute(select(Video.hls_status).where(Video.id == video_id))
+    hls_status = result.scalar_one_or_none()
+    if hls_status != "ready":
+        raise HTTPException(status_code=404, detail="HLS is not available for this video")
+
+@router.api_route("/videos/{video_id}/hls/{path:path}", methods=["GET", "HEAD"])
+async def stream_video_hls(
+    video_id: int,
+    path: str,
+    request: Request
+):
+    """HLS-плейлисты и сегменты видео; точка входа - master.m3u8"""
+    async with AsyncSessionLocal() as db:
+        await _ready_hls_video(db, video_id)
+    target = _hls_file(video_id, path)
+    return RangeFileResponse(target, request, media_type=_hls_content_type(target))
+
+@router.get("/fragments/{fragment_id}/hls/{path:path}")
+async def stream_fragment_hls(
+    fragment_id: int,
+    path: str
+):
+    """
+    Фрагмент как подмножество HLS исходного видео, без отдельного файла.
+
+    master.m3u8 совпадает с плейлистом видео, а v<N>/index.m3u8 содержит только
+    сегменты, пересекающие [start_time, end_time), со ссылками на сегменты видео.
+    """
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(Fragment).where(Fragment.id == fragment_id))
+        fragment = result.scalar_one_or_none()
+
+        if not fragment:
+            raise HTTPException(status_code=404, detail="Fragment not found")
+
+        await _ready_hls_video(db, fragment.video_id)
+
+    if path == MASTER_PLAYLIST:
+        target = _hls_file(fragment.video_id, MASTER_PLAYLIST)
+        return Response(target.read_text(), media_type=PLAYLIST_CONTENT_TYPE)
+
+    if not path.endswith("/index.m3u8"):
+        raise HTTPException(status_code=404, detail="HLS file not found")
+
+    target = _hls_file(fragment.video_id, path)
+    variant = Path(path).parent.as_posix()
+    # Относительно /media/fragments/{id}/hls/<variant>/ до /media/videos/{video_id}/hls/<variant>/
+    segment_base = f"../../../../videos/{fragment.video_id}/hls/{variant}/"
+    playlist = slice_media_playlist(
+        target.read_text(),
+        fragment.start_time,
+        fragment.end_time,
+        segment_base
+    )
+    return Response(playlist, media_type=PLAYLIST_CONTENT_TYPE)
+
+@router.api_route("/fragments/{fragment_id}", methods=["GET", "HEAD"])
+async def stream_fragment(fragment_id: int, request: Request):
+    """
+    Видеофайл фрагмента с поддержкой Range.
+
+    Виртуальный фрагмент при первом запросе вырезается из исходного видео в
+    LRU-кэш. Для просмотра в плеере это не нужно: достаточно исходного видео
+    с #t=start,end или HLS-плейлиста фрагмента.
+    """
+    # Нарезка в кэш тоже идет без открытой сессии: фрагмент и видео уже загружены
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(Fragment).options(selectinload(Fragment.video)).where(Fragment.id == fragment_id)
+        )
+        fragment = result.scalar_one_or_none()
+
+    if not fragment:
+        raise HTTPException(status_code=404, detail="Fragment not found")
+
+    if fragment.is_virtual:
+        video = fragment.video
+        if not video.filepath or not Path(video.filepath).is_file():
+            raise HTTPException(status_code=404, detail="Source video file not found")
+        try:
+            path = await fragment_cache.get(fragment, video)
+        except Exception as e:
+            logger.error(f"Fragment {fragment_id} materialization error: {str(e)}")
+            raise HTTPException(status_code=500, detail="Failed to cut fragment from source video")
+        return RangeFileResponse(path, request)
+
+    if not fragment.video_filepath:
+        raise HTTPException(status_code=404, detail="Fragment video file is not ready")
+
+    path = fragment_file_path(fragment)
+    if not path.is_file():
+        raise HTTPException(status_code=404, detail="Fragment video file not found")
+
+    return RangeFileResponse(path, request)
+
+@router.api_route("/reels/{key}", methods=["GET", "HEAD"])
+async def stream_reel(key: str, request: Request):
+    """Готовая склейка фрагментов (ключ возвращает POST /reels)"""
+    if len(key) != 64 or any(c not in "0123456789abcdef" for c in key):
+        raise HTTPException(status_code=404, detail="Reel not found")
+
+    path = reel_path(key)
+    if not path.is_file():
+        raise HTTPException(status_code=404, detail="Reel not found")
+
+    return RangeFileResponse(path, request, media_type="video/mp4")
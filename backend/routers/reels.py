@@ -0,0 +1,58 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+
+from config import settings
+from models import Fragment, Tag
+from schemas import ReelCreate, ReelResult
+from services.job_queue import job_queue
+from services.media_jobs import EXPORT_REEL, reel_key, reel_path
+from database import get_db
+
+router = APIRouter(prefix="/reels", tags=["reels"])
+
+@router.post("/", response_model=ReelResult)
+async def create_reel(reel: ReelCreate, db: AsyncSession = Depends(get_db)):
+    """
+    Склейка фрагментов в один ролик.
+
+    Результат кэшируется по хэшу списка фрагментов: повторный запрос того же
+    списка сразу возвращает status=ready. Файл отдается через /media/reels/{key}.
+    """
+    if bool(reel.fragment_ids) == bool(reel.tags):
+        raise HTTPException(status_code=400, detail="Specify either fragment_ids or tags")
+    
+    if reel.fragment_ids:
+        result = await db.execute(select(Fragment).where(Fragment.id.in_(reel.fragment_ids)))
+        fragments_by_id = {fragment.id: fragment for fragment in result.scalars().all()}
+        missing = [fid for fid in reel.fragment_ids if fid not in fragments_by_id]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Fragments not found: {missing}")
+        fragments = [fragments_by_id[fid] for fid in reel.fragment_ids]
+    else:
+        # Фрагменты с любым из тегов, в порядке видео и времени внутри видео
+        result = await db.execute(
+            select(Fragment)
+            .join(Fragment.tags)
+            .where(Tag.name.in_(reel.tags))
+            .distinct()
+            .order_by(Fragment.video_id, Fragment.start_time)
+        )
+        fragments = result.scalars().all()
+        if not fragments:
+            raise HTTPException(status_code=404, detail="No fragments found for the given tags")
+    
+    if len(fragments) > settings.REEL_MAX_FRAGMENTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many fragments in one reel (max {settings.REEL_MAX_FRAGMENTS})"
+        )
+    
+    key = reel_key(fragments)
+    fragment_ids = [fragment.id for fragment in fragments]
+    
+    if reel_path(key).is_file():
+        return ReelResult(key=key, status="ready", fragment_ids=fragment_ids)
+    
+    job = await job_queue.enqueue(db, EXPORT_REEL, {"key": key, "fragment_ids": fragment_ids})
+    return ReelResult(key=key, status="processing", fragment_ids=fragment_ids, job_id=job.id)
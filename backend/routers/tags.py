@@ -1,10 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
-from typing import List
+from sqlalchemy import select, or_
+from typing import List, Literal, Optional
 
-from models import Tag
-from schemas import Tag as TagSchema, TagCreate
+from models import Tag, Video, Fragment
+from schemas import Tag as TagSchema, TagCreate, TagSuggestion, BulkTagUpdate, BulkTagResult
+from services.pagination import after_cursor, decode_cursor, split_page, set_next_cursor
+from services.tag_index import tag_index
+from services.tag_resolver import apply_tag_changes, index_tags
+from routers.videos import apply_search_filters
 from database import get_db
 
 router = APIRouter(prefix="/tags", tags=["tags"])
@@ -21,47 +25,122 @@ async def create_tag(tag: TagCreate, db: AsyncSession = Depends(get_db)):
     db.add(new_tag)
     await db.commit()
     await db.refresh(new_tag)
+    tag_index.add(new_tag.id, new_tag.name)
     
     return new_tag
 
 @router.get("/", response_model=List[TagSchema])
 async def get_tags(
-    skip: int = 0,
-    limit: int = 100,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
     search: str = None,
+    skip: int = Query(0, ge=0, deprecated=True),
     db: AsyncSession = Depends(get_db)
 ):
+    """Alphabetical; the next page is requested with the cursor from the X-Next-Cursor header"""
     query = select(Tag)
     
     if search:
         query = query.where(Tag.name.ilike(f"%{search.lower()}%"))
     
-    query = query.offset(skip).limit(limit).order_by(Tag.name)
+    # Имя тега уникально, поэтому оно само служит ключом курсора
+    if cursor:
+        query = query.where(after_cursor((Tag.name,), decode_cursor(cursor, (str,))))
+    elif skip:
+        query = query.offset(skip)
+    
+    query = query.order_by(Tag.name).limit(limit + 1)
     
     result = await db.execute(query)
-    tags = result.scalars().all()
+    tags, next_cursor = split_page(result.scalars().all(), limit, lambda t: (t.name,))
+    set_next_cursor(response, next_cursor)
     
     return tags
 
 @router.get("/popular", response_model=List[dict])
 async def get_popular_tags(
     limit: int = 20,
+    by: Literal["fragments", "videos"] = "fragments",
     db: AsyncSession = Depends(get_db)
 ):
-    from models import fragment_tags
+    """Most used tags, read from the precomputed counters"""
+    counter = Tag.fragment_count if by == "fragments" else Tag.video_count
     
     query = (
-        select(Tag, func.count(fragment_tags.c.fragment_id).label("count"))
-        .join(fragment_tags)
-        .group_by(Tag.id)
-        .order_by(func.count(fragment_tags.c.fragment_id).desc())
+        select(Tag)
+        .where(counter > 0)
+        .order_by(counter.desc(), Tag.name)
         .limit(limit)
     )
     
     result = await db.execute(query)
-    tags = result.all()
+    tags = result.scalars().all()
+    
+    return [
+        {
+            "id": tag.id,
+            "name": tag.name,
+            "count": tag.fragment_count if by == "fragments" else tag.video_count,
+            "video_count": tag.video_count,
+            "fragment_count": tag.fragment_count
+        }
+        for tag in tags
+    ]
+
+@router.get("/autocomplete", response_model=List[TagSuggestion])
+async def autocomplete_tags(
+    prefix: str = "",
+    limit: int = Query(10, ge=1, le=100),
+    db: AsyncSession = Depends(get_db)
+):
+    """Most popular tags starting with prefix, served from the in-memory index"""
+    await tag_index.ensure_fresh(db)
+    
+    return [
+        {"id": tag_id, "name": name, "count": count}
+        for tag_id, name, count in tag_index.complete(prefix, limit)
+    ]
+
+@router.post("/bulk", response_model=BulkTagResult)
+async def bulk_update_tags(update: BulkTagUpdate, db: AsyncSession = Depends(get_db)):
+    """
+    Add, remove or replace tags on many videos and fragments in one transaction.
+    Videos are selected by id and/or by a search filter, fragments by id
+    """
+    if update.replace is not None and (update.add or update.remove):
+        raise HTTPException(status_code=400, detail="replace cannot be combined with add or remove")
+    if update.replace is None and not update.add and not update.remove:
+        raise HTTPException(status_code=400, detail="Nothing to change: specify add, remove or replace")
+    if not update.video_ids and not update.fragment_ids and update.search is None:
+        raise HTTPException(status_code=400, detail="Specify video_ids, fragment_ids or search")
+    
+    video_targets = None
+    if update.video_ids or update.search is not None:
+        conditions = []
+        if update.video_ids:
+            conditions.append(Video.id.in_(update.video_ids))
+        if update.search is not None:
+            matched, _ = apply_search_filters(select(Video.id), update.search)
+            conditions.append(Video.id.in_(matched))
+        video_targets = select(Video.id).where(or_(*conditions))
+    
+    fragment_targets = None
+    if update.fragment_ids:
+        fragment_targets = select(Fragment.id).where(Fragment.id.in_(update.fragment_ids))
+    
+    summary = await apply_tag_changes(
+        db,
+        video_targets=video_targets,
+        fragment_targets=fragment_targets,
+        add=update.add,
+        remove=update.remove,
+        replace=update.replace
+    )
+    await db.commit()
+    index_tags(summary.pop("tags"))
     
-    return [{"id": tag[0].id, "name": tag[0].name, "count": tag[1]} for tag in tags]
+    return summary
 
 @router.get("/{tag_id}", response_model=TagSchema)
 async def get_tag(tag_id: int, db: AsyncSession = Depends(get_db)):
@@ -83,5 +162,6 @@ async def delete_tag(tag_id: int, db: AsyncSession = Depends(get_db)):
     
     await db.delete(tag)
     await db.commit()
+    tag_index.remove(tag.name)
     
     return {"message": "Tag deleted successfully"}
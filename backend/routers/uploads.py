@@ -0,0 +1,248 @@
+from fastapi import APIRouter, Depends, HTTPException, Header, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, delete, update
+from datetime import datetime, timedelta
+from pathlib import Path
+import re
+import uuid
+import logging
+
+from config import settings
+from models import UploadSession, UploadPart, Video
+from schemas import UploadSessionCreate, UploadSessionStatus, VideoUploadResult
+from services.upload_storage import (
+    partial_upload_path,
+    allocate_partial_file,
+    write_range,
+    merge_ranges,
+    missing_ranges,
+    file_sha256,
+    RangeLengthMismatchError,
+)
+from database import get_db
+from routers.videos import ingest_uploaded_video, is_video_upload
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/uploads", tags=["uploads"])
+
+CONTENT_RANGE_RE = re.compile(r"^bytes (\d+)-(\d+)/(\d+)$")
+
+async def _get_active_session(db: AsyncSession, session_id: str) -> UploadSession:
+    result = await db.execute(select(UploadSession).where(UploadSession.id == session_id))
+    session = result.scalar_one_or_none()
+
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+
+    return session
+
+async def _received_ranges(db: AsyncSession, session_id: str):
+    result = await db.execute(
+        select(UploadPart.range_start, UploadPart.range_end)
+        .where(UploadPart.session_id == session_id)
+    )
+    return merge_ranges(result.all())
+
+async def _session_status(db: AsyncSession, session: UploadSession) -> UploadSessionStatus:
+    received = await _received_ranges(db, session.id)
+    return UploadSessionStatus(
+        id=session.id,
+        filename=session.original_filename,
+        total_size=session.total_size,
+        received_bytes=sum(end - start for start, end in received),
+        received_ranges=received,
+        missing_ranges=missing_ranges(received, session.total_size),
+        status=session.status,
+        video_id=session.video_id,
+        created_at=session.created_at
+    )
+
+async def _cleanup_expired_sessions(db: AsyncSession):
+    """Удаляет незавершенные сессии старше UPLOAD_SESSION_TTL_HOURS вместе с частичными файлами"""
+    old_time = datetime.utcnow() - timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS)
+    result = await db.execute(
+        select(UploadSession.id).where(
+            # Сборка, прерванная падением процесса, тоже не завершится
+            UploadSession.status.in_(["active", "assembling"]),
+            UploadSession.updated_at < old_time
+        )
+    )
+    expired_ids = result.scalars().all()
+    if not expired_ids:
+        return
+
+    for session_id in expired_ids:
+        partial_upload_path(session_id).unlink(missing_ok=True)
+
+    await db.execute(delete(UploadPart).where(UploadPart.session_id.in_(expired_ids)))
+    await db.execute(delete(UploadSession).where(UploadSession.id.in_(expired_ids)))
+    await db.commit()
+
+@router.post("/", response_model=UploadSessionStatus)
+async def create_upload_session(
+    upload: UploadSessionCreate,
+    db: AsyncSession = Depends(get_db)
+):
+    """Начать возобновляемую загрузку: дальше части отправляются PUT-запросами с Content-Range"""
+    if not is_video_upload(upload.content_type or "", upload.filename):
+        raise HTTPException(status_code=400, detail=f"File must be a video. Got: {upload.content_type}")
+
+    if upload.total_size > settings.MAX_UPLOAD_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File exceeds maximum upload size of {settings.MAX_UPLOAD_SIZE} bytes"
+        )
+
+    await _cleanup_expired_sessions(db)
+
+    session = UploadSession(
+        id=uuid.uuid4().hex,
+        original_filename=Path(upload.filename).name,
+        content_type=upload.content_type,
+        total_size=upload.total_size,
+        sha256=upload.sha256.lower() if upload.sha256 else None,
+        title=upload.title,
+        category=upload.category,
+        subcategory=upload.subcategory,
+        tags=upload.tags
+    )
+    allocate_partial_file(partial_upload_path(session.id), session.total_size)
+
+    db.add(session)
+    await db.commit()
+    await db.refresh(session)
+
+    return await _session_status(db, session)
+
+@router.get("/{session_id}", response_model=UploadSessionStatus)
+async def get_upload_session(session_id: str, db: AsyncSession = Depends(get_db)):
+    """Статус загрузки: какие диапазоны уже получены, а какие нужно дослать"""
+    session = await _get_active_session(db, session_id)
+    return await _session_status(db, session)
+
+@router.put("/{session_id}", response_model=UploadSessionStatus)
+async def upload_part(
+    session_id: str,
+    request: Request,
+    content_range: str = Header(...),
+    db: AsyncSession = Depends(get_db)
+):
+    """Принять диапазон байт. Части можно отправлять параллельно и в любом порядке"""
+    session = await _get_active_session(db, session_id)
+
+    if session.status != "active":
+        raise HTTPException(status_code=409, detail=f"Upload session is already {session.status}")
+
+    match = CONTENT_RANGE_RE.match(content_range.strip())
+    if not match:
+        raise HTTPException(status_code=400, detail="Content-Range must be 'bytes start-end/total'")
+
+    start, end, total = (int(value) for value in match.groups())
+    if total != session.total_size or start > end or end >= total:
+        raise HTTPException(status_code=416, detail="Content-Range does not match upload session")
+
+    path = partial_upload_path(session.id)
+    if not path.exists():
+        raise HTTPException(status_code=410, detail="Partial upload data is missing")
+
+    try:
+        await write_range(path, start, end - start + 1, request.stream())
+    except RangeLengthMismatchError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    db.add(UploadPart(session_id=session.id, range_start=start, range_end=end + 1))
+    session.updated_at = datetime.utcnow()
+    await db.commit()
+
+    return await _session_status(db, session)
+
+@router.post("/{session_id}/complete", response_model=VideoUploadResult)
+async def complete_upload(session_id: str, db: AsyncSession = Depends(get_db)):
+    """
+    Собрать файл и зарегистрировать видео так же, как /videos/upload.
+    Повторный вызов для завершенной сессии возвращает уже созданное видео
+    """
+    session = await _get_active_session(db, session_id)
+
+    if session.status == "completed" and session.video_id:
+        video = await db.get(Video, session.video_id)
+        if video:
+            return VideoUploadResult.model_validate(video)
+    if session.status != "active":
+        raise HTTPException(status_code=409, detail=f"Upload session is already {session.status}")
+
+    received = await _received_ranges(db, session.id)
+    missing = missing_ranges(received, session.total_size)
+    if missing:
+        raise HTTPException(
+            status_code=409,
+            detail={"message": "Upload is incomplete", "missing_ranges": missing}
+        )
+
+    partial_path = partial_upload_path(session.id)
+    if not partial_path.exists():
+        raise HTTPException(status_code=410, detail="Partial upload data is missing")
+
+    # Захват сессии одним UPDATE: из одновременных или повторных вызовов
+    # хэширование и регистрацию видео выполняет только первый
+    claimed = await db.execute(
+        update(UploadSession)
+        .where(UploadSession.id == session.id, UploadSession.status == "active")
+        .values(status="assembling", updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    if claimed.rowcount != 1:
+        raise HTTPException(status_code=409, detail="Upload session is already being completed")
+
+    try:
+        content_hash = await file_sha256(partial_path)
+        if session.sha256 and session.sha256 != content_hash:
+            raise HTTPException(status_code=422, detail="Checksum mismatch, upload the file again")
+
+        # Части уже лежат на своих смещениях, сборка - это атомарное переименование в хранилище
+        logger.debug(f"Assembled upload {session.id}, sha256: {content_hash}")
+
+        video = await ingest_uploaded_video(
+            db,
+            partial_path,
+            filename=f"{uuid.uuid4()}_{session.original_filename}",
+            original_filename=session.original_filename,
+            content_type=session.content_type or "",
+            content_hash=content_hash,
+            title=session.title,
+            category=session.category,
+            subcategory=session.subcategory,
+            tags=session.tags
+        )
+    except BaseException:
+        # Видео не зарегистрировано: сессию можно дозагрузить или завершить снова
+        # После rollback атрибуты session просрочены: берем id из пути
+        await db.rollback()
+        await db.execute(
+            update(UploadSession)
+            .where(UploadSession.id == session_id, UploadSession.status == "assembling")
+            .values(status="active")
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        raise
+
+    session.status = "completed"
+    await db.execute(delete(UploadPart).where(UploadPart.session_id == session_id))
+    session.video_id = video.id
+    await db.commit()
+
+    return video
+
+@router.delete("/{session_id}")
+async def abort_upload(session_id: str, db: AsyncSession = Depends(get_db)):
+    session = await _get_active_session(db, session_id)
+
+    partial_upload_path(session.id).unlink(missing_ok=True)
+    await db.execute(delete(UploadPart).where(UploadPart.session_id == session.id))
+    await db.delete(session)
+    await db.commit()
+
+    return {"message": "Upload session aborted"}
@@ -1,31 +1,46 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, or_
-from sqlalchemy.orm import selectinload
-from typing import List, Optional
-import aiofiles
+from sqlalchemy import select, and_, or_, func
+from sqlalchemy.orm import selectinload, load_only, noload
+from typing import List, Literal, Optional
+import asyncio
 import os
+import shutil
 import magic
 from datetime import datetime
 from pathlib import Path
 import uuid
 import logging
-import traceback
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 from config import settings
-from models import Video, Tag, video_tags, Fragment
-from schemas import VideoCreate, VideoUpdate, Video as VideoSchema, VideoWithTags, SearchQuery
-from services.ffmpeg_service import ffmpeg_service
+from models import Video, Tag, Fragment
+from schemas import VideoCreate, VideoUpdate, Video as VideoSchema, VideoWithTags, VideoUploadResult, VideoSearchResult, SearchQuery, SearchFacets
+from services.upload_storage import save_upload_file, UploadTooLargeError
+from services.job_queue import job_queue
+from services.media_jobs import INGEST_VIDEO, enqueue_hls_packaging, materialize_fragments, clone_video_artifacts
+from services.blob_store import store_blob, restore_blob_source, release_video_source
+from services.fragment_cache import fragment_cache
+from services.hls import hls_dir
+from services.keyframes import delete_keyframe_index
+from services.search_index import match_expression, search_subquery
+from services.tag_stats import search_facets
+from services.tag_resolver import index_tags, parse_tag_names, resolve_tag_names
+from services.pagination import after_cursor, decode_cursor, split_page, set_next_cursor
 from services.yandex_disk import YandexDiskService
 from database import get_db
 from routers.auth import get_current_active_user, get_current_user
 
 router = APIRouter(prefix="/videos", tags=["videos"])
 
-@router.post("/upload", response_model=VideoSchema)
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.wmv')
+
+def is_video_upload(content_type: str, filename: str) -> bool:
+    return content_type.startswith("video/") or filename.endswith(VIDEO_EXTENSIONS)
+
+@router.post("/upload", response_model=VideoUploadResult)
 async def upload_video(
     title: Optional[str] = Form(None),
     category: Optional[str] = Form(None),
@@ -38,120 +53,129 @@ async def upload_video(
     filename = file.filename or ""
     logger.debug(f"Uploading file: {filename}, content_type: {content_type}")
     
-    if not (content_type.startswith("video/") or filename.endswith(('.mp4', '.avi', '.mov', '.mkv', '.wmv'))):
+    if not is_video_upload(content_type, filename):
         logger.error(f"Invalid file type: {content_type}, filename: {filename}")
         raise HTTPException(status_code=400, detail=f"File must be a video. Got: {content_type}")
     
     unique_filename = f"{uuid.uuid4()}_{file.filename}"
-    upload_path = Path(settings.UPLOAD_DIR) / unique_filename
-    
-    Path(settings.UPLOAD_DIR).mkdir(parents=True, exist_ok=True)
+    # Пишем во временный файл: место в хранилище определяется хэшем, известным только после записи
+    upload_path = Path(settings.UPLOAD_DIR) / "partial" / unique_filename
     
-    async with aiofiles.open(upload_path, "wb") as f:
-        content = await file.read()
-        await f.write(content)
+    try:
+        file_size, content_hash = await save_upload_file(file, upload_path)
+    except UploadTooLargeError as e:
+        logger.error(f"Upload rejected: {str(e)}")
+        raise HTTPException(status_code=413, detail=str(e))
     
-    file_size = len(content)
-    logger.debug(f"File saved, size: {file_size}")
+    logger.debug(f"File saved, size: {file_size}, sha256: {content_hash}")
     
     try:
-        logger.debug("Getting video info with FFmpeg...")
-        video_info = await ffmpeg_service.get_video_info(str(upload_path))
-        logger.debug(f"Video info: {video_info}")
-    except Exception as e:
-        error_trace = traceback.format_exc()
-        logger.error(f"FFmpeg error: {str(e)}")
-        logger.error(f"Traceback: {error_trace}")
-        os.remove(upload_path)
-        raise HTTPException(status_code=400, detail=f"FFmpeg error: {str(e)}")
-    
-    video = Video(
-        filename=unique_filename,
-        original_filename=file.filename,
-        title=title or file.filename,
-        filepath=str(upload_path),
-        file_size=file_size,
-        mime_type=content_type,
-        duration=video_info['duration'],
-        category=category,
-        subcategory=subcategory
-    )
+        return await ingest_uploaded_video(
+            db,
+            upload_path,
+            filename=unique_filename,
+            original_filename=file.filename,
+            content_type=content_type,
+            content_hash=content_hash,
+            title=title,
+            category=category,
+            subcategory=subcategory,
+            tags=tags
+        )
+    finally:
+        # Не попавший в хранилище временный файл повторно не используется
+        upload_path.unlink(missing_ok=True)
+
+async def ingest_uploaded_video(
+    db: AsyncSession,
+    upload_path: Path,
+    filename: str,
+    original_filename: str,
+    content_type: str,
+    content_hash: str,
+    title: Optional[str] = None,
+    category: Optional[str] = None,
+    subcategory: Optional[str] = None,
+    tags: Optional[str] = None
+) -> VideoUploadResult:
+    """Move an uploaded file into the blob store, register the video and queue its processing job"""
+    blob, duplicate = await store_blob(db, content_hash, upload_path, Path(original_filename).suffix)
     
-    if tags:
-        tag_list = [tag.strip().lower() for tag in tags.split(",")]
-        for tag_name in tag_list:
-            existing_tag = await db.execute(select(Tag).where(Tag.name == tag_name))
-            tag_obj = existing_tag.scalar_one_or_none()
-            if not tag_obj:
-                tag_obj = Tag(name=tag_name)
-                db.add(tag_obj)
-                await db.flush()
-            video.tags.append(tag_obj)
-    
-    db.add(video)
-    await db.commit()
+    try:
+        # Такой файл уже загружали и обработали: probe, превью и конвертация не нужны
+        donor = None
+        if duplicate:
+            result = await db.execute(
+                select(Video)
+                .where(
+                    Video.content_hash == content_hash,
+                    Video.filepath == blob.filepath,
+                    Video.duration.isnot(None)
+                )
+                .order_by(Video.id)
+                .limit(1)
+            )
+            donor = result.scalar_one_or_none()
+        
+        tag_objs = await resolve_tag_names(db, parse_tag_names(tags)) if tags else []
+        
+        video = Video(
+            filename=filename,
+            original_filename=original_filename,
+            title=title or original_filename,
+            filepath=blob.filepath,
+            file_size=blob.file_size,
+            content_hash=content_hash,
+            mime_type=content_type,
+            category=category,
+            subcategory=subcategory,
+            tags=tag_objs
+        )
+        
+        if donor:
+            video.duration = donor.duration
+            video.mime_type = donor.mime_type
+            # Дубликат AVI, который уже сконвертирован в MP4
+            video.filename = Path(filename).with_suffix(Path(blob.filepath).suffix).name
+        
+        db.add(video)
+        await db.commit()
+    except BaseException:
+        # Ссылка на blob не сохранилась: загруженный файл возвращается на место upload_path
+        await db.rollback()
+        if not duplicate:
+            restore_blob_source(blob, upload_path)
+        raise
+    
+    if duplicate:
+        upload_path.unlink(missing_ok=True)
     await db.refresh(video)
+    index_tags(tag_objs)
     
-    try:
-        thumbnail_dir = Path(settings.UPLOAD_DIR) / "thumbnails"
-        thumbnail_dir.mkdir(parents=True, exist_ok=True)
-        thumbnail_path = thumbnail_dir / f"{video.id}.jpg"
-        logger.debug(f"Generating thumbnail at: {thumbnail_path}")
-        await ffmpeg_service.generate_thumbnail(str(upload_path), str(thumbnail_path))
-        logger.debug("Thumbnail generated successfully")
-    except Exception as e:
-        logger.error(f"Thumbnail generation error: {str(e)}")
-        # Don't fail if thumbnail generation fails
-        pass
+    if donor:
+        clone_video_artifacts(donor, video)
+        await db.commit()
+        logger.debug(f"Video {video.id} is a duplicate of video {donor.id}, processing skipped")
+        return VideoUploadResult.model_validate(video)
     
-    # Конвертируем AVI в MP4 для лучшей совместимости с браузерами
-    if file.filename.lower().endswith('.avi'):
-        try:
-            mp4_filename = unique_filename.replace('.avi', '.mp4')
-            mp4_path = os.path.join(settings.UPLOAD_DIR, mp4_filename)
-            
-            logger.debug(f"Converting AVI to MP4: {upload_path} -> {mp4_path}")
-            
-            cmd = [
-                settings.FFMPEG_PATH,
-                "-y",
-                "-i", str(upload_path),
-                "-c:v", "libx264",
-                "-c:a", "aac", 
-                "-preset", "medium",
-                mp4_path
-            ]
-            
-            process = await asyncio.create_subprocess_exec(*cmd)
-            await process.wait()
-            
-            if process.returncode == 0:
-                # Обновляем запись в базе данных
-                video.filepath = f"static/uploads/{mp4_filename}"
-                video.filename = mp4_filename
-                video.mime_type = "video/mp4"
-                await db.commit()
-                logger.debug(f"Successfully converted to MP4: {mp4_filename}")
-                
-                # Удаляем исходный AVI файл
-                os.remove(upload_path)
-                logger.debug(f"Removed original AVI file: {upload_path}")
-            else:
-                logger.error("MP4 conversion failed")
-        except Exception as e:
-            logger.error(f"AVI to MP4 conversion error: {str(e)}")
-            # Don't fail upload if conversion fails
+    # FFprobe, превью и конвертация AVI выполняются в фоне,
+    # duration заполнится, когда задача завершится
+    job = await job_queue.enqueue(db, INGEST_VIDEO, {"video_id": video.id})
+    logger.debug(f"Queued ingest job {job.id} for video {video.id}")
     
-    return video
+    return VideoUploadResult.model_validate(video).model_copy(update={"job_id": job.id})
 
 @router.get("/", response_model=List[VideoSchema])
 async def get_videos(
-    skip: int = 0,
-    limit: int = 100,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
     category: Optional[str] = None,
     subcategory: Optional[str] = None,
+    skip: int = Query(0, ge=0, deprecated=True),
     db: AsyncSession = Depends(get_db)
 ):
+    """Newest first. The next page is requested with the cursor from the X-Next-Cursor header"""
     query = select(Video)
     
     if category:
@@ -159,10 +183,18 @@ async def get_videos(
     if subcategory:
         query = query.where(Video.subcategory == subcategory)
     
-    query = query.offset(skip).limit(limit).order_by(Video.created_at.desc())
+    if cursor:
+        query = query.where(
+            after_cursor((Video.created_at, Video.id), decode_cursor(cursor, (datetime, int)), descending=True)
+        )
+    elif skip:
+        query = query.offset(skip)
+    
+    query = query.order_by(Video.created_at.desc(), Video.id.desc()).limit(limit + 1)
     
     result = await db.execute(query)
-    videos = result.scalars().all()
+    videos, next_cursor = split_page(result.scalars().all(), limit, lambda v: (v.created_at, v.id))
+    set_next_cursor(response, next_cursor)
     
     return videos
 
@@ -202,6 +234,25 @@ async def update_video(
     
     return video
 
+@router.post("/{video_id}/hls")
+async def package_video_hls(video_id: int, db: AsyncSession = Depends(get_db)):
+    """Queue (re)packaging of the video into adaptive HLS renditions"""
+    result = await db.execute(select(Video).where(Video.id == video_id))
+    video = result.scalar_one_or_none()
+    
+    if not video:
+        raise HTTPException(status_code=404, detail="Video not found")
+    
+    if not video.filepath or not os.path.exists(video.filepath):
+        raise HTTPException(status_code=400, detail="Source video file not found")
+    
+    if video.hls_status == "processing":
+        raise HTTPException(status_code=409, detail="HLS packaging is already in progress")
+    
+    job = await enqueue_hls_packaging(db, video)
+    
+    return {"job_id": job.id}
+
 @router.delete("/{video_id}")
 async def delete_video(video_id: int, db: AsyncSession = Depends(get_db)):
     result = await db.execute(
@@ -214,12 +265,8 @@ async def delete_video(video_id: int, db: AsyncSession = Depends(get_db)):
     if not video:
         raise HTTPException(status_code=404, detail="Video not found")
     
-    # Delete source video file if exists
-    if video.filepath and os.path.exists(video.filepath):
-        try:
-            os.remove(video.filepath)
-        except Exception as e:
-            logger.warning(f"Could not delete video file: {e}")
+    # Source file is shared between duplicate uploads, it is removed with the last reference
+    source_path = await release_video_source(db, video)
     
     # Delete thumbnail if exists
     thumbnail_path = Path(settings.UPLOAD_DIR) / f"thumbnails/{video.id}.jpg"
@@ -229,9 +276,15 @@ async def delete_video(video_id: int, db: AsyncSession = Depends(get_db)):
         except Exception as e:
             logger.warning(f"Could not delete thumbnail: {e}")
     
+    # Delete HLS renditions if packaged
+    shutil.rmtree(hls_dir(video.id), ignore_errors=True)
+    
+    delete_keyframe_index(video.id)
+    
     # Delete fragment video files
     if video.fragments:
         for fragment in video.fragments:
+            fragment_cache.invalidate(fragment.id)
             if fragment.video_filepath:
                 fragment_path = Path(settings.UPLOAD_DIR) / fragment.video_filepath.replace("uploads/", "")
                 if fragment_path.exists():
@@ -243,6 +296,12 @@ async def delete_video(video_id: int, db: AsyncSession = Depends(get_db)):
     await db.delete(video)
     await db.commit()
     
+    if source_path and source_path.exists():
+        try:
+            source_path.unlink()
+        except Exception as e:
+            logger.warning(f"Could not delete video file: {e}")
+    
     return {"message": "Video deleted successfully"}
 
 @router.delete("/{video_id}/source")
@@ -252,7 +311,11 @@ async def delete_source_video(
     db: AsyncSession = Depends(get_db)
 ):
     """Delete only the source video file, keeping the record and fragments in archive"""
-    result = await db.execute(select(Video).where(Video.id == video_id))
+    result = await db.execute(
+        select(Video)
+        .options(selectinload(Video.fragments))
+        .where(Video.id == video_id)
+    )
     video = result.scalar_one_or_none()
     
     if not video:
@@ -261,71 +324,79 @@ async def delete_source_video(
     if not video.filepath:
         return {"message": "No source file to delete"}
     
-    file_deleted = False
+    # Виртуальные фрагменты без исходника не воспроизвести: сначала вырезаем их файлы
+    virtual_fragments = [fragment for fragment in video.fragments if fragment.is_virtual]
+    if virtual_fragments and os.path.exists(video.filepath):
+        # Один проход по исходнику на все фрагменты, как в EXTRACT_FRAGMENTS
+        try:
+            await materialize_fragments(virtual_fragments, video)
+        except Exception as e:
+            logger.error(f"Could not materialize fragments of video {video.id}: {str(e)}")
+            raise HTTPException(
+                status_code=500,
+                detail="Failed to save fragment files, source video was not deleted"
+            )
+        for fragment in virtual_fragments:
+            fragment_cache.invalidate(fragment.id)
+        await db.commit()
     
     try:
-        if os.path.exists(video.filepath):
-            if force:
-                # Force mode: try multiple times with delays
-                for attempt in range(5):
-                    try:
-                        os.remove(video.filepath)
-                        file_deleted = True
-                        break
-                    except PermissionError:
-                        if attempt < 4:  # Not the last attempt
-                            logger.info(f"Attempt {attempt + 1} failed, retrying in 1 second...")
-                            import asyncio
-                            await asyncio.sleep(1)
-                        else:
-                            logger.warning(f"Could not delete file after 5 attempts, marking as deleted in database")
-                            # Rename file to mark it for deletion
-                            try:
-                                temp_path = video.filepath + ".deleted"
-                                os.rename(video.filepath, temp_path)
-                                file_deleted = True
-                            except:
-                                pass
-            else:
-                # Normal mode: single attempt
-                os.remove(video.filepath)
-                file_deleted = True
-        else:
-            file_deleted = True  # File already doesn't exist
-        
-        # Update database regardless of file deletion success
+        # Другие видео с тем же содержимым продолжают пользоваться файлом
+        source_path = await release_video_source(db, video)
         video.filepath = None
         video.file_size = 0
         video.updated_at = datetime.utcnow()
         await db.commit()
         await db.refresh(video)
-        
-        if file_deleted:
-            return {"message": "Source video file deleted. Video record and fragments kept in archive."}
-        else:
-            return {"message": "Video marked as deleted in database. File will be removed when no longer in use."}
-    
-    except PermissionError:
-        raise HTTPException(
-            status_code=409, 
-            detail="The file is currently in use by another process. Use force=true parameter or close the video player and try again."
-        )
-    
     except Exception as e:
-        logger.error(f"Error deleting file: {str(e)}")
+        logger.error(f"Error releasing source file: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to delete the file")
-
-@router.post("/search", response_model=List[VideoWithTags])
-async def search_videos(search: SearchQuery, db: AsyncSession = Depends(get_db)):
-    query = select(Video).options(selectinload(Video.tags), selectinload(Video.fragments))
     
+    # Файл удаляется после commit: повторные попытки не держат транзакцию и очередь писателей
+    file_deleted = True
+    if source_path and source_path.exists():
+        file_deleted = await _remove_file(source_path, attempts=5 if force else 1)
+    
+    if file_deleted:
+        return {"message": "Source video file deleted. Video record and fragments kept in archive."}
+    else:
+        return {"message": "Video marked as deleted in database. File will be removed when no longer in use."}
+
+async def _remove_file(path: Path, attempts: int) -> bool:
+    """Удаляет файл, занятый другим процессом (Windows), за несколько попыток с паузой"""
+    for attempt in range(attempts):
+        try:
+            os.remove(path)
+            return True
+        except PermissionError:
+            if attempt < attempts - 1:
+                logger.info(f"Attempt {attempt + 1} failed, retrying in 1 second...")
+                await asyncio.sleep(1)
+    
+    logger.warning(f"Could not delete {path} after {attempts} attempts, renaming it for later removal")
+    try:
+        # Rename file to mark it for deletion
+        os.rename(path, str(path) + ".deleted")
+        return True
+    except OSError:
+        return False
+
+def apply_search_filters(query, search: SearchQuery):
+    """Search filters over Video; a full-text query also returns the joined FTS hits"""
     conditions = []
+    hits = None
     
     if search.query:
-        conditions.append(or_(
-            Video.title.ilike(f"%{search.query}%"),
-            Video.original_filename.ilike(f"%{search.query}%")
-        ))
+        match = match_expression(search.query)
+        if match is not None:
+            hits = search_subquery("videos_fts", match)
+            query = query.join(hits, hits.c.id == Video.id)
+        else:
+            # Short queries (and databases without FTS5) fall back to a LIKE scan
+            conditions.append(or_(
+                Video.title.ilike(f"%{search.query}%"),
+                Video.original_filename.ilike(f"%{search.query}%")
+            ))
     
     if search.category:
         conditions.append(Video.category == search.category)
@@ -340,13 +411,87 @@ async def search_videos(search: SearchQuery, db: AsyncSession = Depends(get_db))
         conditions.append(Video.created_at <= search.date_to)
     
     if search.tags:
-        query = query.join(video_tags).join(Tag)
-        conditions.append(Tag.name.in_(search.tags))
+        # EXISTS instead of a join: a video with several matching tags is returned once
+        conditions.append(Video.tags.any(Tag.name.in_(search.tags)))
     
     if conditions:
         query = query.where(and_(*conditions))
     
-    result = await db.execute(query.order_by(Video.created_at.desc()))
-    videos = result.scalars().unique().all()
+    return query, hits
+
+# Колонки карточки видео в результатах поиска (см. VideoSummary)
+SUMMARY_COLUMNS = (
+    Video.id, Video.title, Video.original_filename, Video.duration,
+    Video.category, Video.subcategory, Video.hls_status, Video.created_at
+)
+
+@router.post("/search", response_model=List[VideoSearchResult])
+async def search_videos(
+    search: SearchQuery,
+    response: Response,
+    expand: Optional[Literal["fragments"]] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Best matches first for a text query, newest first otherwise; paginated by X-Next-Cursor.
+    Results are slim cards with a fragment count; ?expand=fragments also loads the fragments
+    """
+    fragment_count = (
+        select(func.count(Fragment.id))
+        .where(Fragment.video_id == Video.id)
+        .correlate(Video)
+        .scalar_subquery()
+        .label("fragment_count")
+    )
+    query = (
+        select(Video, fragment_count)
+        .options(
+            load_only(*SUMMARY_COLUMNS),
+            selectinload(Video.tags),
+            selectinload(Video.fragments) if expand == "fragments" else noload(Video.fragments)
+        )
+    )
     
-    return videos
+    query, hits = apply_search_filters(query, search)
+    if hits is not None:
+        query = query.add_columns(hits.c.snippet, hits.c.rank)
+    
+    if hits is None:
+        if search.cursor:
+            query = query.where(after_cursor(
+                (Video.created_at, Video.id), decode_cursor(search.cursor, (datetime, int)), descending=True
+            ))
+        query = query.order_by(Video.created_at.desc(), Video.id.desc()).limit(search.limit + 1)
+        result = await db.execute(query)
+        rows, next_cursor = split_page(result.all(), search.limit, lambda row: (row[0].created_at, row[0].id))
+    else:
+        if search.cursor:
+            query = query.where(after_cursor((hits.c.rank, Video.id), decode_cursor(search.cursor, (float, int))))
+        result = await db.execute(query.order_by(hits.c.rank, Video.id).limit(search.limit + 1))
+        rows, next_cursor = split_page(result.all(), search.limit, lambda row: (row.rank, row[0].id))
+    
+    set_next_cursor(response, next_cursor)
+    return [
+        VideoSearchResult.model_validate(row[0]).model_copy(update={
+            "fragment_count": row.fragment_count,
+            "snippet": row.snippet if hits is not None else None
+        })
+        for row in rows
+    ]
+
+@router.post("/facets", response_model=SearchFacets)
+async def search_video_facets(
+    search: SearchQuery,
+    tag_limit: int = Query(50, ge=1, le=500),
+    db: AsyncSession = Depends(get_db)
+):
+    """Video counts by tag, category and subcategory for the same filter as /videos/search"""
+    has_filter = any([
+        search.query, search.category, search.subcategory, search.tags, search.date_from, search.date_to
+    ])
+    if not has_filter:
+        # Весь архив: готовые счетчики, без обхода связей
+        return await search_facets(db, tag_limit=tag_limit)
+    
+    matched, _ = apply_search_filters(select(Video.id), search)
+    return await search_facets(db, matched.subquery(), tag_limit=tag_limit)
@@ -7,6 +7,7 @@ from database import get_db
 from models import User
 from schemas import User as UserSchema
 from routers.auth import get_current_active_user
+from services.user_cache import user_cache
 from services.yandex_disk import (
     YandexDiskService, 
     get_yandex_oauth_url, 
@@ -21,6 +22,14 @@ YANDEX_CLIENT_ID = settings.YANDEX_CLIENT_ID if hasattr(settings, 'YANDEX_CLIENT
 YANDEX_CLIENT_SECRET = settings.YANDEX_CLIENT_SECRET if hasattr(settings, 'YANDEX_CLIENT_SECRET') else "your_client_secret"
 REDIRECT_URI = settings.YANDEX_REDIRECT_URI if hasattr(settings, 'YANDEX_REDIRECT_URI') else "http://localhost:3000/yandex/callback"
 
+async def _load_user(db: AsyncSession, current_user: User) -> User:
+    """Пользователь в сессии запроса, для изменения"""
+    user = await db.get(User, current_user.id)
+    if user is None:
+        user_cache.invalidate(current_user.id)
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+    return user
+
 @router.get("/auth-url")
 async def get_auth_url(current_user: User = Depends(get_current_active_user)):
     """Получить URL для авторизации в Яндекс"""
@@ -46,18 +55,20 @@ async def connect_yandex_disk(
             detail="Invalid authorization code"
         )
     
-    # Сохраняем токен
-    current_user.yandex_disk_token = token_data.get("access_token")
-    current_user.yandex_disk_refresh_token = token_data.get("refresh_token")
+    # Сохраняем токен (current_user из кэша не привязан к сессии, поэтому перечитываем)
+    user = await _load_user(db, current_user)
+    user.yandex_disk_token = token_data.get("access_token")
+    user.yandex_disk_refresh_token = token_data.get("refresh_token")
     expires_in = token_data.get("expires_in", 3600)
     from datetime import datetime, timedelta
-    current_user.yandex_disk_token_expires = datetime.utcnow() + timedelta(seconds=expires_in)
+    user.yandex_disk_token_expires = datetime.utcnow() + timedelta(seconds=expires_in)
     
     await db.commit()
+    user_cache.invalidate(user.id)
     
     # Создаем папку на Яндекс.Диске
-    yandex_service = YandexDiskService(current_user.yandex_disk_token)
-    await yandex_service.create_folder(current_user.yandex_disk_folder)
+    yandex_service = YandexDiskService(user.yandex_disk_token)
+    await yandex_service.create_folder(user.yandex_disk_folder)
     
     return {"message": "Yandex Disk connected successfully"}
 
@@ -67,11 +78,13 @@ async def disconnect_yandex_disk(
     db: AsyncSession = Depends(get_db)
 ):
     """Отключить Яндекс.Диск"""
-    current_user.yandex_disk_token = None
-    current_user.yandex_disk_refresh_token = None
-    current_user.yandex_disk_token_expires = None
+    user = await _load_user(db, current_user)
+    user.yandex_disk_token = None
+    user.yandex_disk_refresh_token = None
+    user.yandex_disk_token_expires = None
     
     await db.commit()
+    user_cache.invalidate(user.id)
     
     return {"message": "Yandex Disk disconnected"}
 
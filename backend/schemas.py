@@ -1,6 +1,9 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 from typing import List, Optional
 from datetime import datetime
+import json
+
+from config import settings
 
 # Auth & User schemas
 class UserBase(BaseModel):
@@ -47,6 +50,11 @@ class Tag(TagBase):
     class Config:
         from_attributes = True
 
+class TagSuggestion(BaseModel):
+    id: int
+    name: str
+    count: int  # видео + фрагменты с этим тегом
+
 class VideoBase(BaseModel):
     title: Optional[str] = None
     category: Optional[str] = None
@@ -68,16 +76,38 @@ class Video(VideoBase):
     filepath: Optional[str] = None
     file_size: int
     mime_type: str
+    hls_status: Optional[str] = None
     created_at: datetime
     updated_at: datetime
     
     class Config:
         from_attributes = True
 
+class VideoUploadResult(Video):
+    job_id: Optional[int] = None  # Задача обработки (probe, превью, конвертация)
+
 class VideoWithTags(Video):
     tags: List[Tag] = []
     fragments: List['Fragment'] = []
 
+class VideoSummary(VideoBase):
+    """Видео без технических полей: карточка в сетке результатов, ссылка из фрагмента"""
+    id: int
+    original_filename: str
+    duration: Optional[float] = None
+    hls_status: Optional[str] = None
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+class VideoSearchResult(VideoSummary):
+    tags: List[Tag] = []
+    fragment_count: int = 0
+    # Заполняется только с ?expand=fragments, иначе пустой список
+    fragments: List['Fragment'] = []
+    snippet: Optional[str] = None  # Совпадение, выделенное <mark>...</mark>
+
 class FragmentBase(BaseModel):
     name: str
     description: Optional[str] = None
@@ -86,6 +116,7 @@ class FragmentBase(BaseModel):
 
 class FragmentCreate(FragmentBase):
     tag_ids: Optional[List[int]] = []
+    virtual: Optional[bool] = None  # None - по настройке FRAGMENTS_VIRTUAL
 
 class FragmentUpdate(BaseModel):
     name: Optional[str] = None
@@ -101,17 +132,46 @@ class Fragment(FragmentBase):
     file_size: Optional[int] = None
     video_filepath: Optional[str] = None  # Путь к видеофайлу фрагмента
     video_file_size: Optional[int] = None  # Размер видеофайла
+    is_virtual: bool = False
     created_at: datetime
     
     class Config:
         from_attributes = True
 
+class FragmentCreateResult(Fragment):
+    job_id: Optional[int] = None  # Задача извлечения видеофайла фрагмента
+
 class FragmentWithTags(Fragment):
     tags: List[Tag] = []
     video: Video
 
+class FragmentSearchResult(Fragment):
+    tags: List[Tag] = []
+    video: VideoSummary
+    snippet: Optional[str] = None  # Совпадение, выделенное <mark>...</mark>
+
+class FragmentBatchCreate(BaseModel):
+    # Все невиртуальные фрагменты пачки вырезаются одним процессом FFmpeg
+    fragments: List[FragmentCreate] = Field(..., min_length=1, max_length=settings.FRAGMENT_BATCH_MAX)
+
+class ReelCreate(BaseModel):
+    # Либо явный список фрагментов (порядок сохраняется), либо теги
+    fragment_ids: Optional[List[int]] = None
+    tags: Optional[List[str]] = None
+
+class ReelResult(BaseModel):
+    key: str
+    status: str  # ready | processing
+    fragment_ids: List[int]
+    job_id: Optional[int] = None
+
+class FragmentBatchResult(BaseModel):
+    fragments: List[Fragment]
+    job_id: Optional[int] = None  # Одна задача извлечения на все невиртуальные фрагменты
+
 VideoWithTags.model_rebuild()
 FragmentWithTags.model_rebuild()
+VideoSearchResult.model_rebuild()
 
 class SearchQuery(BaseModel):
     query: Optional[str] = None
@@ -120,3 +180,85 @@ class SearchQuery(BaseModel):
     tags: Optional[List[str]] = None
     date_from: Optional[datetime] = None
     date_to: Optional[datetime] = None
+    # Keyset-пагинация: курсор из заголовка X-Next-Cursor предыдущего ответа
+    cursor: Optional[str] = None
+    limit: int = Field(100, ge=1, le=500)
+
+class TagFacet(BaseModel):
+    id: int
+    name: str
+    count: int
+
+class CategoryFacet(BaseModel):
+    value: Optional[str] = None  # None - без категории
+    count: int
+
+class SubcategoryFacet(BaseModel):
+    category: Optional[str] = None
+    value: str
+    count: int
+
+class SearchFacets(BaseModel):
+    total: int  # Сколько видео подходит под фильтр
+    tags: List[TagFacet]
+    categories: List[CategoryFacet]
+    subcategories: List[SubcategoryFacet]
+
+class BulkTagUpdate(BaseModel):
+    video_ids: List[int] = []
+    fragment_ids: List[int] = []
+    # Все видео, подходящие под фильтр поиска (cursor и limit не учитываются)
+    search: Optional[SearchQuery] = None
+    add: List[str] = []
+    remove: List[str] = []
+    # Новый список тегов целиком; вместе с add/remove не указывается
+    replace: Optional[List[str]] = None
+
+class BulkTagResult(BaseModel):
+    videos: int  # Сколько видео и фрагментов затронуто
+    fragments: int
+    added: int  # Сколько связей с тегами добавлено и удалено
+    removed: int
+
+# Resumable upload schemas
+class UploadSessionCreate(BaseModel):
+    filename: str
+    total_size: int = Field(..., gt=0)
+    content_type: Optional[str] = None
+    sha256: Optional[str] = None
+    title: Optional[str] = None
+    category: Optional[str] = None
+    subcategory: Optional[str] = None
+    tags: Optional[str] = None
+
+class UploadSessionStatus(BaseModel):
+    id: str
+    filename: str
+    total_size: int
+    received_bytes: int
+    received_ranges: List[List[int]]  # [start, end) в байтах
+    missing_ranges: List[List[int]]
+    status: str
+    video_id: Optional[int] = None
+    created_at: datetime
+
+class Job(BaseModel):
+    id: int
+    kind: str
+    status: str
+    attempts: int
+    max_attempts: int
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    progress: Optional[dict] = None  # percent, fps, speed, eta_seconds для выполняющейся задачи
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+    
+    @field_validator("result", mode="before")
+    @classmethod
+    def parse_result(cls, value):
+        return json.loads(value) if isinstance(value, str) else value
@@ -0,0 +1,130 @@
+"""
+Хранилище исходных видео по содержимому: один файл на sha256 и счетчик ссылок
+"""
+import os
+from pathlib import Path
+from typing import Optional, Tuple
+
+from sqlalchemy import select, update, delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from models import MediaBlob, Video
+
+
+def blob_path(content_hash: str, suffix: str) -> Path:
+    # Подкаталоги по первым символам хэша, чтобы не держать все файлы в одном каталоге
+    return Path(settings.BLOBS_DIR) / content_hash[:2] / f"{content_hash}{suffix.lower()}"
+
+
+async def _acquire_existing(db: AsyncSession, content_hash: str) -> Optional[MediaBlob]:
+    result = await db.execute(
+        select(MediaBlob)
+        .where(MediaBlob.content_hash == content_hash)
+        .execution_options(populate_existing=True)
+    )
+    blob = result.scalar_one_or_none()
+    if blob is None or not os.path.exists(blob.filepath):
+        return None
+
+    await db.execute(
+        update(MediaBlob)
+        .where(MediaBlob.content_hash == content_hash)
+        .values(ref_count=MediaBlob.ref_count + 1)
+    )
+    return blob
+
+
+async def store_blob(
+    db: AsyncSession,
+    content_hash: str,
+    source: Path,
+    suffix: str
+) -> Tuple[MediaBlob, bool]:
+    """
+    Берет ссылку на содержимое и помещает загруженный файл source в хранилище.
+
+    Если такое содержимое уже есть, source не трогается и возвращается
+    (blob, True): удалить его вызывающий должен после коммита. Иначе файл
+    перемещается последним шагом; если коммит не прошел, вернуть его на место
+    source можно через restore_blob_source. Вызывать до других изменений
+    в сессии: при гонке двух одинаковых загрузок сессия откатывается.
+    """
+    blob = await _acquire_existing(db, content_hash)
+    if blob is not None:
+        return blob, True
+
+    path = blob_path(content_hash, suffix)
+    file_size = source.stat().st_size
+
+    existing = await db.get(MediaBlob, content_hash)
+    if existing is not None:
+        # Запись осталась, а файл был удален вручную: восстанавливаем его из загрузки
+        existing.filepath = str(path)
+        existing.file_size = file_size
+        existing.ref_count += 1
+        await db.flush()
+        blob = existing
+    else:
+        blob = MediaBlob(
+            content_hash=content_hash,
+            filepath=str(path),
+            file_size=file_size,
+            ref_count=1
+        )
+        db.add(blob)
+        try:
+            await db.flush()
+        except IntegrityError:
+            # Тот же файл одновременно загрузили дважды, запись создал другой запрос
+            await db.rollback()
+            blob = await _acquire_existing(db, content_hash)
+            if blob is None:
+                raise
+            return blob, True
+
+    # Файл перемещается только после того, как запись прошла flush
+    path.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(source, path)
+    return blob, False
+
+
+def restore_blob_source(blob: MediaBlob, source: Path) -> None:
+    """Возвращает файл, перемещенный store_blob, на место source после отката сессии"""
+    if os.path.exists(blob.filepath):
+        os.replace(blob.filepath, source)
+
+
+async def release_blob(db: AsyncSession, content_hash: str) -> Optional[Path]:
+    """
+    Снимает одну ссылку. Если ссылок не осталось, запись удаляется и
+    возвращается путь файла: удалять его нужно после коммита.
+    """
+    await db.execute(
+        update(MediaBlob)
+        .where(MediaBlob.content_hash == content_hash)
+        .values(ref_count=MediaBlob.ref_count - 1)
+    )
+    result = await db.execute(
+        select(MediaBlob.filepath)
+        .where(MediaBlob.content_hash == content_hash, MediaBlob.ref_count <= 0)
+    )
+    filepath = result.scalar_one_or_none()
+    if filepath is None:
+        return None
+
+    await db.execute(delete(MediaBlob).where(MediaBlob.content_hash == content_hash))
+    return Path(filepath)
+
+
+async def release_video_source(db: AsyncSession, video: Video) -> Optional[Path]:
+    """
+    Отпускает исходный файл видео. Возвращает путь, который можно удалить с диска
+    (у видео, загруженных до хранилища, это их собственный файл)
+    """
+    if not video.filepath:
+        return None
+    if video.content_hash:
+        return await release_blob(db, video.content_hash)
+    return Path(video.filepath)
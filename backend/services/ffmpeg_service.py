@@ -2,14 +2,223 @@ import os
 import subprocess
 import json
 import asyncio
+import shutil
+import sys
+import tempfile
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
 from config import settings
+from services.keyframes import KEYFRAME_EPSILON, plan_smart_cut
+
+IS_WINDOWS = sys.platform == "win32"
+STDERR_TAIL_LINES = 200
+
+ProgressCallback = Callable[[Dict[str, str]], None]
+
+# Дешевые операции: ffprobe, превью, нарезка/склейка без перекодирования
+LANE_LIGHT = "light"
+# Тяжелые операции: перекодирование libx264, которое само занимает все ядра
+LANE_HEAVY = "heavy"
+
+# CRF для перекодируемых краев фрагмента при умной нарезке
+CUT_QUALITY_CRF = {"high": 18, "medium": 23, "low": 28}
+
+class ProgressParser:
+    """Собирает блоки key=value из вывода `-progress` и отдает их по строке progress=..."""
+    
+    def __init__(self, on_progress: ProgressCallback):
+        self.on_progress = on_progress
+        self.block: Dict[str, str] = {}
+    
+    def feed(self, line: str):
+        key, sep, value = line.strip().partition("=")
+        if not sep:
+            return
+        self.block[key] = value
+        if key == "progress":
+            self.on_progress(self.block)
+            self.block = {}
+
+async def _read_progress(stream: asyncio.StreamReader, on_progress: ProgressCallback) -> str:
+    parser = ProgressParser(on_progress)
+    async for line in stream:
+        parser.feed(line.decode("utf-8", errors="replace"))
+    return ""
+
+async def _read_tail(stream: asyncio.StreamReader) -> str:
+    tail = deque(maxlen=STDERR_TAIL_LINES)
+    async for line in stream:
+        tail.append(line.decode("utf-8", errors="replace"))
+    return "".join(tail)
+
+def _communicate_blocking(process: subprocess.Popen, on_progress: Optional[ProgressCallback]):
+    """Блокирующий вариант для Windows: тот же потоковый разбор, но в пуле потоков"""
+    tail = deque(maxlen=STDERR_TAIL_LINES)
+    stderr_reader = threading.Thread(target=tail.extend, args=(process.stderr,), daemon=True)
+    stderr_reader.start()
+    
+    if on_progress:
+        parser = ProgressParser(on_progress)
+        for line in process.stdout:
+            parser.feed(line)
+        stdout = ""
+    else:
+        stdout = process.stdout.read()
+    
+    process.wait()
+    stderr_reader.join()
+    return stdout, "".join(tail)
+
+class FFmpegLane:
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.semaphore = asyncio.Semaphore(limit)
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.cancelled = 0
+    
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "waiting": self.waiting,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timed_out": self.timed_out,
+            "cancelled": self.cancelled,
+        }
 
 class FFmpegService:
     def __init__(self):
         self.ffmpeg_path = "ffmpeg"
         self.ffprobe_path = "ffprobe"
+        
+        cpu_count = os.cpu_count() or 1
+        self.lanes = {
+            LANE_LIGHT: FFmpegLane(LANE_LIGHT, settings.FFMPEG_LIGHT_CONCURRENCY or cpu_count),
+            LANE_HEAVY: FFmpegLane(LANE_HEAVY, settings.FFMPEG_HEAVY_CONCURRENCY or max(1, cpu_count // 4)),
+        }
+    
+    def stats(self) -> dict:
+        """Глубина очередей и счетчики по каждой полосе планировщика"""
+        return {name: lane.stats() for name, lane in self.lanes.items()}
+    
+    @asynccontextmanager
+    async def _slot(self, lane_name: str):
+        lane = self.lanes[lane_name]
+        lane.waiting += 1
+        try:
+            await lane.semaphore.acquire()
+        finally:
+            lane.waiting -= 1
+        
+        lane.running += 1
+        try:
+            yield lane
+        finally:
+            lane.running -= 1
+            lane.semaphore.release()
+    
+    def _progress_args(self, on_progress: Optional[ProgressCallback]) -> list:
+        """Машиночитаемый прогресс в stdout вместо интерактивной статистики в stderr"""
+        if not on_progress:
+            return []
+        return ["-nostats", "-progress", "pipe:1"]
+    
+    async def _run(
+        self,
+        cmd: list,
+        lane_name: str = LANE_LIGHT,
+        timeout: Optional[float] = None,
+        on_progress: Optional[ProgressCallback] = None
+    ) -> subprocess.CompletedProcess:
+        """
+        Запускает процесс в слоте полосы lane_name.
+        
+        stderr читается потоково, хранится только хвост из STDERR_TAIL_LINES строк.
+        Если передан on_progress, stdout разбирается как вывод `-progress pipe:1`.
+        При таймауте или отмене задачи дочерний процесс убивается,
+        а не продолжает работать в фоне.
+        """
+        async with self._slot(lane_name) as lane:
+            if IS_WINDOWS:
+                # Событийный цикл Windows по умолчанию не всегда умеет subprocess
+                runner = self._run_threaded(cmd, on_progress)
+            else:
+                runner = self._run_native(cmd, on_progress)
+            
+            try:
+                result = await asyncio.wait_for(runner, timeout=timeout)
+            except asyncio.TimeoutError:
+                lane.timed_out += 1
+                raise Exception(f"{Path(cmd[0]).name} timeout after {timeout}s")
+            except asyncio.CancelledError:
+                lane.cancelled += 1
+                raise
+            
+            if result.returncode == 0:
+                lane.completed += 1
+            else:
+                lane.failed += 1
+            return result
+    
+    async def _run_native(
+        self,
+        cmd: list,
+        on_progress: Optional[ProgressCallback]
+    ) -> subprocess.CompletedProcess:
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            if on_progress:
+                stdout_reader = _read_progress(process.stdout, on_progress)
+            else:
+                stdout_reader = process.stdout.read()
+            stdout, stderr = await asyncio.gather(stdout_reader, _read_tail(process.stderr))
+            await process.wait()
+        except BaseException:
+            if process.returncode is None:
+                process.kill()
+                await asyncio.shield(process.wait())
+            raise
+        
+        if isinstance(stdout, bytes):
+            stdout = stdout.decode("utf-8", errors="replace")
+        return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+    
+    async def _run_threaded(
+        self,
+        cmd: list,
+        on_progress: Optional[ProgressCallback]
+    ) -> subprocess.CompletedProcess:
+        process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            errors="replace"
+        )
+        try:
+            stdout, stderr = await asyncio.to_thread(_communicate_blocking, process, on_progress)
+        except BaseException:
+            if process.poll() is None:
+                process.kill()
+            await asyncio.shield(asyncio.to_thread(process.wait))
+            raise
+        
+        return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
     
     async def get_video_info(self, filepath: str) -> dict:
         cmd = [
@@ -22,16 +231,9 @@ class FFmpegService:
         ]
         
         try:
-            # Run in thread pool to avoid asyncio subprocess issues on Windows
-            result = await asyncio.to_thread(
-                subprocess.run,
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
-        except subprocess.TimeoutExpired:
-            raise Exception("FFprobe timeout")
+            result = await self._run(cmd, LANE_LIGHT, timeout=30)
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
             raise Exception(f"FFprobe execution error: {str(e)}")
         
@@ -42,51 +244,294 @@ class FFmpegService:
         
         duration = float(info['format']['duration'])
         video_stream = next((s for s in info['streams'] if s['codec_type'] == 'video'), None)
+        audio_stream = next((s for s in info['streams'] if s['codec_type'] == 'audio'), None)
         
         return {
             'duration': duration,
             'width': video_stream['width'] if video_stream else None,
             'height': video_stream['height'] if video_stream else None,
             'fps': eval(video_stream['r_frame_rate']) if video_stream else None,
-            'codec': video_stream['codec_name'] if video_stream else None
+            'codec': video_stream['codec_name'] if video_stream else None,
+            'pix_fmt': video_stream.get('pix_fmt') if video_stream else None,
+            # Строки ffprobe как есть ("30000/1001", "1/90000"): сравниваются точно, без округления fps
+            'r_frame_rate': video_stream.get('r_frame_rate') if video_stream else None,
+            'time_base': video_stream.get('time_base') if video_stream else None,
+            'has_audio': audio_stream is not None,
+            'audio_codec': audio_stream['codec_name'] if audio_stream else None,
+            'sample_rate': audio_stream.get('sample_rate') if audio_stream else None,
+            'channels': audio_stream.get('channels') if audio_stream else None
         }
     
+    async def probe_keyframes(self, filepath: str) -> List[float]:
+        """
+        Времена ключевых кадров первой видеодорожки в секундах от начала файла
+        (в той же шкале, что и -ss). Читаются только заголовки пакетов, без декодирования.
+        """
+        cmd = [
+            self.ffprobe_path,
+            "-v", "error",
+            "-select_streams", "v:0",
+            "-show_entries", "packet=pts_time,flags:format=start_time",
+            "-of", "compact",
+            filepath
+        ]
+        
+        result = await self._run(cmd, LANE_LIGHT, timeout=600)
+        
+        if result.returncode != 0:
+            raise Exception(f"FFprobe error: {result.stderr}")
+        
+        keyframes = []
+        start_time = 0.0
+        for line in result.stdout.splitlines():
+            section, _, fields = line.partition("|")
+            values = dict(field.partition("=")[::2] for field in fields.split("|"))
+            if section == "packet":
+                if "K" in values.get("flags", "") and values.get("pts_time") not in (None, "", "N/A"):
+                    keyframes.append(float(values["pts_time"]))
+            elif section == "format" and values.get("start_time") not in (None, "", "N/A"):
+                start_time = float(values["start_time"])
+        
+        return sorted(max(0.0, t - start_time) for t in keyframes)
+    
     async def extract_fragment(
         self,
         input_path: str,
         output_path: str,
         start_time: float,
         end_time: float,
-        quality: str = "high"
+        quality: str = "high",
+        on_progress: Optional[ProgressCallback] = None,
+        keyframes: Optional[Sequence[float]] = None,
+        pix_fmt: Optional[str] = None
     ) -> str:
-        duration = end_time - start_time
+        """
+        Вырезает [start_time, end_time) из input_path.
         
-        output_dir = Path(output_path).parent
-        output_dir.mkdir(parents=True, exist_ok=True)
+        Без индекса ключевых кадров поток копируется целиком (быстро, но начало
+        съезжает на предыдущий ключевой кадр). С индексом - умная нарезка:
+        середина копируется, неполные GOP по краям перекодируются, так что
+        фрагмент точен до кадра. Индекс имеет смысл передавать только для H.264.
+        """
+        outputs = await self.extract_fragments(
+            input_path,
+            [(output_path, start_time, end_time)],
+            quality=quality,
+            on_progress=on_progress,
+            keyframes=keyframes,
+            pix_fmt=pix_fmt
+        )
+        return outputs[0]
+    
+    async def extract_fragments(
+        self,
+        input_path: str,
+        cuts: List[Tuple[str, float, float]],
+        quality: str = "high",
+        on_progress: Optional[ProgressCallback] = None,
+        keyframes: Optional[Sequence[float]] = None,
+        pix_fmt: Optional[str] = None
+    ) -> List[str]:
+        """
+        Вырезает несколько отрезков (output_path, start, end) из одного видео.
         
-        cmd = [
-            self.ffmpeg_path,
-            "-y",
-            "-ss", str(start_time),
-            "-i", input_path,
-            "-t", str(duration),
-            "-c", "copy",
-            "-avoid_negative_ts", "1",
-            output_path
-        ]
+        Число запусков FFmpeg не зависит от числа отрезков: все отрезки одного
+        этапа - это входы и выходы одного процесса, каждый вход читает только
+        свой диапазон исходного файла.
+        """
+        for output_path, _, _ in cuts:
+            Path(output_path).parent.mkdir(parents=True, exist_ok=True)
         
-        result = await asyncio.to_thread(
-            subprocess.run,
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=300
-        )
+        if keyframes:
+            await self._smart_cut(input_path, cuts, keyframes, quality, pix_fmt, on_progress)
+            return [output_path for output_path, _, _ in cuts]
+        
+        # Длительность задается и на входе (с запасом, чтобы не читать файл до конца),
+        # и на выходе (точная граница)
+        cmd = [self.ffmpeg_path, "-y", *self._progress_args(on_progress)]
+        for _, start_time, end_time in cuts:
+            cmd += ["-ss", str(start_time), "-t", str(end_time - start_time + 1), "-i", input_path]
+        for index, (output_path, start_time, end_time) in enumerate(cuts):
+            cmd += [
+                "-map", f"{index}:v:0",
+                "-map", f"{index}:a:0?",
+                "-t", str(end_time - start_time),
+                "-c", "copy",
+                "-avoid_negative_ts", "1",
+                output_path
+            ]
+        
+        result = await self._run(cmd, LANE_LIGHT, timeout=300 * len(cuts), on_progress=on_progress)
         
         if result.returncode != 0:
             raise Exception(f"FFmpeg error: {result.stderr}")
         
-        return output_path
+        return [output_path for output_path, _, _ in cuts]
+    
+    async def _smart_cut(
+        self,
+        input_path: str,
+        cuts: List[Tuple[str, float, float]],
+        keyframes: Sequence[float],
+        quality: str,
+        pix_fmt: Optional[str],
+        on_progress: Optional[ProgressCallback]
+    ):
+        """
+        Умная нарезка в три запуска FFmpeg на любое число отрезков:
+        
+        1. копируемые середины всех отрезков: пересекающиеся диапазоны
+           читаются одним входом и режутся segment-муксером по ключевым кадрам
+           на куски, общие для всех отрезков;
+        2. неполные GOP по краям перекодируются, у них свои SPS/PPS с id=1
+           внутри потока, чтобы не конфликтовать с параметрами исходника;
+        3. куски каждого отрезка склеиваются concat-демультиплексором без
+           перекодирования, звук берется из исходника одним куском и
+           перекодируется в AAC - это дешево и не дает щелчков на стыках.
+        """
+        plans = [plan_smart_cut(keyframes, start, end) for _, start, end in cuts]
+        timeout = 300 * len(cuts)
+        work_dir = Path(tempfile.mkdtemp(prefix="cut_", dir=Path(cuts[0][0]).parent))
+        
+        try:
+            chunks = await self._copy_keyframe_chunks(input_path, plans, work_dir, timeout)
+            edges = await self._encode_edges(input_path, plans, work_dir, quality, pix_fmt, timeout)
+            
+            cmd = [self.ffmpeg_path, "-y", *self._progress_args(on_progress)]
+            for index, ((_, start_time, end_time), plan) in enumerate(zip(cuts, plans)):
+                concat_file = work_dir / f"parts_{index}.txt"
+                with open(concat_file, "w") as f:
+                    for segment_start, segment_end, copy in plan:
+                        if copy:
+                            for chunk_path in chunks[(segment_start, segment_end)]:
+                                f.write(f"file '{chunk_path.name}'\n")
+                        else:
+                            f.write(f"file '{edges[(segment_start, segment_end)].name}'\n")
+                cmd += [
+                    "-f", "concat",
+                    "-safe", "0",
+                    "-i", str(concat_file),
+                    "-ss", f"{start_time:.6f}",
+                    "-t", f"{end_time - start_time:.6f}",
+                    "-i", input_path
+                ]
+            for index, (output_path, _, _) in enumerate(cuts):
+                cmd += [
+                    "-map", f"{2 * index}:v:0",
+                    "-map", f"{2 * index + 1}:a:0?",
+                    "-c:v", "copy",
+                    "-c:a", "aac",
+                    "-b:a", "192k",
+                    output_path
+                ]
+            
+            result = await self._run(cmd, LANE_LIGHT, timeout=timeout, on_progress=on_progress)
+            if result.returncode != 0:
+                raise Exception(f"FFmpeg error: {result.stderr}")
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    
+    async def _copy_keyframe_chunks(
+        self,
+        input_path: str,
+        plans: List[List[Tuple[float, float, bool]]],
+        work_dir: Path,
+        timeout: float
+    ) -> Dict[Tuple[float, float], List[Path]]:
+        """
+        Копирует середины отрезков кусками от ключевого кадра до ключевого кадра.
+        Возвращает для каждого копируемого диапазона список его кусков по порядку.
+        """
+        ranges = sorted({(start, end) for plan in plans for start, end, copy in plan if copy})
+        if not ranges:
+            return {}
+        
+        # Пересекающиеся и смежные диапазоны читаются одним входом
+        clusters = []
+        for start, end in ranges:
+            if clusters and start <= clusters[-1][-1][1]:
+                clusters[-1].append((start, end))
+            else:
+                clusters.append([(start, end)])
+        
+        cmd = [self.ffmpeg_path, "-y"]
+        outputs = []
+        chunks = {}
+        for index, cluster in enumerate(clusters):
+            bounds = sorted({t for start, end in cluster for t in (start, end)})
+            first = bounds[0]
+            # Поиск чуть дальше ключевого кадра, чтобы не соскочить на предыдущий GOP;
+            # режет segment-муксер ровно по ключевым кадрам (-t при копировании
+            # считается по dts и захватил бы лишние кадры, поэтому берем с запасом)
+            cmd += [
+                "-ss", f"{first + KEYFRAME_EPSILON:.6f}",
+                "-t", f"{bounds[-1] - first + 1:.6f}",
+                "-i", input_path
+            ]
+            outputs += [
+                "-map", f"{index}:v:0",
+                "-c:v", "copy",
+                "-bsf:v", "h264_mp4toannexb",
+                "-avoid_negative_ts", "make_zero",
+                "-f", "segment",
+                "-segment_format", "mp4",
+                "-segment_times", ",".join(f"{t - first - KEYFRAME_EPSILON:.6f}" for t in bounds[1:]),
+                str(work_dir / f"chunk_{index}_%d.mp4")
+            ]
+            
+            chunk_paths = [work_dir / f"chunk_{index}_{n}.mp4" for n in range(len(bounds) - 1)]
+            for start, end in cluster:
+                chunks[(start, end)] = chunk_paths[bounds.index(start):bounds.index(end)]
+        
+        result = await self._run(cmd + outputs, LANE_LIGHT, timeout=timeout)
+        if result.returncode != 0:
+            raise Exception(f"FFmpeg error: {result.stderr}")
+        
+        return chunks
+    
+    async def _encode_edges(
+        self,
+        input_path: str,
+        plans: List[List[Tuple[float, float, bool]]],
+        work_dir: Path,
+        quality: str,
+        pix_fmt: Optional[str],
+        timeout: float
+    ) -> Dict[Tuple[float, float], Path]:
+        """
+        Перекодирует неполные GOP; каждый не длиннее интервала между ключевыми кадрами.
+        Это кодирование libx264, поэтому идет в тяжелой полосе
+        """
+        ranges = sorted({(start, end) for plan in plans for start, end, copy in plan if not copy})
+        if not ranges:
+            return {}
+        
+        cmd = [self.ffmpeg_path, "-y"]
+        for start, end in ranges:
+            cmd += ["-ss", f"{start:.6f}", "-t", f"{end - start + 1:.6f}", "-i", input_path]
+        
+        edges = {}
+        for index, (start, end) in enumerate(ranges):
+            edge_path = work_dir / f"edge_{index}.mp4"
+            cmd += [
+                "-map", f"{index}:v:0",
+                "-t", f"{end - start:.6f}",
+                "-c:v", "libx264",
+                "-x264-params", "sps-id=1",
+                "-preset", "veryfast",
+                "-crf", str(CUT_QUALITY_CRF.get(quality, CUT_QUALITY_CRF["high"])),
+                "-pix_fmt", pix_fmt or "yuv420p",
+                "-fps_mode", "passthrough",
+                "-bsf:v", "h264_mp4toannexb",
+                str(edge_path)
+            ]
+            edges[(start, end)] = edge_path
+        
+        result = await self._run(cmd, LANE_HEAVY, timeout=timeout)
+        if result.returncode != 0:
+            raise Exception(f"FFmpeg error: {result.stderr}")
+        
+        return edges
     
     async def generate_thumbnail(
         self,
@@ -110,12 +555,36 @@ class FFmpegService:
             output_path
         ]
         
-        result = await asyncio.to_thread(
-            subprocess.run,
+        result = await self._run(cmd, LANE_LIGHT, timeout=60)
+        
+        if result.returncode != 0:
+            raise Exception(f"FFmpeg error: {result.stderr}")
+        
+        return output_path
+    
+    async def transcode_to_mp4(
+        self,
+        input_path: str,
+        output_path: str,
+        preset: str = "medium",
+        on_progress: Optional[ProgressCallback] = None
+    ) -> str:
+        cmd = [
+            self.ffmpeg_path,
+            "-y",
+            *self._progress_args(on_progress),
+            "-i", input_path,
+            "-c:v", "libx264",
+            "-c:a", "aac",
+            "-preset", preset,
+            output_path
+        ]
+        
+        result = await self._run(
             cmd,
-            capture_output=True,
-            text=True,
-            timeout=60
+            LANE_HEAVY,
+            timeout=settings.FFMPEG_TRANSCODE_TIMEOUT,
+            on_progress=on_progress
         )
         
         if result.returncode != 0:
@@ -123,39 +592,198 @@ class FFmpegService:
         
         return output_path
     
-    async def concat_fragments(
+    async def package_hls(
         self,
-        fragment_paths: list,
-        output_path: str
+        input_path: str,
+        output_dir: str,
+        renditions: List[Tuple[int, str]],
+        has_audio: bool = True,
+        segment_seconds: int = 6,
+        on_progress: Optional[ProgressCallback] = None
     ) -> str:
-        concat_file = "/tmp/concat_list.txt"
-        with open(concat_file, "w") as f:
-            for path in fragment_paths:
-                f.write(f"file '{path}'\n")
+        """
+        Упаковывает видео в HLS: по одной медиаплейлисте v<N>/index.m3u8 на
+        каждую пару (высота, битрейт) и общий master.m3u8. Ключевые кадры
+        принудительно ставятся на границы сегментов, чтобы все варианты
+        переключались синхронно.
+        """
+        output = Path(output_dir)
+        output.mkdir(parents=True, exist_ok=True)
+        
+        split = f"[0:v]split={len(renditions)}" + "".join(f"[s{i}]" for i in range(len(renditions)))
+        scales = [f"[s{i}]scale=-2:{height}[v{i}]" for i, (height, _) in enumerate(renditions)]
         
         cmd = [
             self.ffmpeg_path,
             "-y",
-            "-f", "concat",
-            "-safe", "0",
-            "-i", concat_file,
-            "-c", "copy",
-            output_path
+            *self._progress_args(on_progress),
+            "-i", input_path,
+            "-filter_complex", ";".join([split] + scales)
+        ]
+        
+        stream_map = []
+        for i, (height, bitrate) in enumerate(renditions):
+            cmd += [
+                "-map", f"[v{i}]",
+                f"-b:v:{i}", bitrate,
+                f"-maxrate:v:{i}", bitrate,
+                f"-bufsize:v:{i}", bitrate,
+            ]
+            if has_audio:
+                cmd += ["-map", "a:0"]
+                stream_map.append(f"v:{i},a:{i}")
+            else:
+                stream_map.append(f"v:{i}")
+        
+        cmd += [
+            "-c:v", "libx264",
+            "-preset", "veryfast",
+            "-sc_threshold", "0",
+            "-force_key_frames", f"expr:gte(t,n_forced*{segment_seconds})",
         ]
+        if has_audio:
+            cmd += ["-c:a", "aac", "-b:a", "128k", "-ac", "2"]
         
-        result = await asyncio.to_thread(
-            subprocess.run,
+        cmd += [
+            "-f", "hls",
+            "-hls_time", str(segment_seconds),
+            "-hls_playlist_type", "vod",
+            "-hls_flags", "independent_segments",
+            "-hls_segment_filename", str(output / "v%v" / "seg_%05d.ts"),
+            "-master_pl_name", "master.m3u8",
+            "-var_stream_map", " ".join(stream_map),
+            str(output / "v%v" / "index.m3u8")
+        ]
+        
+        result = await self._run(
             cmd,
-            capture_output=True,
-            text=True,
-            timeout=300
+            LANE_HEAVY,
+            timeout=settings.FFMPEG_TRANSCODE_TIMEOUT,
+            on_progress=on_progress
         )
         
-        os.remove(concat_file)
+        if result.returncode != 0:
+            raise Exception(f"FFmpeg error: {result.stderr}")
+        
+        return str(output / "master.m3u8")
+    
+    async def concat_fragments(
+        self,
+        fragment_paths: list,
+        output_path: str,
+        on_progress: Optional[ProgressCallback] = None
+    ) -> bool:
+        """
+        Склеивает файлы в один ролик. Если кодеки и параметры потоков у всех
+        файлов совпадают, склеивает без перекодирования через concat-демультиплексор,
+        иначе приводит все к параметрам первого файла и перекодирует.
+        Возвращает True, если понадобилось перекодирование.
+        """
+        output_dir = Path(output_path).parent
+        output_dir.mkdir(parents=True, exist_ok=True)
+        
+        infos = await asyncio.gather(*(self.get_video_info(path) for path in fragment_paths))
+        
+        if self._concat_compatible(infos):
+            # Свой список на каждый вызов: параллельные склейки не мешают друг другу
+            fd, concat_file = tempfile.mkstemp(prefix="concat_", suffix=".txt", dir=output_dir)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                for path in fragment_paths:
+                    escaped = str(Path(path).resolve()).replace("'", "'\\''")
+                    f.write(f"file '{escaped}'\n")
+            
+            cmd = [
+                self.ffmpeg_path,
+                "-y",
+                *self._progress_args(on_progress),
+                "-f", "concat",
+                "-safe", "0",
+                "-i", concat_file,
+                "-map", "0:v:0",
+                "-map", "0:a:0?",
+                "-c", "copy",
+                output_path
+            ]
+            
+            try:
+                result = await self._run(cmd, LANE_LIGHT, timeout=300 * len(fragment_paths), on_progress=on_progress)
+            finally:
+                os.remove(concat_file)
+            normalized = False
+        else:
+            cmd = self._normalize_concat_cmd(fragment_paths, infos, output_path, on_progress)
+            result = await self._run(
+                cmd,
+                LANE_HEAVY,
+                timeout=settings.FFMPEG_TRANSCODE_TIMEOUT,
+                on_progress=on_progress
+            )
+            normalized = True
         
         if result.returncode != 0:
             raise Exception(f"FFmpeg error: {result.stderr}")
         
-        return output_path
+        return normalized
+    
+    @staticmethod
+    def _concat_compatible(infos: List[dict]) -> bool:
+        """Совпадают ли параметры, без которых склейка копированием дает битый поток"""
+        # При разной частоте кадров или шкале времени copy-склейка дает скачки timestamps
+        video_keys = ('codec', 'width', 'height', 'pix_fmt', 'r_frame_rate', 'time_base')
+        audio_keys = ('has_audio', 'audio_codec', 'sample_rate', 'channels')
+        first = infos[0]
+        return all(
+            all(info.get(key) == first.get(key) for key in video_keys + audio_keys)
+            for info in infos[1:]
+        )
+    
+    def _normalize_concat_cmd(
+        self,
+        fragment_paths: list,
+        infos: List[dict],
+        output_path: str,
+        on_progress: Optional[ProgressCallback]
+    ) -> list:
+        """Команда склейки через фильтр concat с приведением к размеру и fps первого файла"""
+        width = infos[0]['width'] or 1280
+        height = infos[0]['height'] or 720
+        width, height = width - width % 2, height - height % 2
+        fps = infos[0]['fps'] or 25
+        
+        cmd = [self.ffmpeg_path, "-y", *self._progress_args(on_progress)]
+        for path in fragment_paths:
+            cmd += ["-i", path]
+        
+        filters = []
+        streams = []
+        silence_index = len(fragment_paths)
+        for index, info in enumerate(infos):
+            filters.append(
+                f"[{index}:v:0]scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,fps={fps},format=yuv420p[v{index}]"
+            )
+            if info['has_audio']:
+                audio_input = f"{index}:a:0"
+            else:
+                # Фильтр concat требует звук у каждого куска: подкладываем тишину той же длины
+                cmd += ["-f", "lavfi", "-t", str(info['duration']), "-i", "anullsrc=r=48000:cl=stereo"]
+                audio_input = f"{silence_index}:a:0"
+                silence_index += 1
+            filters.append(f"[{audio_input}]aresample=48000,aformat=channel_layouts=stereo[a{index}]")
+            streams.append(f"[v{index}][a{index}]")
+        
+        filters.append("".join(streams) + f"concat=n={len(fragment_paths)}:v=1:a=1[v][a]")
+        
+        return cmd + [
+            "-filter_complex", ";".join(filters),
+            "-map", "[v]",
+            "-map", "[a]",
+            "-c:v", "libx264",
+            "-preset", "veryfast",
+            "-crf", str(CUT_QUALITY_CRF["high"]),
+            "-c:a", "aac",
+            "-b:a", "192k",
+            output_path
+        ]
 
 ffmpeg_service = FFmpegService()
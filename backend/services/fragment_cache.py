@@ -0,0 +1,100 @@
+"""
+Кэш видеофайлов виртуальных фрагментов с вытеснением давно не использованных (LRU)
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+import weakref
+from pathlib import Path
+
+from config import settings
+from models import Fragment, Video
+from services.media_jobs import cut_fragment
+
+logger = logging.getLogger(__name__)
+
+
+class FragmentCache:
+    """
+    Файлы лежат в одном каталоге, время последнего обращения - mtime файла,
+    поэтому кэш общий для всех процессов и переживает перезапуск.
+    """
+
+    def __init__(self, directory: str, max_size: int, evict_grace: float):
+        self.directory = Path(directory)
+        self.max_size = max_size
+        # RangeFileResponse открывает файл уже после stat в _prepare, а nginx по
+        # X-Accel-Redirect - после ответа бэкенда: свежие файлы не трогаем
+        self.evict_grace = evict_grace
+        # Блокировка живет, пока ее держит или ждет хотя бы один запрос, потом запись исчезает сама
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    def path_for(self, fragment: Fragment, video: Video) -> Path:
+        # Границы в имени: после изменения start/end старый файл просто перестанет использоваться
+        suffix = Path(video.filename).suffix or ".mp4"
+        return self.directory / f"{fragment.id}_{fragment.start_time:.3f}_{fragment.end_time:.3f}{suffix}"
+
+    async def get(self, fragment: Fragment, video: Video) -> Path:
+        """Путь к видеофайлу фрагмента; при промахе файл вырезается из исходного видео"""
+        path = self.path_for(fragment, video)
+        lock = self._locks.get(path.name)
+        if lock is None:
+            lock = self._locks[path.name] = asyncio.Lock()
+
+        # Одновременные запросы одного фрагмента ждут первую нарезку, а не режут заново
+        async with lock:
+            try:
+                os.utime(path)
+                return path
+            except FileNotFoundError:
+                # Промах, или файл только что вытеснил другой процесс
+                pass
+
+            self.directory.mkdir(parents=True, exist_ok=True)
+            # Блокировка действует только внутри процесса: другой процесс может резать тот же фрагмент
+            tmp_path = path.with_name(f"tmp_{os.getpid()}_{uuid.uuid4().hex[:8]}_{path.name}")
+            try:
+                await cut_fragment(video, fragment.start_time, fragment.end_time, str(tmp_path))
+                os.replace(tmp_path, path)
+            finally:
+                tmp_path.unlink(missing_ok=True)
+
+        await asyncio.to_thread(self._evict, path)
+        return path
+
+    def invalidate(self, fragment_id: int):
+        """Удаляет закэшированные файлы фрагмента (при изменении или удалении)"""
+        if not self.directory.exists():
+            return
+        for path in self.directory.glob(f"{fragment_id}_*"):
+            path.unlink(missing_ok=True)
+
+    def _evict(self, keep: Path):
+        entries = []
+        total = 0
+        for path in self.directory.iterdir():
+            if not path.is_file() or path.name.startswith("tmp_"):
+                continue
+            stat = path.stat()
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        entries.sort()
+        recent = time.time() - self.evict_grace
+        for mtime, size, path in entries:
+            if total <= self.max_size:
+                break
+            if path == keep or mtime >= recent:
+                continue
+            path.unlink(missing_ok=True)
+            total -= size
+            logger.debug(f"Evicted fragment cache entry {path.name}")
+
+
+fragment_cache = FragmentCache(
+    directory=settings.FRAGMENT_CACHE_DIR,
+    max_size=settings.FRAGMENT_CACHE_MAX_SIZE,
+    evict_grace=settings.FRAGMENT_CACHE_EVICT_GRACE_SECONDS
+)
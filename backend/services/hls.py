@@ -0,0 +1,84 @@
+"""
+HLS: выбор вариантов качества и нарезка плейлистов под фрагменты
+"""
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from config import settings
+
+MASTER_PLAYLIST = "master.m3u8"
+PLAYLIST_CONTENT_TYPE = "application/vnd.apple.mpegurl"
+SEGMENT_CONTENT_TYPE = "video/mp2t"
+
+
+def hls_dir(video_id: int) -> Path:
+    return Path(settings.HLS_DIR) / str(video_id)
+
+
+def select_renditions(source_height: Optional[int]) -> List[Tuple[int, str]]:
+    """
+    Варианты из HLS_RENDITIONS, не превышающие высоту исходника.
+
+    Если исходник меньше самого низкого варианта, остается один вариант
+    в исходном разрешении с битрейтом самого низкого.
+    """
+    configured = []
+    for item in settings.HLS_RENDITIONS.split(","):
+        height, _, bitrate = item.strip().partition(":")
+        configured.append((int(height), bitrate))
+    configured.sort(reverse=True)
+
+    if not source_height:
+        return configured
+
+    renditions = [(height, bitrate) for height, bitrate in configured if height <= source_height]
+    if not renditions:
+        # Высота должна быть четной для libx264
+        renditions = [(source_height - source_height % 2, configured[-1][1])]
+    return renditions
+
+
+def slice_media_playlist(playlist: str, start_time: float, end_time: float, segment_base: str) -> str:
+    """
+    Медиаплейлист только с сегментами, пересекающими [start_time, end_time).
+
+    Сегменты не копируются: URI указывают на сегменты исходного видео
+    (segment_base + имя). EXT-X-START сдвигает начало воспроизведения
+    внутрь первого сегмента, так что фрагмент стартует с точного времени.
+    """
+    header = []
+    segments = []
+    position = 0.0
+    duration = None
+
+    for line in playlist.splitlines():
+        line = line.strip()
+        if not line or line == "#EXT-X-ENDLIST":
+            continue
+        if line.startswith("#EXTINF:"):
+            duration = float(line[len("#EXTINF:"):].split(",", 1)[0])
+        elif not line.startswith("#"):
+            if duration is not None:
+                segments.append((position, duration, line))
+                position += duration
+                duration = None
+        elif not segments and duration is None and not line.startswith("#EXT-X-MEDIA-SEQUENCE"):
+            header.append(line)
+
+    selected = [
+        (index, seg_start, seg_duration, uri)
+        for index, (seg_start, seg_duration, uri) in enumerate(segments)
+        if seg_start < end_time and seg_start + seg_duration > start_time
+    ]
+
+    lines = list(header)
+    if selected:
+        first_index, first_start = selected[0][0], selected[0][1]
+        lines.append(f"#EXT-X-MEDIA-SEQUENCE:{first_index}")
+        lines.append(f"#EXT-X-START:TIME-OFFSET={start_time - first_start:.3f},PRECISE=YES")
+        for _, _, seg_duration, uri in selected:
+            lines.append(f"#EXTINF:{seg_duration:.6f},")
+            lines.append(segment_base + uri)
+    lines.append("#EXT-X-ENDLIST")
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,268 @@
+"""
+Очередь фоновых задач на базе таблицы jobs
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from database import AsyncSessionLocal
+from models import Job
+from services.progress import progress_tracker
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[[int, Dict[str, Any]], Awaitable[Optional[Dict[str, Any]]]]
+FailureHandler = Callable[[int, Dict[str, Any], str], Awaitable[None]]
+
+
+class PermanentJobError(Exception):
+    """Ошибка, при которой повторять задачу бессмысленно"""
+
+
+class JobQueue:
+    def __init__(self, concurrency: int, poll_interval: float):
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self._handlers: Dict[str, JobHandler] = {}
+        self._failure_handlers: Dict[str, FailureHandler] = {}
+        self._wakeup = asyncio.Event()
+        self._workers = []
+        self._busy = set()
+        # id задач, которые воркеры процесса выполняют прямо сейчас: только их аренда продлевается
+        self._running = set()
+        self._heartbeat = None
+        self._stopping = False
+        # Владелец аренды задач этого процесса
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def handler(self, kind: str, on_failure: Optional[FailureHandler] = None):
+        """Декоратор регистрации обработчика задач вида kind"""
+        def decorator(func: JobHandler) -> JobHandler:
+            self._handlers[kind] = func
+            if on_failure:
+                self._failure_handlers[kind] = on_failure
+            return func
+        return decorator
+
+    async def enqueue(
+        self,
+        db: AsyncSession,
+        kind: str,
+        payload: Dict[str, Any],
+        max_attempts: Optional[int] = None
+    ) -> Job:
+        """Ставит задачу в очередь. Коммитит сессию, чтобы воркеры сразу увидели задачу"""
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+
+        job = Job(
+            kind=kind,
+            payload=json.dumps(payload),
+            max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS
+        )
+        db.add(job)
+        await db.commit()
+        await db.refresh(job)
+
+        self._wakeup.set()
+        return job
+
+    async def start(self):
+        # Задачи упавших процессов возвращаются в очередь, когда истечет их аренда;
+        # задачи живых воркеров других процессов не трогаем
+        await self._requeue_expired()
+
+        self._stopping = False
+        self._workers = [
+            asyncio.create_task(self._worker(i)) for i in range(self.concurrency)
+        ]
+        self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+        logger.info(f"Job queue started with {self.concurrency} workers as {self.worker_id}")
+
+    async def stop(self):
+        # Простаивающие воркеры выходят сами, выполняющиеся задачи прерываются
+        # и возвращаются в очередь (процессы FFmpeg при этом убиваются)
+        self._stopping = True
+        self._wakeup.set()
+        for worker in self._busy:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._heartbeat:
+            self._heartbeat.cancel()
+            await asyncio.gather(self._heartbeat, return_exceptions=True)
+            self._heartbeat = None
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(settings.JOB_HEARTBEAT_INTERVAL)
+            try:
+                if self._running:
+                    async with AsyncSessionLocal() as db:
+                        await db.execute(
+                            update(Job)
+                            .where(
+                                Job.id.in_(list(self._running)),
+                                Job.status == "running",
+                                Job.worker_id == self.worker_id
+                            )
+                            .values(heartbeat_at=datetime.utcnow())
+                        )
+                        await db.commit()
+                await self._requeue_expired()
+            except Exception as e:
+                logger.error(f"Job heartbeat failed: {str(e)}")
+
+    async def _requeue_expired(self):
+        """Задачи running с просроченной арендой: в очередь, а исчерпавшие попытки - в failed"""
+        lease_start = datetime.utcnow() - timedelta(seconds=settings.JOB_LEASE_SECONDS)
+        expired = and_(
+            Job.status == "running",
+            or_(Job.heartbeat_at.is_(None), Job.heartbeat_at < lease_start)
+        )
+        async with AsyncSessionLocal() as db:
+            failed = await db.execute(
+                update(Job)
+                .where(expired, Job.attempts >= Job.max_attempts)
+                .values(status="failed", error="Worker lease expired", finished_at=datetime.utcnow(), worker_id=None)
+            )
+            requeued = await db.execute(
+                update(Job)
+                .where(expired)
+                .values(status="pending", run_after=datetime.utcnow(), worker_id=None)
+            )
+            await db.commit()
+        if failed.rowcount or requeued.rowcount:
+            logger.warning(
+                f"Requeued {requeued.rowcount} and failed {failed.rowcount} jobs with an expired lease"
+            )
+
+    async def _worker(self, number: int):
+        while not self._stopping:
+            try:
+                job = await self._claim()
+            except Exception as e:
+                logger.error(f"Job worker {number} failed to claim a job: {str(e)}")
+                job = None
+
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            task = asyncio.current_task()
+            self._busy.add(task)
+            self._running.add(job.id)
+            try:
+                await self._execute(job)
+            except Exception as e:
+                # Например, не удалось записать итог задачи: воркер продолжает работу,
+                # аренда больше не продлевается, и задачу вернет в очередь ее истечение
+                logger.exception(f"Job worker {number} failed to finish job {job.id} ({job.kind}): {str(e)}")
+            finally:
+                self._running.discard(job.id)
+                self._busy.discard(task)
+
+    async def _claim(self) -> Optional[Job]:
+        """Атомарно забирает одну готовую задачу (безопасно для нескольких процессов)"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(Job.id)
+                .where(Job.status == "pending", Job.run_after <= datetime.utcnow())
+                .order_by(Job.id)
+                .limit(1)
+                # PostgreSQL: воркеры разных процессов берут разные задачи, а не спорят за одну
+                # (для SQLite FOR UPDATE не компилируется)
+                .with_for_update(skip_locked=True)
+            )
+            job_id = result.scalar_one_or_none()
+            if job_id is None:
+                return None
+
+            claimed = await db.execute(
+                update(Job)
+                .where(Job.id == job_id, Job.status == "pending")
+                .values(
+                    status="running",
+                    attempts=Job.attempts + 1,
+                    started_at=datetime.utcnow(),
+                    worker_id=self.worker_id,
+                    heartbeat_at=datetime.utcnow()
+                )
+            )
+            await db.commit()
+
+            if claimed.rowcount != 1:
+                # Задачу забрал другой воркер, попробуем следующую
+                return await self._claim()
+
+            return await db.get(Job, job_id)
+
+    async def _execute(self, job: Job):
+        payload = json.loads(job.payload or "{}")
+        handler = self._handlers.get(job.kind)
+        values: Dict[str, Any] = {}
+        failed_permanently = False
+
+        try:
+            if handler is None:
+                raise PermanentJobError(f"No handler registered for job kind '{job.kind}'")
+            result = await handler(job.id, payload)
+            values.update(status="completed", result=json.dumps(result or {}), error=None)
+        except asyncio.CancelledError:
+            # Остановка приложения: вернем задачу в очередь
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(Job)
+                    .where(Job.id == job.id, Job.worker_id == self.worker_id)
+                    .values(status="pending", run_after=datetime.utcnow(), worker_id=None)
+                )
+                await db.commit()
+            progress_tracker.discard(job.id)
+            raise
+        except Exception as e:
+            logger.error(f"Job {job.id} ({job.kind}) attempt {job.attempts} failed: {str(e)}")
+            values["error"] = str(e)
+            if isinstance(e, PermanentJobError) or job.attempts >= job.max_attempts:
+                values["status"] = "failed"
+                failed_permanently = True
+            else:
+                delay = settings.JOB_RETRY_DELAY * (2 ** (job.attempts - 1))
+                values.update(status="pending", run_after=datetime.utcnow() + timedelta(seconds=delay))
+
+        values.update(finished_at=datetime.utcnow(), worker_id=None)
+        async with AsyncSessionLocal() as db:
+            # Если аренда истекла и задачу забрал другой воркер, результат этого запуска не пишем
+            saved = await db.execute(
+                update(Job).where(Job.id == job.id, Job.worker_id == self.worker_id).values(**values)
+            )
+            await db.commit()
+        progress_tracker.discard(job.id)
+        if saved.rowcount != 1:
+            logger.warning(f"Job {job.id} ({job.kind}) lost its lease, result discarded")
+            return
+
+        on_failure = self._failure_handlers.get(job.kind)
+        if failed_permanently and on_failure:
+            try:
+                await on_failure(job.id, payload, values["error"])
+            except Exception as e:
+                logger.error(f"Failure handler for job {job.id} ({job.kind}) raised: {str(e)}")
+
+
+job_queue = JobQueue(
+    concurrency=settings.JOB_WORKERS,
+    poll_interval=settings.JOB_POLL_INTERVAL
+)
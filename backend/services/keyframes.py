@@ -0,0 +1,72 @@
+"""
+Индекс ключевых кадров видео и план точной нарезки по нему
+"""
+import bisect
+import os
+from array import array
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+from config import settings
+
+# Допуск при сравнении времени с ключевым кадром: меньше длительности кадра при любом fps
+KEYFRAME_EPSILON = 0.001
+
+# (начало, конец, копировать без перекодирования)
+CutSegment = Tuple[float, float, bool]
+
+
+def keyframe_index_path(video_id: int) -> Path:
+    return Path(settings.KEYFRAMES_DIR) / f"{video_id}.kf"
+
+
+def save_keyframe_index(video_id: int, keyframes: Sequence[float]):
+    """Индекс хранится плоским массивом float64 (8 байт на ключевой кадр)"""
+    path = keyframe_index_path(video_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "wb") as f:
+        array("d", sorted(keyframes)).tofile(f)
+    os.replace(tmp_path, path)
+
+
+def load_keyframe_index(video_id: int) -> Optional[array]:
+    path = keyframe_index_path(video_id)
+    if not path.exists():
+        return None
+    keyframes = array("d")
+    with open(path, "rb") as f:
+        keyframes.frombytes(f.read())
+    return keyframes
+
+
+def delete_keyframe_index(video_id: int):
+    keyframe_index_path(video_id).unlink(missing_ok=True)
+
+
+def plan_smart_cut(keyframes: Sequence[float], start_time: float, end_time: float) -> List[CutSegment]:
+    """
+    Разбивает [start_time, end_time) на куски для умной нарезки.
+
+    Середина от первого ключевого кадра после start_time до последнего перед
+    end_time копируется как есть; неполные GOP в начале и в конце
+    перекодируются. Если целого GOP внутри нет, перекодируется весь отрезок.
+    """
+    first = bisect.bisect_left(keyframes, start_time - KEYFRAME_EPSILON)
+    last = bisect.bisect_right(keyframes, end_time + KEYFRAME_EPSILON) - 1
+
+    if first >= len(keyframes) or last < first or keyframes[last] <= keyframes[first]:
+        return [(start_time, end_time, False)]
+
+    # Границы копируемой середины - всегда точные значения из индекса,
+    # по ним же режет segment-муксер
+    copy_start = keyframes[first]
+    copy_end = keyframes[last]
+
+    segments = []
+    if copy_start - start_time > KEYFRAME_EPSILON:
+        segments.append((start_time, copy_start, False))
+    segments.append((copy_start, copy_end, True))
+    if end_time - copy_end > KEYFRAME_EPSILON:
+        segments.append((copy_end, end_time, False))
+    return segments
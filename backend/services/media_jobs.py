@@ -0,0 +1,460 @@
+"""
+Обработчики фоновых задач для медиа: probe, превью, конвертация, фрагменты
+"""
+import os
+import shutil
+import hashlib
+import json
+import logging
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+from config import settings
+from database import AsyncSessionLocal
+from models import Video, Fragment, MediaBlob
+from services.blob_store import release_video_source
+from services.ffmpeg_service import ffmpeg_service
+from services.job_queue import job_queue, PermanentJobError
+from services.progress import progress_tracker
+from services.hls import hls_dir, select_renditions, MASTER_PLAYLIST
+from services.keyframes import keyframe_index_path, load_keyframe_index, save_keyframe_index
+
+logger = logging.getLogger(__name__)
+
+INGEST_VIDEO = "ingest_video"
+TRANSCODE_VIDEO = "transcode_video"
+EXTRACT_FRAGMENT = "extract_fragment"
+EXTRACT_FRAGMENTS = "extract_fragments"
+EXPORT_REEL = "export_reel"
+PACKAGE_HLS = "package_hls"
+
+# Умная нарезка склеивает куски без перекодирования, это надежно только для H.264
+SMART_CUT_CODECS = ("h264",)
+
+
+async def build_keyframe_index(video: Video):
+    """Строит и сохраняет индекс ключевых кадров. Без индекса фрагменты режутся по-старому"""
+    try:
+        keyframes = await ffmpeg_service.probe_keyframes(video.filepath)
+    except Exception as e:
+        logger.error(f"Keyframe index error for video {video.id}: {str(e)}")
+        return None
+
+    save_keyframe_index(video.id, keyframes)
+    return keyframes
+
+
+async def _discard_unprocessed_video(job_id: int, payload: Dict[str, Any], error: str):
+    """Файл так и не удалось распознать как видео: удаляем запись и файл, как раньше делал upload"""
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(Video)
+            .options(selectinload(Video.tags), selectinload(Video.fragments))
+            .where(Video.id == payload["video_id"])
+        )
+        video = result.scalar_one_or_none()
+        if not video or video.duration is not None:
+            return
+
+        source_path = await release_video_source(db, video)
+        await db.delete(video)
+        await db.commit()
+
+        if source_path:
+            source_path.unlink(missing_ok=True)
+        logger.warning(f"Discarded video {payload['video_id']} after failed ingest: {error}")
+
+
+@job_queue.handler(INGEST_VIDEO, on_failure=_discard_unprocessed_video)
+async def ingest_video(job_id: int, payload: Dict[str, Any]) -> Dict[str, Any]:
+    async with AsyncSessionLocal() as db:
+        video = await db.get(Video, payload["video_id"])
+        if not video:
+            return {"skipped": "video deleted"}
+
+        if not video.filepath or not os.path.exists(video.filepath):
+            raise PermanentJobError("Source video file not found")
+
+        try:
+            video_info = await ffmpeg_service.get_video_info(video.filepath)
+        except Exception as e:
+            raise PermanentJobError(f"FFmpeg error: {str(e)}")
+
+        logger.debug(f"Video info: {video_info}")
+        video.duration = video_info['duration']
+        await db.commit()
+
+        try:
+            thumbnail_path = Path(settings.UPLOAD_DIR) / "thumbnails" / f"{video.id}.jpg"
+            await ffmpeg_service.generate_thumbnail(video.filepath, str(thumbnail_path))
+        except Exception as e:
+            # Превью не обязательно, не проваливаем задачу
+            logger.error(f"Thumbnail generation error: {str(e)}")
+
+        result = dict(video_info)
+
+        # Конвертируем AVI в MP4 для лучшей совместимости с браузерами
+        if video.filename.lower().endswith('.avi'):
+            transcode_job = await job_queue.enqueue(db, TRANSCODE_VIDEO, {"video_id": video.id})
+            result["transcode_job_id"] = transcode_job.id
+            return result
+
+        # Индекс ключевых кадров для точной нарезки (у AVI он строится после конвертации)
+        keyframes = await build_keyframe_index(video)
+        result["keyframes"] = len(keyframes) if keyframes is not None else None
+
+        if settings.HLS_ENABLED:
+            hls_job = await enqueue_hls_packaging(db, video)
+            result["hls_job_id"] = hls_job.id
+
+        return result
+
+
+@job_queue.handler(TRANSCODE_VIDEO)
+async def transcode_video(job_id: int, payload: Dict[str, Any]) -> Dict[str, Any]:
+    async with AsyncSessionLocal() as db:
+        video = await db.get(Video, payload["video_id"])
+        if not video or not video.filepath:
+            return {"skipped": "video or source file deleted"}
+
+        source_path = Path(video.filepath)
+        if source_path.suffix.lower() != '.avi':
+            return {"skipped": "already converted"}
+
+        mp4_path = source_path.with_suffix('.mp4')
+        # Пишем во временный файл: тот же исходник может конвертировать задача видео-дубликата
+        tmp_path = mp4_path.with_name(f"{mp4_path.stem}.{job_id}.tmp.mp4")
+        logger.debug(f"Converting AVI to MP4: {source_path} -> {mp4_path}")
+
+        try:
+            await ffmpeg_service.transcode_to_mp4(
+                str(source_path),
+                str(tmp_path),
+                on_progress=progress_tracker.callback(job_id, video.duration)
+            )
+            os.replace(tmp_path, mp4_path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+        file_size = os.path.getsize(mp4_path)
+        videos = [video]
+        if video.content_hash:
+            # Файл общий: на MP4 переходят все видео с этим содержимым
+            blob = await db.get(MediaBlob, video.content_hash)
+            if blob:
+                blob.filepath = str(mp4_path)
+                blob.file_size = file_size
+            result = await db.execute(
+                select(Video).where(
+                    Video.content_hash == video.content_hash,
+                    Video.filepath == str(source_path)
+                )
+            )
+            videos = result.scalars().all()
+
+        for item in videos:
+            item.filepath = str(mp4_path)
+            item.filename = Path(item.filename).with_suffix('.mp4').name
+            item.mime_type = "video/mp4"
+            item.file_size = file_size
+        await db.commit()
+
+        # Удаляем исходный AVI файл
+        source_path.unlink(missing_ok=True)
+
+        # Ключевые кадры у нового файла свои
+        await build_keyframe_index(video)
+
+        result = {"filepath": video.filepath}
+        if settings.HLS_ENABLED:
+            hls_job = await enqueue_hls_packaging(db, video)
+            result["hls_job_id"] = hls_job.id
+        return result
+
+
+def clone_video_artifacts(source: Video, video: Video):
+    """Копирует превью, индекс ключевых кадров и HLS уже обработанного видео с тем же содержимым"""
+    thumbnails_dir = Path(settings.UPLOAD_DIR) / "thumbnails"
+    thumbnail_path = thumbnails_dir / f"{source.id}.jpg"
+    if thumbnail_path.exists():
+        shutil.copyfile(thumbnail_path, thumbnails_dir / f"{video.id}.jpg")
+
+    index_path = keyframe_index_path(source.id)
+    if index_path.exists():
+        shutil.copyfile(index_path, keyframe_index_path(video.id))
+
+    if source.hls_status == "ready" and hls_dir(source.id).is_dir():
+        # Сегменты после упаковки не меняются, жестких ссылок достаточно
+        shutil.copytree(hls_dir(source.id), hls_dir(video.id), copy_function=os.link, dirs_exist_ok=True)
+        video.hls_path = f"{video.id}/{MASTER_PLAYLIST}"
+        video.hls_status = "ready"
+
+
+async def enqueue_hls_packaging(db, video: Video):
+    video.hls_status = "processing"
+    return await job_queue.enqueue(db, PACKAGE_HLS, {"video_id": video.id})
+
+
+async def _mark_hls_failed(job_id: int, payload: Dict[str, Any], error: str):
+    async with AsyncSessionLocal() as db:
+        video = await db.get(Video, payload["video_id"])
+        if video:
+            video.hls_status = "failed"
+            await db.commit()
+        shutil.rmtree(hls_dir(payload["video_id"]), ignore_errors=True)
+
+
+@job_queue.handler(PACKAGE_HLS, on_failure=_mark_hls_failed)
+async def package_hls(job_id: int, payload: Dict[str, Any]) -> Dict[str, Any]:
+    async with AsyncSessionLocal() as db:
+        video = await db.get(Video, payload["video_id"])
+        if not video:
+            return {"skipped": "video deleted"}
+
+        if not video.filepath or not os.path.exists(video.filepath):
+            raise PermanentJobError("Source video file not found")
+
+        video_info = await ffmpeg_service.get_video_info(video.filepath)
+        renditions = select_renditions(video_info['height'])
+
+        # Пакуем во временный каталог, чтобы плеер не увидел недописанный вариант
+        output_dir = hls_dir(video.id)
+        staging_dir = output_dir.with_name(f"{video.id}.tmp")
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+        await ffmpeg_service.package_hls(
+            video.filepath,
+            str(staging_dir),
+            renditions,
+            has_audio=video_info['has_audio'],
+            segment_seconds=settings.HLS_SEGMENT_SECONDS,
+            on_progress=progress_tracker.callback(job_id, video.duration)
+        )
+
+        shutil.rmtree(output_dir, ignore_errors=True)
+        os.replace(staging_dir, output_dir)
+
+        video.hls_path = f"{video.id}/{MASTER_PLAYLIST}"
+        video.hls_status = "ready"
+        await db.commit()
+
+        return {"hls_path": video.hls_path, "renditions": [height for height, _ in renditions]}
+
+
+async def _discard_failed_fragment(job_id: int, payload: Dict[str, Any], error: str):
+    fragment_ids = payload.get("fragment_ids") or [payload["fragment_id"]]
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(Fragment)
+            .options(selectinload(Fragment.tags))
+            .where(Fragment.id.in_(fragment_ids))
+        )
+        for fragment in result.scalars().all():
+            if not fragment.video_filepath:
+                await db.delete(fragment)
+        await db.commit()
+
+
+def fragment_file_path(fragment: Fragment) -> Path:
+    # video_filepath хранится относительно UPLOAD_DIR: fragments/<имя файла>
+    return Path(settings.FRAGMENTS_DIR) / Path(fragment.video_filepath).name
+
+
+async def cut_fragments(
+    video: Video,
+    cuts: List[Tuple[str, float, float]],
+    on_progress=None
+) -> bool:
+    """
+    Вырезает отрезки (output_path, start, end) из видео за один проход.
+    True - нарезка была точной (по индексу ключевых кадров)
+    """
+    video_info = await ffmpeg_service.get_video_info(video.filepath)
+    keyframes = None
+    if video_info['codec'] in SMART_CUT_CODECS:
+        keyframes = load_keyframe_index(video.id)
+        if keyframes is None:
+            # Видео загружено до появления индекса
+            keyframes = await build_keyframe_index(video)
+
+    await ffmpeg_service.extract_fragments(
+        video.filepath,
+        cuts,
+        on_progress=on_progress,
+        keyframes=keyframes,
+        pix_fmt=video_info.get('pix_fmt')
+    )
+    return bool(keyframes)
+
+
+async def cut_fragment(
+    video: Video,
+    start_time: float,
+    end_time: float,
+    output_path: str,
+    on_progress=None
+) -> bool:
+    return await cut_fragments(video, [(output_path, start_time, end_time)], on_progress=on_progress)
+
+
+async def materialize_fragments(fragments: List[Fragment], video: Video, on_progress=None) -> bool:
+    """Сохраняет видеофайлы фрагментов в FRAGMENTS_DIR; фрагменты перестают быть виртуальными"""
+    paths = {
+        fragment.id: Path(settings.FRAGMENTS_DIR) / f"fragment_{fragment.id}_{video.filename}"
+        for fragment in fragments
+    }
+
+    smart_cut = await cut_fragments(
+        video,
+        [(str(paths[fragment.id]), fragment.start_time, fragment.end_time) for fragment in fragments],
+        on_progress=on_progress
+    )
+
+    for fragment in fragments:
+        fragment_path = paths[fragment.id]
+        # Сохраняем путь относительно static директории (uploads)
+        fragment.video_filepath = f"fragments/{fragment_path.name}"
+        if fragment_path.exists():
+            fragment.video_file_size = fragment_path.stat().st_size
+        fragment.is_virtual = False
+    return smart_cut
+
+
+async def materialize_fragment(fragment: Fragment, video: Video, on_progress=None) -> bool:
+    return await materialize_fragments([fragment], video, on_progress=on_progress)
+
+
+@job_queue.handler(EXTRACT_FRAGMENT, on_failure=_discard_failed_fragment)
+async def extract_fragment(job_id: int, payload: Dict[str, Any]) -> Dict[str, Any]:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(Fragment)
+            .options(selectinload(Fragment.video))
+            .where(Fragment.id == payload["fragment_id"])
+        )
+        fragment = result.scalar_one_or_none()
+        if not fragment:
+            return {"skipped": "fragment deleted"}
+
+        video = fragment.video
+        if not video.filepath or not os.path.exists(video.filepath):
+            raise PermanentJobError("Source video file not found")
+
+        smart_cut = await materialize_fragment(
+            fragment,
+            video,
+            on_progress=progress_tracker.callback(job_id, fragment.end_time - fragment.start_time)
+        )
+        await db.commit()
+
+        return {"video_filepath": fragment.video_filepath, "smart_cut": smart_cut}
+
+
+@job_queue.handler(EXTRACT_FRAGMENTS, on_failure=_discard_failed_fragment)
+async def extract_fragments(job_id: int, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Пакетное извлечение: все фрагменты одного видео одним набором запусков FFmpeg"""
+    async with AsyncSessionLocal() as db:
+        video = await db.get(Video, payload["video_id"])
+        if not video:
+            return {"skipped": "video deleted"}
+
+        if not video.filepath or not os.path.exists(video.filepath):
+            raise PermanentJobError("Source video file not found")
+
+        result = await db.execute(
+            select(Fragment)
+            .where(Fragment.id.in_(payload["fragment_ids"]), Fragment.video_id == video.id)
+            .order_by(Fragment.id)
+        )
+        fragments = result.scalars().all()
+        if not fragments:
+            return {"skipped": "fragments deleted"}
+
+        longest = max(fragment.end_time - fragment.start_time for fragment in fragments)
+        smart_cut = await materialize_fragments(
+            fragments,
+            video,
+            on_progress=progress_tracker.callback(job_id, longest)
+        )
+        await db.commit()
+
+        return {
+            "fragments": {str(fragment.id): fragment.video_filepath for fragment in fragments},
+            "smart_cut": smart_cut
+        }
+
+
+def reel_key(fragments: List[Fragment]) -> str:
+    """Хэш упорядоченного списка фрагментов с их границами: одинаковый список - один файл"""
+    items = [[f.id, f.video_id, f.start_time, f.end_time] for f in fragments]
+    return hashlib.sha256(json.dumps(items).encode()).hexdigest()
+
+
+def reel_path(key: str) -> Path:
+    return Path(settings.REELS_DIR) / f"{key}.mp4"
+
+
+@job_queue.handler(EXPORT_REEL)
+async def export_reel(job_id: int, payload: Dict[str, Any]) -> Dict[str, Any]:
+    output_path = reel_path(payload["key"])
+    if output_path.exists():
+        return {"key": payload["key"], "cached": True}
+
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(Fragment)
+            .options(selectinload(Fragment.video))
+            .where(Fragment.id.in_(payload["fragment_ids"]))
+        )
+        fragments_by_id = {fragment.id: fragment for fragment in result.scalars().all()}
+
+    missing = [fid for fid in payload["fragment_ids"] if fid not in fragments_by_id]
+    if missing:
+        raise PermanentJobError(f"Fragments not found: {missing}")
+    fragments = [fragments_by_id[fid] for fid in payload["fragment_ids"]]
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    work_dir = Path(tempfile.mkdtemp(prefix="reel_", dir=output_path.parent))
+    try:
+        # Готовые файлы берем как есть, остальное вырезаем из исходников:
+        # по одному проходу на каждое исходное видео
+        inputs: List[Path] = []
+        to_cut: Dict[int, List[Tuple[str, float, float]]] = {}
+        for index, fragment in enumerate(fragments):
+            if not fragment.is_virtual and fragment.video_filepath and fragment_file_path(fragment).is_file():
+                inputs.append(fragment_file_path(fragment))
+                continue
+
+            video = fragment.video
+            if not video.filepath or not os.path.exists(video.filepath):
+                raise PermanentJobError(f"No media available for fragment {fragment.id}")
+
+            part_path = work_dir / f"part_{index}{Path(video.filename).suffix or '.mp4'}"
+            to_cut.setdefault(video.id, []).append((str(part_path), fragment.start_time, fragment.end_time))
+            inputs.append(part_path)
+
+        videos = {fragment.video.id: fragment.video for fragment in fragments}
+        for video_id, cuts in to_cut.items():
+            await cut_fragments(videos[video_id], cuts)
+
+        total = sum(fragment.end_time - fragment.start_time for fragment in fragments)
+        tmp_output = work_dir / "reel.mp4"
+        normalized = await ffmpeg_service.concat_fragments(
+            [str(path) for path in inputs],
+            str(tmp_output),
+            on_progress=progress_tracker.callback(job_id, total)
+        )
+        os.replace(tmp_output, output_path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        "key": payload["key"],
+        "cached": False,
+        "normalized": normalized,
+        "file_size": output_path.stat().st_size
+    }
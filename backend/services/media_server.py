@@ -0,0 +1,194 @@
+"""
+Отдача медиафайлов с поддержкой HTTP Range, условных запросов и X-Accel-Redirect
+"""
+import asyncio
+import mimetypes
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Optional, Tuple
+from urllib.parse import quote
+
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from config import settings
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+ZEROCOPY_EXTENSION = "http.response.zerocopysend"
+
+
+def make_etag(stat: os.stat_result) -> str:
+    """ETag из размера и mtime: дешево и меняется при любой перезаписи файла"""
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Разбирает одиночный диапазон `bytes=a-b`, возвращает включительный (start, end).
+
+    None - заголовок некорректен или содержит несколько диапазонов, тогда
+    отдается весь файл (RFC 9110 это разрешает). ValueError - диапазон
+    вне файла, нужен ответ 416.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+
+    first, last = match.groups()
+    if first == "" and last == "":
+        return None
+
+    if first == "":
+        # Суффиксный диапазон: последние N байт
+        length = int(last)
+        if length == 0:
+            raise ValueError("Empty suffix range")
+        return max(0, size - length), size - 1
+
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("Range not satisfiable")
+    return start, min(end, size - 1)
+
+
+def _read_at(fd: int, size: int, offset: int) -> bytes:
+    if hasattr(os, "pread"):
+        return os.pread(fd, size, offset)
+    # Windows: pread нет, но дескриптор принадлежит только этому ответу
+    os.lseek(fd, offset, os.SEEK_SET)
+    return os.read(fd, size)
+
+
+def accel_redirect_path(path: Path) -> Optional[str]:
+    """Внутренний URI nginx для файла внутри UPLOAD_DIR, если X-Accel-Redirect включен"""
+    if not settings.MEDIA_ACCEL_REDIRECT_PREFIX:
+        return None
+    try:
+        relative = path.resolve().relative_to(Path(settings.UPLOAD_DIR).resolve())
+    except ValueError:
+        return None
+    # Имена файлов содержат исходное имя загрузки (кириллица, пробелы)
+    return settings.MEDIA_ACCEL_REDIRECT_PREFIX.rstrip("/") + "/" + quote(relative.as_posix())
+
+
+class RangeFileResponse(Response):
+    """
+    Отдает файл целиком или по диапазону.
+
+    Порядок выбора способа отправки:
+    1. X-Accel-Redirect - байты отдает nginx через sendfile, Python не читает файл;
+    2. ASGI-расширение zerocopysend, если сервер его поддерживает (os.sendfile на его стороне);
+    3. чтение блоками MEDIA_CHUNK_SIZE в пуле потоков.
+    """
+
+    def __init__(self, path: Path, request: Request, media_type: Optional[str] = None):
+        super().__init__(status_code=200, media_type=None)
+        self.path = path
+        self.request = request
+        self.media_type = media_type or mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        self.send_body = request.method != "HEAD"
+        self.offset = 0
+        self.length = 0
+        self._prepare()
+
+    def _prepare(self):
+        stat = os.stat(self.path)
+        size = stat.st_size
+        etag = make_etag(stat)
+        last_modified = formatdate(stat.st_mtime, usegmt=True)
+        headers = self.request.headers
+
+        self.headers["accept-ranges"] = "bytes"
+        self.headers["etag"] = etag
+        self.headers["last-modified"] = last_modified
+        self.headers["content-type"] = self.media_type
+
+        accel_path = accel_redirect_path(self.path)
+        if accel_path:
+            # nginx сам обработает Range/If-Range и условные заголовки
+            self.headers["x-accel-redirect"] = accel_path
+            self.headers["content-length"] = "0"
+            self.send_body = False
+            return
+
+        if headers.get("if-none-match") == etag:
+            self.status_code = 304
+            self.headers["content-length"] = "0"
+            self.send_body = False
+            return
+
+        start, end = 0, size - 1
+        range_header = headers.get("range")
+        if range_header and size > 0 and self._if_range_matches(headers.get("if-range"), etag, stat):
+            try:
+                requested = parse_range(range_header, size)
+            except ValueError:
+                self.status_code = 416
+                self.headers["content-range"] = f"bytes */{size}"
+                self.headers["content-length"] = "0"
+                self.send_body = False
+                return
+            if requested:
+                start, end = requested
+                self.status_code = 206
+                self.headers["content-range"] = f"bytes {start}-{end}/{size}"
+
+        self.offset = start
+        self.length = end - start + 1 if size > 0 else 0
+        self.headers["content-length"] = str(self.length)
+
+    @staticmethod
+    def _if_range_matches(if_range: Optional[str], etag: str, stat: os.stat_result) -> bool:
+        if not if_range:
+            return True
+        if if_range.startswith('"') or if_range.startswith("W/"):
+            return if_range == etag
+        try:
+            return parsedate_to_datetime(if_range).timestamp() >= int(stat.st_mtime)
+        except (TypeError, ValueError):
+            return False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+
+        if not self.send_body or self.length == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        fd = os.open(self.path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        try:
+            if ZEROCOPY_EXTENSION in scope.get("extensions", {}):
+                await send({
+                    "type": ZEROCOPY_EXTENSION,
+                    "file": fd,
+                    "offset": self.offset,
+                    "count": self.length,
+                    "more_body": False,
+                })
+                return
+
+            position = self.offset
+            remaining = self.length
+            while remaining > 0:
+                chunk = await asyncio.to_thread(
+                    _read_at, fd, min(settings.MEDIA_CHUNK_SIZE, remaining), position
+                )
+                if not chunk:
+                    break
+                position += len(chunk)
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+
+            if remaining > 0:
+                # Файл укоротили во время отдачи, закрываем ответ
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            os.close(fd)
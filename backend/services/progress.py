@@ -0,0 +1,70 @@
+"""
+Прогресс выполнения длительных операций FFmpeg в разрезе фоновых задач
+"""
+import time
+from typing import Dict, Optional
+
+from services.ffmpeg_service import ProgressCallback
+
+
+def _parse_speed(value: Optional[str]) -> Optional[float]:
+    # FFmpeg пишет скорость как "1.53x" или "N/A"
+    if not value or not value.endswith("x"):
+        return None
+    try:
+        return float(value[:-1])
+    except ValueError:
+        return None
+
+
+def _parse_float(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value not in (None, "N/A") else None
+    except ValueError:
+        return None
+
+
+class ProgressTracker:
+    """Последний известный прогресс по каждой задаче, хранится в памяти процесса"""
+
+    def __init__(self):
+        self._records: Dict[int, dict] = {}
+
+    def callback(self, job_id: int, duration: Optional[float]) -> ProgressCallback:
+        """Возвращает обработчик блоков `-progress` для FFmpegService._run"""
+        started_at = time.monotonic()
+
+        def on_progress(block: Dict[str, str]):
+            # out_time_ms у FFmpeg исторически тоже в микросекундах
+            out_time_us = _parse_float(block.get("out_time_us") or block.get("out_time_ms"))
+            out_time = out_time_us / 1_000_000 if out_time_us is not None else None
+            speed = _parse_speed(block.get("speed"))
+
+            percent = None
+            eta = None
+            if duration and out_time is not None:
+                percent = max(0.0, min(100.0, out_time / duration * 100))
+                if speed:
+                    eta = max(0.0, (duration - out_time) / speed)
+
+            self._records[job_id] = {
+                "percent": round(percent, 1) if percent is not None else None,
+                "out_time": out_time,
+                "duration": duration,
+                "fps": _parse_float(block.get("fps")),
+                "speed": speed,
+                "eta_seconds": round(eta, 1) if eta is not None else None,
+                "elapsed_seconds": round(time.monotonic() - started_at, 1),
+                "done": block.get("progress") == "end",
+            }
+
+        return on_progress
+
+    def get(self, job_id: int) -> Optional[dict]:
+        return self._records.get(job_id)
+
+    def discard(self, job_id: int):
+        self._records.pop(job_id, None)
+
+
+progress_tracker = ProgressTracker()
@@ -0,0 +1,159 @@
+"""
+Полнотекстовый поиск по видео и фрагментам (SQLite FTS5, триграммы).
+В PostgreSQL поиск идет через ILIKE по GIN-индексам pg_trgm
+"""
+import logging
+import re
+from typing import List, Optional
+
+from sqlalchemy import Float, Integer, String, bindparam, column, text
+
+logger = logging.getLogger(__name__)
+
+# Триграммный токенизатор ищет любые подстроки от 3 символов без учета регистра,
+# поэтому одинаково работает для русского и английского и заменяет префиксный поиск
+MIN_TERM_LENGTH = 3
+
+SNIPPET_OPEN = "<mark>"
+SNIPPET_CLOSE = "</mark>"
+
+# Индексы с внешним содержимым: текст хранится только в основных таблицах,
+# триггеры поддерживают индекс при любых изменениях, включая массовые UPDATE/DELETE
+SEARCH_INDEXES = {
+    "videos_fts": ("videos", ("title", "original_filename")),
+    "fragments_fts": ("fragments", ("name", "description")),
+}
+
+# PostgreSQL: триграммные GIN-индексы ускоряют ILIKE '%...%' по этим колонкам
+TRIGRAM_INDEXES = {
+    f"ix_{table}_{column}_trgm": (table, column)
+    for table, columns in SEARCH_INDEXES.values()
+    for column in columns
+}
+
+# Доступен ли FTS5 в текущей БД; выставляется при старте в detect_search_index
+fts_available = False
+
+
+def _index_ddl(index: str, table: str, columns) -> List[str]:
+    cols = ", ".join(columns)
+    new_values = ", ".join(f"new.{c}" for c in columns)
+    old_values = ", ".join(f"old.{c}" for c in columns)
+    delete_row = f"INSERT INTO {index}({index}, rowid, {cols}) VALUES ('delete', old.id, {old_values});"
+    insert_row = f"INSERT INTO {index}(rowid, {cols}) VALUES (new.id, {new_values});"
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {index}_ai AFTER INSERT ON {table} BEGIN {insert_row} END",
+        f"CREATE TRIGGER IF NOT EXISTS {index}_ad AFTER DELETE ON {table} BEGIN {delete_row} END",
+        f"CREATE TRIGGER IF NOT EXISTS {index}_au AFTER UPDATE OF {cols} ON {table} "
+        f"BEGIN {delete_row} {insert_row} END",
+    ]
+
+
+def ensure_search_index(connection) -> bool:
+    """
+    Создает FTS5-индексы и триггеры, если их еще нет (миграция 0012).
+    Новый индекс сразу заполняется из существующих строк
+    """
+    global fts_available
+
+    if connection.dialect.name == "postgresql":
+        fts_available = False
+        return ensure_trigram_indexes(connection)
+    if connection.dialect.name != "sqlite":
+        fts_available = False
+        return False
+
+    for index, (table, columns) in SEARCH_INDEXES.items():
+        exists = connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": index}
+        ).first()
+        try:
+            connection.execute(text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {index} USING fts5("
+                f"{', '.join(columns)}, content='{table}', content_rowid='id', tokenize='trigram')"
+            ))
+        except Exception as e:
+            # SQLite собран без FTS5 или слишком старый для trigram (< 3.34)
+            logger.warning(f"Full-text search is unavailable, falling back to LIKE: {str(e)}")
+            fts_available = False
+            return False
+
+        for statement in _index_ddl(index, table, columns):
+            connection.execute(text(statement))
+        if not exists:
+            connection.execute(text(f"INSERT INTO {index}({index}) VALUES ('rebuild')"))
+            logger.info(f"Built full-text index {index}")
+
+    fts_available = True
+    return True
+
+
+def detect_search_index(connection) -> bool:
+    """При старте: есть ли в базе FTS5-индексы, созданные миграцией"""
+    global fts_available
+
+    if connection.dialect.name != "sqlite":
+        fts_available = False
+        return False
+    found = connection.execute(
+        text("SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name IN :names")
+        .bindparams(bindparam("names", expanding=True)),
+        {"names": list(SEARCH_INDEXES)}
+    ).scalar()
+    fts_available = found == len(SEARCH_INDEXES)
+    return fts_available
+
+
+def ensure_trigram_indexes(connection) -> bool:
+    """Расширение pg_trgm и GIN-индексы для поиска в PostgreSQL"""
+    try:
+        # Точка сохранения: без прав на CREATE EXTENSION остальная инициализация продолжится
+        with connection.begin_nested():
+            connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    except Exception as e:
+        logger.warning(f"pg_trgm is unavailable, search will scan tables: {str(e)}")
+        return False
+
+    for name, (table, column) in TRIGRAM_INDEXES.items():
+        connection.execute(text(
+            f"CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin ({column} gin_trgm_ops)"
+        ))
+    return True
+
+
+def match_expression(query: str) -> Optional[str]:
+    """
+    Запрос пользователя -> выражение MATCH: все слова обязательны, каждое как фраза
+    (синтаксис FTS5 в пользовательском вводе не интерпретируется).
+    None - искать через LIKE: индекса нет или слова короче трех символов
+    """
+    if not fts_available:
+        return None
+    terms = [term for term in re.split(r"\s+", query.strip()) if term]
+    if not terms or any(len(term) < MIN_TERM_LENGTH for term in terms):
+        return None
+    return " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def search_subquery(index: str, match: str, limit: Optional[int] = None):
+    """
+    (id, rank, snippet) строк, найденных в индексе; меньший rank - лучшее совпадение.
+    С limit лучшие строки отбираются внутри FTS5, не сортируя все совпадения снаружи
+    """
+    # Триграммы считаются токенами, поэтому окно сниппета задано в символах (максимум 64)
+    sql = (
+        f"SELECT rowid AS id, rank, "
+        f"snippet({index}, -1, '{SNIPPET_OPEN}', '{SNIPPET_CLOSE}', '…', 64) AS snippet "
+        f"FROM {index} WHERE {index} MATCH :match"
+    )
+    params = {"match": match}
+    if limit is not None:
+        sql += " ORDER BY rank LIMIT :limit"
+        params["limit"] = limit
+    return (
+        text(sql)
+        .bindparams(**params)
+        .columns(column("id", Integer), column("rank", Float), column("snippet", String))
+        .subquery(f"{index}_hits")
+    )
@@ -0,0 +1,103 @@
+"""
+Индекс имен тегов в памяти для автодополнения по префиксу
+"""
+import asyncio
+import bisect
+import heapq
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from models import Tag
+
+# Верхняя граница для диапазона "все строки с префиксом p": [p, p + MAX_CHAR)
+_MAX_CHAR = "\U0010ffff"
+
+# Для коротких префиксов диапазон большой, их результаты кэшируются до изменения индекса
+_CACHED_PREFIX_LENGTH = 2
+_CACHE_SIZE = 1024
+
+Suggestion = Tuple[int, str, int]  # (id, имя, популярность)
+
+
+class TagIndex:
+    """
+    Отсортированный список имен: префикс - это непрерывный диапазон, который
+    находится двумя бинарными поисками. Популярность (видео + фрагменты) берется
+    из счетчиков тегов и перечитывается раз в refresh_interval секунд
+    """
+
+    def __init__(self, refresh_interval: float):
+        self.refresh_interval = refresh_interval
+        self._names: List[str] = []
+        self._ids: Dict[str, int] = {}
+        self._counts: Dict[str, int] = {}
+        self._cache: Dict[Tuple[str, int], List[Suggestion]] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    def _is_fresh(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.refresh_interval
+
+    async def ensure_fresh(self, db: AsyncSession):
+        """Загружает индекс при первом обращении и перечитывает устаревший"""
+        if self._is_fresh():
+            return
+        async with self._lock:
+            if self._is_fresh():
+                return
+            result = await db.execute(
+                select(Tag.id, Tag.name, Tag.video_count + Tag.fragment_count).where(Tag.name.isnot(None))
+            )
+            rows = result.all()
+            self._names = sorted(name for _, name, _ in rows)
+            self._ids = {name: tag_id for tag_id, name, _ in rows}
+            self._counts = {name: count or 0 for _, name, count in rows}
+            self._cache.clear()
+            self._loaded_at = time.monotonic()
+
+    def add(self, tag_id: int, name: str, count: int = 0):
+        # До первой загрузки добавлять некуда: тег попадет в индекс при загрузке
+        if self._loaded_at is None or name in self._ids:
+            return
+        bisect.insort(self._names, name)
+        self._ids[name] = tag_id
+        self._counts[name] = count
+        self._cache.clear()
+
+    def remove(self, name: str):
+        if name not in self._ids:
+            return
+        index = bisect.bisect_left(self._names, name)
+        del self._names[index]
+        del self._ids[name]
+        del self._counts[name]
+        self._cache.clear()
+
+    def complete(self, prefix: str, limit: int) -> List[Suggestion]:
+        """Самые популярные теги, начинающиеся с prefix; при равенстве - по алфавиту"""
+        prefix = prefix.strip().lower()
+        key = (prefix, limit)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+
+        lo = bisect.bisect_left(self._names, prefix)
+        hi = bisect.bisect_left(self._names, prefix + _MAX_CHAR, lo)
+        # nlargest устойчив: теги с одинаковой популярностью остаются в алфавитном порядке
+        top = heapq.nlargest(limit, range(lo, hi), key=lambda i: self._counts[self._names[i]])
+        suggestions = [
+            (self._ids[self._names[i]], self._names[i], self._counts[self._names[i]]) for i in top
+        ]
+
+        if len(prefix) <= _CACHED_PREFIX_LENGTH:
+            if len(self._cache) >= _CACHE_SIZE:
+                self._cache.clear()
+            self._cache[key] = suggestions
+        return suggestions
+
+
+tag_index = TagIndex(refresh_interval=settings.TAG_INDEX_REFRESH_SECONDS)
@@ -0,0 +1,141 @@
+"""
+Разрешение списков тегов одним запросом (по id или по именам с созданием недостающих)
+и массовое изменение тегов у множества видео и фрагментов
+"""
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import delete, exists, func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Tag, fragment_tags, video_tags
+from services.tag_index import tag_index
+
+_UPSERT_DIALECTS = {"sqlite": sqlite, "postgresql": postgresql}
+
+
+def parse_tag_names(raw: str) -> List[str]:
+    """"a, B,,a" -> ["a", "b"]: имена в нижнем регистре, без пустых и повторов"""
+    return normalize_tag_names(raw.split(","))
+
+
+def normalize_tag_names(names: Iterable[str]) -> List[str]:
+    return list(dict.fromkeys(name.strip().lower() for name in names if name and name.strip()))
+
+
+async def tags_by_ids(db: AsyncSession, tag_ids: Iterable[int]) -> List[Tag]:
+    """Теги в порядке tag_ids; несуществующие id пропускаются"""
+    tag_ids = list(dict.fromkeys(tag_ids))
+    if not tag_ids:
+        return []
+    result = await db.execute(select(Tag).where(Tag.id.in_(tag_ids)))
+    found = {tag.id: tag for tag in result.scalars().all()}
+    return [found[tag_id] for tag_id in tag_ids if tag_id in found]
+
+
+async def resolve_tag_names(db: AsyncSession, names: Iterable[str]) -> List[Tag]:
+    """
+    Теги с именами names в их порядке, недостающие создаются.
+    Два запроса на любое число имен: INSERT ... ON CONFLICT DO NOTHING
+    и SELECT ... IN; параллельная загрузка с тем же новым тегом не приводит к ошибке
+    """
+    names = normalize_tag_names(names)
+    if not names:
+        return []
+
+    dialect = _UPSERT_DIALECTS.get(db.bind.dialect.name)
+    if dialect is not None:
+        await db.execute(
+            dialect.insert(Tag)
+            .values([{"name": name} for name in names])
+            .on_conflict_do_nothing(index_elements=[Tag.name])
+        )
+        result = await db.execute(select(Tag).where(Tag.name.in_(names)))
+        found = {tag.name: tag for tag in result.scalars().all()}
+    else:
+        # Без upsert: недостающие теги добавляются через ORM
+        result = await db.execute(select(Tag).where(Tag.name.in_(names)))
+        found = {tag.name: tag for tag in result.scalars().all()}
+        for name in names:
+            if name not in found:
+                found[name] = Tag(name=name)
+                db.add(found[name])
+        await db.flush()
+
+    return [found[name] for name in names]
+
+
+def index_tags(tags: Iterable[Tag]):
+    """После commit: новые имена попадают в индекс автодополнения (уже известные пропускаются)"""
+    for tag in tags:
+        tag_index.add(tag.id, tag.name)
+
+
+async def _retag_table(db: AsyncSession, table, owner_column: str, targets, add_ids, remove_ids, replace: bool):
+    """Изменения одной таблицы связей; targets - подзапрос с колонкой id. Возвращает (добавлено, удалено)"""
+    owner = table.c[owner_column]
+    removed = 0
+    if replace:
+        # Связи с тегами из нового списка остаются: их удаление и вставка только гоняли бы триггеры счетчиков
+        condition = owner.in_(select(targets.c.id))
+        if add_ids:
+            condition = condition & table.c.tag_id.not_in(add_ids)
+        removed = (await db.execute(delete(table).where(condition))).rowcount
+    elif remove_ids:
+        removed = (await db.execute(
+            delete(table).where(owner.in_(select(targets.c.id)), table.c.tag_id.in_(remove_ids))
+        )).rowcount
+
+    added = 0
+    if add_ids:
+        # NOT EXISTS вместо ON CONFLICT: работает и на базах, где ключ таблиц связей еще не добавлен
+        existing = table.alias()
+        pairs = (
+            select(targets.c.id, Tag.id)
+            .select_from(targets.join(Tag, Tag.id.in_(add_ids)))
+            .where(~exists().where(existing.c[owner_column] == targets.c.id, existing.c.tag_id == Tag.id))
+        )
+        added = (await db.execute(insert(table).from_select([owner_column, "tag_id"], pairs))).rowcount
+    return added, removed
+
+
+async def apply_tag_changes(
+    db: AsyncSession,
+    video_targets=None,
+    fragment_targets=None,
+    add: Iterable[str] = (),
+    remove: Iterable[str] = (),
+    replace: Optional[Iterable[str]] = None
+) -> Dict[str, Any]:
+    """
+    Добавляет, удаляет или заменяет теги у всех видео из video_targets и фрагментов
+    из fragment_targets (select с одной колонкой id) несколькими запросами
+    INSERT ... SELECT / DELETE, независимо от числа объектов.
+    Счетчики тегов обновляют триггеры в той же транзакции; commit - на вызывающем,
+    после него теги из "tags" передаются в index_tags
+    """
+    add_tags = await resolve_tag_names(db, add if replace is None else replace)
+    add_ids = [tag.id for tag in add_tags]
+    remove_ids = []
+    remove_names = normalize_tag_names(remove)
+    if replace is None and remove_names:
+        result = await db.execute(select(Tag.id).where(Tag.name.in_(remove_names)))
+        remove_ids = [tag_id for tag_id in result.scalars().all() if tag_id not in add_ids]
+
+    summary = {"videos": 0, "fragments": 0, "added": 0, "removed": 0, "tags": add_tags}
+    for key, table, owner_column, targets in (
+        ("videos", video_tags, "video_id", video_targets),
+        ("fragments", fragment_tags, "fragment_id", fragment_targets),
+    ):
+        if targets is None:
+            continue
+        targets = targets.subquery()
+        summary[key] = await db.scalar(select(func.count()).select_from(targets))
+        if not summary[key]:
+            continue
+        added, removed = await _retag_table(
+            db, table, owner_column, targets, add_ids, remove_ids, replace is not None
+        )
+        summary["added"] += added
+        summary["removed"] += removed
+    return summary
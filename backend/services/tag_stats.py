@@ -0,0 +1,199 @@
+"""
+Счетчики тегов и категорий (ведутся триггерами) и фасеты поиска
+"""
+import logging
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import CategoryCount, Tag, Video, video_tags
+
+logger = logging.getLogger(__name__)
+
+# Каждое прикрепление/открепление тега меняет счетчик на единицу, так что
+# популярные теги и фасеты без фильтров читаются за O(тегов), без GROUP BY по связям
+_TAG_COUNTER_TRIGGERS = {
+    "video_tags_count_ai": "AFTER INSERT ON video_tags BEGIN "
+        "UPDATE tags SET video_count = video_count + 1 WHERE id = new.tag_id; END",
+    "video_tags_count_ad": "AFTER DELETE ON video_tags BEGIN "
+        "UPDATE tags SET video_count = video_count - 1 WHERE id = old.tag_id; END",
+    "fragment_tags_count_ai": "AFTER INSERT ON fragment_tags BEGIN "
+        "UPDATE tags SET fragment_count = fragment_count + 1 WHERE id = new.tag_id; END",
+    "fragment_tags_count_ad": "AFTER DELETE ON fragment_tags BEGIN "
+        "UPDATE tags SET fragment_count = fragment_count - 1 WHERE id = old.tag_id; END",
+}
+
+_CATEGORY_ADD = (
+    "INSERT INTO category_counts (category, subcategory, video_count) "
+    "VALUES (coalesce(new.category, ''), coalesce(new.subcategory, ''), 1) "
+    "ON CONFLICT (category, subcategory) DO UPDATE SET video_count = video_count + 1;"
+)
+_CATEGORY_REMOVE = (
+    "UPDATE category_counts SET video_count = video_count - 1 "
+    "WHERE category = coalesce(old.category, '') AND subcategory = coalesce(old.subcategory, '');"
+)
+
+_CATEGORY_COUNTER_TRIGGERS = {
+    "videos_category_count_ai": f"AFTER INSERT ON videos BEGIN {_CATEGORY_ADD} END",
+    "videos_category_count_ad": f"AFTER DELETE ON videos BEGIN {_CATEGORY_REMOVE} END",
+    "videos_category_count_au": "AFTER UPDATE OF category, subcategory ON videos BEGIN "
+        f"{_CATEGORY_REMOVE} {_CATEGORY_ADD} END",
+}
+
+def _pg_tag_counter(column: str) -> str:
+    return (
+        "BEGIN "
+        f"IF TG_OP = 'INSERT' THEN UPDATE tags SET {column} = {column} + 1 WHERE id = NEW.tag_id; "
+        f"ELSE UPDATE tags SET {column} = {column} - 1 WHERE id = OLD.tag_id; "
+        "END IF; RETURN NULL; END"
+    )
+
+# PostgreSQL: триггер вызывает функцию plpgsql, имя функции совпадает с именем триггера
+_PG_COUNTER_TRIGGERS = {
+    "video_tags_count": (
+        "AFTER INSERT OR DELETE ON video_tags", _pg_tag_counter("video_count")
+    ),
+    "fragment_tags_count": (
+        "AFTER INSERT OR DELETE ON fragment_tags", _pg_tag_counter("fragment_count")
+    ),
+    "videos_category_count": (
+        "AFTER INSERT OR DELETE OR UPDATE OF category, subcategory ON videos",
+        "BEGIN "
+        "IF TG_OP IN ('DELETE', 'UPDATE') THEN "
+        "UPDATE category_counts SET video_count = video_count - 1 "
+        "WHERE category = coalesce(OLD.category, '') AND subcategory = coalesce(OLD.subcategory, ''); "
+        "END IF; "
+        "IF TG_OP IN ('INSERT', 'UPDATE') THEN "
+        "INSERT INTO category_counts (category, subcategory, video_count) "
+        "VALUES (coalesce(NEW.category, ''), coalesce(NEW.subcategory, ''), 1) "
+        "ON CONFLICT (category, subcategory) DO UPDATE SET video_count = category_counts.video_count + 1; "
+        "END IF; "
+        "RETURN NULL; END"
+    ),
+}
+
+_RECOUNT = [
+    "UPDATE tags SET "
+    "video_count = (SELECT count(*) FROM video_tags WHERE video_tags.tag_id = tags.id), "
+    "fragment_count = (SELECT count(*) FROM fragment_tags WHERE fragment_tags.tag_id = tags.id)",
+    "DELETE FROM category_counts",
+    "INSERT INTO category_counts (category, subcategory, video_count) "
+    "SELECT coalesce(category, ''), coalesce(subcategory, ''), count(*) FROM videos "
+    "GROUP BY coalesce(category, ''), coalesce(subcategory, '')",
+]
+
+
+def recount(connection):
+    """Пересчитывает все счетчики с нуля (O(связей), только при установке триггеров)"""
+    for statement in _RECOUNT:
+        connection.execute(text(statement))
+
+
+def _install_sqlite_triggers(connection) -> List[str]:
+    """Создает недостающие триггеры и возвращает их имена"""
+    triggers = {**_TAG_COUNTER_TRIGGERS, **_CATEGORY_COUNTER_TRIGGERS}
+    existing = {
+        row[0] for row in connection.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+        )
+    }
+    missing = [name for name in triggers if name not in existing]
+    for name in missing:
+        connection.execute(text(f"CREATE TRIGGER {name} {triggers[name]}"))
+    return missing
+
+
+def _install_pg_triggers(connection) -> List[str]:
+    existing = {
+        row[0] for row in connection.execute(
+            text("SELECT tgname FROM pg_trigger WHERE NOT tgisinternal")
+        )
+    }
+    missing = [name for name in _PG_COUNTER_TRIGGERS if name not in existing]
+    for name in missing:
+        event, body = _PG_COUNTER_TRIGGERS[name]
+        connection.execute(text(
+            f"CREATE OR REPLACE FUNCTION {name}() RETURNS trigger LANGUAGE plpgsql AS $$ {body} $$"
+        ))
+        connection.execute(text(f"CREATE TRIGGER {name} {event} FOR EACH ROW EXECUTE FUNCTION {name}()"))
+    return missing
+
+
+def ensure_counters(connection) -> bool:
+    """
+    Создает триггеры счетчиков, если их еще нет (миграция 0012).
+    При первой установке счетчики заполняются по существующим данным
+    """
+    if connection.dialect.name == "sqlite":
+        missing = _install_sqlite_triggers(connection)
+    elif connection.dialect.name == "postgresql":
+        missing = _install_pg_triggers(connection)
+    else:
+        logger.warning("Tag and category counters are maintained only on SQLite and PostgreSQL")
+        return False
+
+    if missing:
+        recount(connection)
+        logger.info(f"Installed counter triggers {', '.join(missing)} and recounted tags and categories")
+    return True
+
+
+async def search_facets(db: AsyncSession, matched=None, tag_limit: int = 50) -> Dict[str, Any]:
+    """
+    Число видео по тегам, категориям и подкатегориям.
+
+    matched - подзапрос id видео, подходящих под фильтр поиска. Без него счетчики
+    читаются из таблиц счетчиков; с ним считаются только по найденным видео
+    """
+    if matched is None:
+        total = await db.scalar(select(func.coalesce(func.sum(CategoryCount.video_count), 0)))
+        tag_rows = await db.execute(
+            select(Tag.id, Tag.name, Tag.video_count)
+            .where(Tag.video_count > 0)
+            .order_by(Tag.video_count.desc(), Tag.name)
+            .limit(tag_limit)
+        )
+        category_rows = await db.execute(
+            select(CategoryCount.category, CategoryCount.subcategory, CategoryCount.video_count)
+            .where(CategoryCount.video_count > 0)
+        )
+        categories = [
+            (category or None, subcategory or None, count)
+            for category, subcategory, count in category_rows.all()
+        ]
+    else:
+        total = await db.scalar(select(func.count()).select_from(matched))
+        video_count = func.count(video_tags.c.video_id)
+        tag_rows = await db.execute(
+            select(Tag.id, Tag.name, video_count)
+            .join(video_tags, video_tags.c.tag_id == Tag.id)
+            .where(video_tags.c.video_id.in_(select(matched.c.id)))
+            .group_by(Tag.id, Tag.name)
+            .order_by(video_count.desc(), Tag.name)
+            .limit(tag_limit)
+        )
+        category_rows = await db.execute(
+            select(Video.category, Video.subcategory, func.count(Video.id))
+            .where(Video.id.in_(select(matched.c.id)))
+            .group_by(Video.category, Video.subcategory)
+        )
+        categories = category_rows.all()
+
+    by_category: Dict[Optional[str], int] = {}
+    for category, _, count in categories:
+        by_category[category] = by_category.get(category, 0) + count
+
+    return {
+        "total": total,
+        "tags": [{"id": tag_id, "name": name, "count": count} for tag_id, name, count in tag_rows.all()],
+        "categories": [
+            {"value": category, "count": count}
+            for category, count in sorted(by_category.items(), key=lambda item: -item[1])
+        ],
+        "subcategories": [
+            {"category": category, "value": subcategory, "count": count}
+            for category, subcategory, count in sorted(categories, key=lambda item: -item[2])
+            if subcategory
+        ],
+    }
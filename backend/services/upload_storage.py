@@ -0,0 +1,240 @@
+"""
+Потоковое сохранение загружаемых файлов на диск
+"""
+import asyncio
+import hashlib
+from pathlib import Path
+from typing import AsyncIterator, BinaryIO, Collection, Iterable, List, Optional, Tuple
+
+from fastapi import UploadFile
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from config import settings
+
+
+class UploadTooLargeError(Exception):
+    """Файл превышает допустимый размер загрузки"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        super().__init__(f"File exceeds maximum upload size of {max_size} bytes")
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Ограничивает тело multipart-загрузок еще до разбора формы: Starlette
+    складывает файл во временный файл целиком, и save_upload_file увидел бы
+    превышение только после этого. Запас на границы и поля формы - form_overhead
+    """
+
+    def __init__(self, app: ASGIApp, paths: Collection[str], max_size: int, form_overhead: int = 1024 * 1024):
+        self.app = app
+        self.paths = set(paths)
+        self.max_size = max_size
+        self.max_body_size = max_size + form_overhead
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"].rstrip("/") not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_body_size:
+            await self._reject(scope, receive, send)
+            return
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive() -> Message:
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    exceeded = True
+                    raise UploadTooLargeError(self.max_size)
+            return message
+
+        async def guarded_send(message: Message) -> None:
+            nonlocal response_started
+            # FastAPI превращает ошибку разбора формы в 400: такой ответ заменяется на 413
+            if exceeded and not response_started:
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except UploadTooLargeError:
+            if response_started:
+                raise
+        if exceeded and not response_started:
+            await self._reject(scope, receive, send)
+
+    async def _reject(self, scope: Scope, receive: Receive, send: Send) -> None:
+        response = JSONResponse(
+            status_code=413,
+            content={"detail": str(UploadTooLargeError(self.max_size))},
+            # Остаток тела не дочитывается: соединение повторно не используется
+            headers={"Connection": "close"}
+        )
+        await response(scope, receive, send)
+
+
+def _copy_stream(
+    source: BinaryIO,
+    destination: Path,
+    max_size: int,
+    chunk_size: int
+) -> Tuple[int, str]:
+    """Копирует поток блоками фиксированного размера, считая размер и SHA-256"""
+    hasher = hashlib.sha256()
+    size = 0
+
+    with open(destination, "wb") as out:
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_size:
+                raise UploadTooLargeError(max_size)
+            hasher.update(chunk)
+            out.write(chunk)
+
+    return size, hasher.hexdigest()
+
+
+async def save_upload_file(
+    upload: UploadFile,
+    destination: Path,
+    max_size: Optional[int] = None,
+    chunk_size: Optional[int] = None
+) -> Tuple[int, str]:
+    """
+    Сохраняет UploadFile на диск блоками, не загружая файл целиком в память.
+
+    Возвращает (размер в байтах, sha256 hex). При превышении max_size
+    или любой другой ошибке частично записанный файл удаляется.
+    """
+    max_size = max_size if max_size is not None else settings.MAX_UPLOAD_SIZE
+    chunk_size = chunk_size or settings.UPLOAD_CHUNK_SIZE
+
+    # Быстрый отказ, если размер уже известен из multipart-парсера
+    if upload.size is not None and upload.size > max_size:
+        raise UploadTooLargeError(max_size)
+
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    await upload.seek(0)
+
+    try:
+        # Весь цикл чтение/хеш/запись выполняется в одном потоке,
+        # а не по два перехода в пул потоков на каждый блок
+        return await asyncio.to_thread(
+            _copy_stream, upload.file, destination, max_size, chunk_size
+        )
+    except BaseException:
+        destination.unlink(missing_ok=True)
+        raise
+
+
+# --- Возобновляемые загрузки ---
+
+class RangeLengthMismatchError(Exception):
+    """Тело запроса не совпадает с объявленным диапазоном байт"""
+
+
+def partial_upload_path(session_id: str) -> Path:
+    return Path(settings.UPLOAD_DIR) / "partial" / f"{session_id}.part"
+
+
+def allocate_partial_file(path: Path, total_size: int) -> None:
+    """Создает (разреженный) файл нужного размера для записи частей по смещениям"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as f:
+        f.truncate(total_size)
+
+
+def _write_block(path: Path, offset: int, data: bytes) -> None:
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        f.write(data)
+
+
+async def write_range(
+    path: Path,
+    offset: int,
+    length: int,
+    stream: AsyncIterator[bytes],
+    chunk_size: Optional[int] = None
+) -> int:
+    """
+    Пишет тело запроса в файл начиная с offset, буферизуя не более chunk_size байт.
+
+    Разные части одной сессии пишутся в непересекающиеся области файла,
+    поэтому параллельные PUT безопасны.
+    """
+    chunk_size = chunk_size or settings.UPLOAD_CHUNK_SIZE
+    buffer = bytearray()
+    written = 0
+
+    async for chunk in stream:
+        if written + len(buffer) + len(chunk) > length:
+            raise RangeLengthMismatchError(f"Body is longer than declared range of {length} bytes")
+        buffer.extend(chunk)
+        if len(buffer) >= chunk_size:
+            await asyncio.to_thread(_write_block, path, offset + written, bytes(buffer))
+            written += len(buffer)
+            buffer.clear()
+
+    if buffer:
+        await asyncio.to_thread(_write_block, path, offset + written, bytes(buffer))
+        written += len(buffer)
+
+    if written != length:
+        raise RangeLengthMismatchError(f"Expected {length} bytes, received {written}")
+
+    return written
+
+
+def merge_ranges(ranges: Iterable[Tuple[int, int]]) -> List[List[int]]:
+    """Объединяет пересекающиеся и смежные полуинтервалы [start, end)"""
+    merged: List[List[int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def missing_ranges(received: List[List[int]], total_size: int) -> List[List[int]]:
+    missing = []
+    position = 0
+    for start, end in received:
+        if start > position:
+            missing.append([position, start])
+        position = max(position, end)
+    if position < total_size:
+        missing.append([position, total_size])
+    return missing
+
+
+def _file_sha256(path: Path, chunk_size: int) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+async def file_sha256(path: Path, chunk_size: Optional[int] = None) -> str:
+    return await asyncio.to_thread(_file_sha256, path, chunk_size or settings.UPLOAD_CHUNK_SIZE)
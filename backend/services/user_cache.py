@@ -0,0 +1,45 @@
+"""
+Кэш пользователей в памяти процесса: id -> пользователь, с TTL и вытеснением давно не использованных (LRU)
+"""
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from config import settings
+from models import User
+
+
+class UserCache:
+    """
+    Хранятся объекты, отвязанные от сессии: их колонки уже загружены, но изменения
+    в них не сохраняются - пишущие обработчики перечитывают пользователя в своей сессии
+    и после commit вызывают invalidate
+    """
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._users: "OrderedDict[int, Tuple[float, User]]" = OrderedDict()
+
+    def get(self, user_id: int) -> Optional[User]:
+        entry = self._users.get(user_id)
+        if entry is None:
+            return None
+        loaded_at, user = entry
+        if time.monotonic() - loaded_at >= self.ttl:
+            del self._users[user_id]
+            return None
+        self._users.move_to_end(user_id)
+        return user
+
+    def put(self, user: User):
+        self._users[user.id] = (time.monotonic(), user)
+        self._users.move_to_end(user.id)
+        while len(self._users) > self.max_size:
+            self._users.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        self._users.pop(user_id, None)
+
+
+user_cache = UserCache(ttl=settings.USER_CACHE_TTL_SECONDS, max_size=settings.USER_CACHE_SIZE)
@@ -1,9 +1,21 @@
 import { useState, FormEvent } from 'react';
 import { Link } from 'react-router-dom';
-import { VideoWithTags } from '../types';
+import { SearchFacets, VideoSearchResult } from '../types';
 import { videoApi } from '../services/api';
 import { Search as SearchIcon, Calendar, Tag as TagIcon, Filter, X } from 'lucide-react';
 
+// Snippet comes with <mark> around the match; render it as text, never as HTML
+function Snippet({ text }: { text: string }) {
+  const parts = text.split(/<mark>|<\/mark>/);
+  return (
+    <p className="text-sm text-gray-500 mb-2 line-clamp-2">
+      {parts.map((part, index) =>
+        index % 2 === 1 ? <mark key={index}>{part}</mark> : <span key={index}>{part}</span>
+      )}
+    </p>
+  );
+}
+
 export function Search() {
   const [query, setQuery] = useState('');
   const [category, setCategory] = useState('');
@@ -11,7 +23,8 @@ export function Search() {
   const [tags, setTags] = useState('');
   const [dateFrom, setDateFrom] = useState('');
   const [dateTo, setDateTo] = useState('');
-  const [results, setResults] = useState<VideoWithTags[]>([]);
+  const [results, setResults] = useState<VideoSearchResult[]>([]);
+  const [facets, setFacets] = useState<SearchFacets | null>(null);
   const [searched, setSearched] = useState(false);
   const [loading, setLoading] = useState(false);
 
@@ -29,8 +42,12 @@ export function Search() {
       if (dateFrom) searchParams.date_from = dateFrom;
       if (dateTo) searchParams.date_to = dateTo;
 
-      const data = await videoApi.search(searchParams);
+      const [data, facetData] = await Promise.all([
+        videoApi.search(searchParams),
+        videoApi.facets(searchParams),
+      ]);
       setResults(data);
+      setFacets(facetData);
     } catch (error) {
       console.error('Error searching:', error);
       alert('Ошибка при поиске');
@@ -47,9 +64,15 @@ export function Search() {
     setDateFrom('');
     setDateTo('');
     setResults([]);
+    setFacets(null);
     setSearched(false);
   };
 
+  const addTagFilter = (name: string) => {
+    const current = tags.split(',').map((t) => t.trim().toLowerCase()).filter(Boolean);
+    if (!current.includes(name)) setTags([...current, name].join(', '));
+  };
+
   const formatDate = (dateString: string) => {
     return new Date(dateString).toLocaleDateString('ru-RU', {
       year: 'numeric',
@@ -177,8 +200,42 @@ export function Search() {
       {searched && (
         <div>
           <h2 className="text-xl font-semibold mb-4">
-            Результаты поиска ({results.length})
+            Результаты поиска ({facets ? facets.total : results.length})
           </h2>
+          {facets && (facets.tags.length > 0 || facets.categories.length > 0) && (
+            <div className="bg-white rounded-lg shadow-md p-4 mb-4 space-y-2 text-sm">
+              {facets.categories.length > 0 && (
+                <div className="flex flex-wrap gap-2">
+                  <span className="text-gray-500">Категории:</span>
+                  {facets.categories.map((facet) => (
+                    <button
+                      key={facet.value ?? ''}
+                      type="button"
+                      onClick={() => setCategory(facet.value ?? '')}
+                      className="text-gray-700 hover:text-primary-700"
+                    >
+                      {facet.value ?? 'без категории'} ({facet.count})
+                    </button>
+                  ))}
+                </div>
+              )}
+              {facets.tags.length > 0 && (
+                <div className="flex flex-wrap gap-1">
+                  {facets.tags.map((facet) => (
+                    <button
+                      key={facet.id}
+                      type="button"
+                      onClick={() => addTagFilter(facet.name)}
+                      className="inline-flex items-center bg-primary-100 text-primary-700 px-2 py-0.5 rounded-full text-xs hover:bg-primary-200"
+                    >
+                      <TagIcon className="h-3 w-3 mr-1" />
+                      {facet.name} ({facet.count})
+                    </button>
+                  ))}
+                </div>
+              )}
+            </div>
+          )}
           {results.length === 0 ? (
             <div className="text-center py-12 bg-white rounded-lg shadow-md">
               <p className="text-gray-500 text-lg">Видео не найдены</p>
@@ -206,11 +263,13 @@ export function Search() {
                     <h3 className="font-semibold mb-2 truncate" title={video.title || video.original_filename}>
                       {video.title || video.original_filename}
                     </h3>
+                    {video.snippet && <Snippet text={video.snippet} />}
                     <div className="text-sm text-gray-600 space-y-1">
                       <div className="flex items-center">
                         <Calendar className="h-4 w-4 mr-2" />
                         <span>{formatDate(video.created_at)}</span>
                       </div>
+                      {video.fragment_count > 0 && <div>Фрагментов: {video.fragment_count}</div>}
                       {video.category && (
                         <div>
                           Категория: {video.category}
@@ -1,15 +1,18 @@
 import { useEffect, useState, useRef, ChangeEvent } from 'react';
 import { useParams, Link } from 'react-router-dom';
 import ReactPlayer from 'react-player';
-import { VideoWithTags, FragmentWithTags, Tag } from '../types';
-import { videoApi, fragmentApi, tagApi } from '../services/api';
+import { VideoWithTags, FragmentWithTags, TagSuggestion } from '../types';
+import { videoApi, fragmentApi, tagApi, mediaApi } from '../services/api';
 import { Plus, Trash2, X, Tag as TagIcon } from 'lucide-react';
 
 export function VideoEditor() {
   const { id } = useParams<{ id: string }>();
   const [video, setVideo] = useState<VideoWithTags | null>(null);
   const [fragments, setFragments] = useState<FragmentWithTags[]>([]);
-  const [allTags, setAllTags] = useState<Tag[]>([]);
+  // Every tag seen in suggestions, so that selected tags can be rendered by id
+  const [allTags, setAllTags] = useState<TagSuggestion[]>([]);
+  const [tagQuery, setTagQuery] = useState('');
+  const [tagSuggestions, setTagSuggestions] = useState<TagSuggestion[]>([]);
   const [loading, setLoading] = useState(true);
   
   const playerRef = useRef<ReactPlayer>(null);
@@ -47,17 +50,37 @@ export function VideoEditor() {
     loadData();
   }, [id]);
 
+  useEffect(() => {
+    let cancelled = false;
+    tagApi
+      .autocomplete(tagQuery.trim(), 10)
+      .then((suggestions) => {
+        if (cancelled) return;
+        setTagSuggestions(suggestions);
+        rememberTags(suggestions);
+      })
+      .catch((error) => console.error('Error loading tag suggestions:', error));
+    return () => {
+      cancelled = true;
+    };
+  }, [tagQuery]);
+
+  const rememberTags = (tags: TagSuggestion[]) => {
+    setAllTags((known) => [
+      ...known,
+      ...tags.filter((tag) => !known.some((knownTag) => knownTag.id === tag.id)),
+    ]);
+  };
+
   const loadData = async () => {
     if (!id) return;
     try {
-      const [videoData, fragmentsData, tagsData] = await Promise.all([
+      const [videoData, fragmentsData] = await Promise.all([
         videoApi.getById(parseInt(id)),
         fragmentApi.getAll(parseInt(id)),
-        tagApi.getAll({ limit: 100 }),
       ]);
       setVideo(videoData);
       setFragments(fragmentsData);
-      setAllTags(tagsData);
     } catch (error) {
       console.error('Error loading data:', error);
     } finally {
@@ -137,6 +160,7 @@ export function VideoEditor() {
         tag_ids: [...newFragment.tag_ids, tagId],
       });
     }
+    setTagQuery('');
   };
 
   const handleRemoveTag = (tagId: number) => {
@@ -161,7 +185,7 @@ export function VideoEditor() {
   }
 
   const selectedTags = allTags.filter((tag) => newFragment.tag_ids.includes(tag.id));
-  const availableTags = allTags.filter((tag) => !newFragment.tag_ids.includes(tag.id));
+  const availableTags = tagSuggestions.filter((tag) => !newFragment.tag_ids.includes(tag.id));
 
   return (
     <div className="space-y-6">
@@ -194,7 +218,7 @@ export function VideoEditor() {
             <div>
               <div className="bg-black rounded-lg overflow-hidden aspect-video">
                 <ReactPlayer
-                  url={encodeURI(`/static/uploads/${selectedFragment.video_filepath}`)}
+                  url={mediaApi.fragmentPlaybackUrl(selectedFragment)}
                   width="100%"
                   height="100%"
                   controls
@@ -215,7 +239,7 @@ export function VideoEditor() {
             <div className="bg-black rounded-lg overflow-hidden aspect-video">
               <ReactPlayer
                 ref={playerRef}
-                url={encodeURI(`/static/uploads/${video.filename.replace('.avi', '.mp4')}`)}
+                url={mediaApi.videoUrl(video.id)}
                 width="100%"
                 height="100%"
                 controls
@@ -314,19 +338,28 @@ export function VideoEditor() {
                       </span>
                     ))}
                   </div>
+                  <input
+                    type="text"
+                    value={tagQuery}
+                    onChange={(e) => setTagQuery(e.target.value)}
+                    placeholder="Добавить хештег..."
+                    className="w-full px-3 py-2 border border-gray-300 rounded-md focus:outline-none focus:ring-2 focus:ring-primary-500"
+                  />
                   {availableTags.length > 0 && (
-                    <select
-                      value=""
-                      onChange={(e) => e.target.value && handleAddTag(parseInt(e.target.value))}
-                      className="w-full px-3 py-2 border border-gray-300 rounded-md focus:outline-none focus:ring-2 focus:ring-primary-500"
-                    >
-                      <option value="">Добавить хештег...</option>
+                    <div className="flex flex-wrap gap-2">
                       {availableTags.map((tag) => (
-                        <option key={tag.id} value={tag.id}>
+                        <button
+                          key={tag.id}
+                          type="button"
+                          onClick={() => handleAddTag(tag.id)}
+                          className="inline-flex items-center bg-gray-100 text-gray-700 px-3 py-1 rounded-full text-sm hover:bg-gray-200"
+                        >
+                          <TagIcon className="h-3 w-3 mr-1" />
                           {tag.name}
-                        </option>
+                          <span className="ml-1 text-gray-400">{tag.count}</span>
+                        </button>
                       ))}
-                    </select>
+                    </div>
                   )}
                 </div>
               </div>
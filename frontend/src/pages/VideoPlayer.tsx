@@ -2,7 +2,7 @@ import { useEffect, useState, useRef } from 'react';
 import { useParams, Link } from 'react-router-dom';
 import ReactPlayer from 'react-player';
 import { VideoWithTags, FragmentWithTags } from '../types';
-import { videoApi, fragmentApi } from '../services/api';
+import { videoApi, fragmentApi, mediaApi } from '../services/api';
 import { Edit, Tag as TagIcon } from 'lucide-react';
 
 export function VideoPlayer() {
@@ -70,7 +70,7 @@ export function VideoPlayer() {
         <div className="bg-black rounded-lg overflow-hidden aspect-video">
           <ReactPlayer
             ref={playerRef}
-            url={encodeURI(`/static/uploads/${video.filename.replace('.avi', '.mp4')}`)}
+            url={mediaApi.playbackUrl(video)}
             width="100%"
             height="100%"
             controls
@@ -168,7 +168,7 @@ export function VideoPlayer() {
                     className="mt-2 text-sm text-primary-600 hover:text-primary-800"
                     onClick={(e) => {
                       e.stopPropagation();
-                      window.open(`/static/${fragment.video_filepath}`, '_blank');
+                      window.open(mediaApi.fragmentUrl(fragment.id), '_blank');
                     }}
                   >
                     Воспроизвести фрагмент
@@ -1,15 +1,27 @@
 import axios from 'axios';
 import type {
   Video,
+  VideoUploadResult,
   VideoWithTags,
   Fragment,
+  FragmentCreateResult,
+  FragmentBatchResult,
+  FragmentSearchResult,
+  VideoSearchResult,
+  ReelCreate,
+  ReelResult,
   FragmentWithTags,
   Tag,
   TagWithCount,
+  TagSuggestion,
+  BulkTagUpdate,
+  BulkTagResult,
   VideoCreate,
   FragmentCreate,
   FragmentUpdate,
   SearchQuery,
+  SearchFacets,
+  Job,
 } from '../types';
 
 const API_BASE_URL = '/api';
@@ -21,9 +33,22 @@ export const api = axios.create({
   },
 });
 
+// Lists are paginated by cursor: the next page token comes in this header
+export const NEXT_CURSOR_HEADER = 'x-next-cursor';
+
+export interface Page<T> {
+  items: T[];
+  nextCursor: string | null;
+}
+
+const getPage = async <T>(url: string, params?: Record<string, unknown>): Promise<Page<T>> => {
+  const response = await api.get<T[]>(url, { params });
+  return { items: response.data, nextCursor: response.headers[NEXT_CURSOR_HEADER] ?? null };
+};
+
 export const videoApi = {
   upload: async (formData: FormData) => {
-    const response = await api.post<Video>('/videos/upload', formData, {
+    const response = await api.post<VideoUploadResult>('/videos/upload', formData, {
       headers: {
         'Content-Type': 'multipart/form-data',
       },
@@ -32,7 +57,6 @@ export const videoApi = {
   },
 
   getAll: async (params?: {
-    skip?: number;
     limit?: number;
     category?: string;
     subcategory?: string;
@@ -41,6 +65,13 @@ export const videoApi = {
     return response.data;
   },
 
+  getPage: (params?: {
+    cursor?: string;
+    limit?: number;
+    category?: string;
+    subcategory?: string;
+  }) => getPage<Video>('/videos/', params),
+
   getById: async (id: number) => {
     const response = await api.get<VideoWithTags>(`/videos/${id}`);
     return response.data;
@@ -64,26 +95,44 @@ export const videoApi = {
   },
 
   search: async (query: SearchQuery) => {
-    const response = await api.post<VideoWithTags[]>('/videos/search', query);
+    const response = await api.post<VideoSearchResult[]>('/videos/search', query);
+    return response.data;
+  },
+
+  facets: async (query: SearchQuery) => {
+    const response = await api.post<SearchFacets>('/videos/facets', query);
     return response.data;
   },
 };
 
 export const fragmentApi = {
   create: async (videoId: number, data: FragmentCreate) => {
-    const response = await api.post<FragmentWithTags>(`/videos/${videoId}/fragments/`, data);
+    const response = await api.post<FragmentCreateResult>(`/videos/${videoId}/fragments/`, data);
     return response.data;
   },
 
-  getAll: async (videoId: number, query?: string) => {
-    const response = await api.get<FragmentWithTags[]>(`/videos/${videoId}/fragments/`, {
-      params: query ? { query } : undefined
-    });
+  createBatch: async (videoId: number, fragments: FragmentCreate[]) => {
+    const response = await api.post<FragmentBatchResult>(`/videos/${videoId}/fragments/batch`, { fragments });
     return response.data;
   },
 
+  // The editor needs every fragment of the video, so all pages are fetched
+  getAll: async (videoId: number, query?: string) => {
+    const fragments: FragmentWithTags[] = [];
+    let cursor: string | null = null;
+    do {
+      const page: Page<FragmentWithTags> = await getPage<FragmentWithTags>(
+        `/videos/${videoId}/fragments/`,
+        { query, cursor: cursor ?? undefined, limit: 500 }
+      );
+      fragments.push(...page.items);
+      cursor = page.nextCursor;
+    } while (cursor);
+    return fragments;
+  },
+
   search: async (query: string) => {
-    const response = await api.get<FragmentWithTags[]>(`/fragments/search`, {
+    const response = await api.get<FragmentSearchResult[]>(`/fragments/search`, {
       params: { query }
     });
     return response.data;
@@ -112,7 +161,7 @@ export const tagApi = {
   },
 
   getAll: async (params?: {
-    skip?: number;
+    cursor?: string;
     limit?: number;
     search?: string;
   }) => {
@@ -120,6 +169,16 @@ export const tagApi = {
     return response.data;
   },
 
+  autocomplete: async (prefix: string, limit: number = 10) => {
+    const response = await api.get<TagSuggestion[]>('/tags/autocomplete', { params: { prefix, limit } });
+    return response.data;
+  },
+
+  bulkUpdate: async (update: BulkTagUpdate) => {
+    const response = await api.post<BulkTagResult>('/tags/bulk', update);
+    return response.data;
+  },
+
   getPopular: async (limit: number = 20) => {
     const response = await api.get<TagWithCount[]>('/tags/popular', { params: { limit } });
     return response.data;
@@ -135,3 +194,49 @@ export const tagApi = {
     return response.data;
   },
 };
+
+export const jobApi = {
+  getById: async (id: number) => {
+    const response = await api.get<Job>(`/jobs/${id}`);
+    return response.data;
+  },
+
+  // Server-Sent Events stream; closes itself once the job has finished
+  subscribe: (id: number, onUpdate: (job: Job) => void) => {
+    const source = new EventSource(`${API_BASE_URL}/jobs/${id}/events`);
+    source.onmessage = (event) => {
+      const job: Job = JSON.parse(event.data);
+      onUpdate(job);
+      if (job.status === 'completed' || job.status === 'failed') {
+        source.close();
+      }
+    };
+    return () => source.close();
+  },
+};
+
+export const reelApi = {
+  // Cached by fragment list: a repeated request returns status 'ready' at once
+  create: async (data: ReelCreate) => {
+    const response = await api.post<ReelResult>('/reels/', data);
+    return response.data;
+  },
+};
+
+// Range-capable media URLs, served by /api/media (nginx sendfile behind X-Accel-Redirect)
+export const mediaApi = {
+  videoUrl: (videoId: number) => `${API_BASE_URL}/media/videos/${videoId}`,
+  fragmentUrl: (fragmentId: number) => `${API_BASE_URL}/media/fragments/${fragmentId}`,
+  videoHlsUrl: (videoId: number) => `${API_BASE_URL}/media/videos/${videoId}/hls/master.m3u8`,
+  reelUrl: (key: string) => `${API_BASE_URL}/media/reels/${key}`,
+  fragmentHlsUrl: (fragmentId: number) => `${API_BASE_URL}/media/fragments/${fragmentId}/hls/master.m3u8`,
+  // Adaptive stream when the video has been packaged, progressive MP4 otherwise
+  playbackUrl: (video: Video) =>
+    video.hls_status === 'ready' ? mediaApi.videoHlsUrl(video.id) : mediaApi.videoUrl(video.id),
+  // Virtual fragments play straight from the source via a media-fragment URL;
+  // fragmentUrl still works for them but cuts a file into the server cache
+  fragmentPlaybackUrl: (fragment: Fragment) =>
+    fragment.is_virtual
+      ? `${mediaApi.videoUrl(fragment.video_id)}#t=${fragment.start_time},${fragment.end_time}`
+      : mediaApi.fragmentUrl(fragment.id),
+};
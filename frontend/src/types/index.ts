@@ -7,17 +7,41 @@ export interface Video {
   filepath?: string;
   file_size: number;
   mime_type: string;
+  hls_status?: 'processing' | 'ready' | 'failed';
   category?: string;
   subcategory?: string;
   created_at: string;
   updated_at: string;
 }
 
+export interface VideoUploadResult extends Video {
+  job_id?: number;  // Background processing job (probe, thumbnail, conversion)
+}
+
 export interface VideoWithTags extends Video {
   tags: Tag[];
   fragments: FragmentWithTags[];
 }
 
+// Slim card used in result grids and as the video of a fragment search hit
+export interface VideoSummary {
+  id: number;
+  title?: string;
+  original_filename: string;
+  duration?: number;
+  category?: string;
+  subcategory?: string;
+  hls_status?: 'processing' | 'ready' | 'failed';
+  created_at: string;
+}
+
+export interface VideoSearchResult extends VideoSummary {
+  tags: Tag[];
+  fragment_count: number;
+  fragments: Fragment[];  // Filled only with ?expand=fragments
+  snippet?: string | null;  // Full-text match wrapped in <mark>...</mark>
+}
+
 export interface Fragment {
   id: number;
   video_id: number;
@@ -29,6 +53,7 @@ export interface Fragment {
   file_size?: number;
   video_filepath?: string;  // Path to fragment video file
   video_file_size?: number;
+  is_virtual?: boolean;  // No file of its own, played from the source video
   created_at: string;
   tags?: Tag[];  // Optional tags for flexibility
   video?: Video; // Optional video reference
@@ -39,14 +64,75 @@ export interface FragmentWithTags extends Fragment {
   video: Video;
 }
 
+export interface FragmentSearchResult extends Fragment {
+  tags: Tag[];
+  video: VideoSummary;
+  snippet?: string | null;
+}
+
+export interface FragmentCreateResult extends FragmentWithTags {
+  job_id?: number;  // Background extraction job
+}
+
+export interface ReelCreate {
+  fragment_ids?: number[];  // Explicit order
+  tags?: string[];  // Or every fragment with any of these tags
+}
+
+export interface ReelResult {
+  key: string;
+  status: 'ready' | 'processing';
+  fragment_ids: number[];
+  job_id?: number;
+}
+
+export interface FragmentBatchResult {
+  fragments: Fragment[];
+  job_id?: number;  // One extraction job for all non-virtual fragments
+}
+
 export interface Tag {
   id: number;
   name: string;
   created_at: string;
 }
 
+// Bulk add/remove/replace of tags; videos by id and/or search filter, fragments by id
+export interface BulkTagUpdate {
+  video_ids?: number[];
+  fragment_ids?: number[];
+  search?: Omit<SearchQuery, 'cursor' | 'limit'>;
+  add?: string[];
+  remove?: string[];
+  replace?: string[];  // Not combined with add/remove
+}
+
+export interface BulkTagResult {
+  videos: number;
+  fragments: number;
+  added: number;
+  removed: number;
+}
+
+// Autocomplete suggestion; count = videos + fragments with the tag
+export interface TagSuggestion {
+  id: number;
+  name: string;
+  count: number;
+}
+
 export interface TagWithCount extends Tag {
   count: number;
+  video_count: number;
+  fragment_count: number;
+}
+
+// Video counts for the current search filter
+export interface SearchFacets {
+  total: number;
+  tags: { id: number; name: string; count: number }[];
+  categories: { value: string | null; count: number }[];
+  subcategories: { category: string | null; value: string; count: number }[];
 }
 
 export interface VideoCreate {
@@ -61,6 +147,7 @@ export interface FragmentCreate {
   start_time: number;
   end_time: number;
   tag_ids?: number[];
+  virtual?: boolean;  // Defaults to the server's FRAGMENTS_VIRTUAL setting
 }
 
 export interface FragmentUpdate {
@@ -78,9 +165,36 @@ export interface SearchQuery {
   tags?: string[];
   date_from?: string;
   date_to?: string;
+  cursor?: string;  // From the X-Next-Cursor header of the previous page
+  limit?: number;
 }
 
 export interface UploadProgress {
   loaded: number;
   total: number;
 }
+
+export interface JobProgress {
+  percent?: number;
+  out_time?: number;
+  duration?: number;
+  fps?: number;
+  speed?: number;
+  eta_seconds?: number;
+  elapsed_seconds: number;
+  done: boolean;
+}
+
+export interface Job {
+  id: number;
+  kind: string;
+  status: 'pending' | 'running' | 'completed' | 'failed';
+  attempts: number;
+  max_attempts: number;
+  result?: Record<string, unknown>;
+  error?: string;
+  progress?: JobProgress;
+  created_at: string;
+  started_at?: string;
+  finished_at?: string;
+}